@@ -11,7 +11,21 @@
 # --- IMPORT PACKAGES ----------------------------------------------------------
 
 from Bio import SeqIO
+from functools import partial
 from shutil import which
+from Scripts.anno_fasta import anno_fasta
+from Scripts.annotation_emitter import emit_annotations
+from Scripts.augustus_chunks import merge_chunks, plan_chunks, run_chunks
+from Scripts.duplicates import collapse_duplicates, load_members
+from Scripts.fasta_utils import build_faidx, fetch_records, iter_fasta
+from Scripts.hmmer_runner import run_hmmer
+from Scripts.interpro_cache import InterproCache, from_template, to_template
+from Scripts.interpro_index import build_index
+from Scripts.interpro_utils import is_tsv, read_output, run_interpro_chunks, split_output
+from Scripts.run_manifest import RunManifest, tool_version
+from Scripts.shard_runner import run_sharded, threads_per_shard
+from Scripts.sort_utils import sort_file, version_key
+from Scripts.stage_graph import Stage, run_stage, run_stages
 import pandas as pd
 import argparse
 import logging
@@ -170,22 +184,25 @@ def log_quit():
     logging.shutdown()
     sys.exit(1)
 
-# Function to check if output file already exists and skip
-def check_point(logger, file):
-    path = pathlib.Path(file)
-    logger.info("Checking output file")
-    if path.is_file():
-        logger.info(f"Output file {file} already exists. Skipping")
-        return True
-    else:
-        return False
-
 # check if softwares are in $PATH
 def is_tool(name):
     if which(name) is None:
         logging.error(f"Program: {str(name)} must be avaliable in $PATH")
         log_quit()
 
+# Run a command (shell line or argument list) and quit if it fails
+#   stages call it, so a tool that exits with error (leaving partial outputs) never completes in manifest
+def run_checked(command, name, logger=None):
+    if logger is None:
+        logger = logging.getLogger('AnnotaPipeline')
+    result = subprocess.run(command, shell=isinstance(command, str), stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, universal_newlines=True)
+    if result.returncode != 0:
+        logger.debug(result.stdout)
+        logger.error(f"{name} exited with code {result.returncode}")
+        log_quit()
+    return result.stdout
+
 # Function to check if file was generated. It helps if AnnotaPipeline crash
 def check_file(file):
     logger = logging.getLogger('AnnotaPipeline')
@@ -212,17 +229,19 @@ def sequence_cleaner(fasta_file, min_length=0):
     output_file.close()
 
 # Function to catch specific sequences from fasta file
+#   records are read through the .fai index of input_fasta, created once and reused
 def fasta_fetcher(input_fasta, id_list, fetcher_output):
-    wanted = sorted(set(id_list))
-    #records = (r for r in SeqIO.parse(input_fasta, "fasta") if r.id in wanted)
-    records = (seq for seq in SeqIO.parse(input_fasta, "fasta") for r in wanted if r in seq.id)
-    count = SeqIO.write(records, fetcher_output, "fasta")
+    wanted = set(id_list)
+    count = fetch_records(input_fasta, wanted, fetcher_output)
     if count < len(wanted):
         logger.info("IDs not found in input FASTA file")
 
 # ------------------------------------- RUNs -------------------------------------------------
 # Create command line to run augustus (protein prediction)
-def augustus_run(augustus_section, augustus_optional,  basename, seq_file):
+#   chunk_size > 0 splits genome in chunks predicted at the same time (up to threads)
+#   parser is python (anno_fasta.py) or getAnnoFasta (getAnnoFasta.pl of AUGUSTUS)
+def augustus_run(augustus_section, augustus_optional,  basename, seq_file, threads=1, chunk_size=0, overlap=0,
+                 parser="python"):
     # create AUGUSTUS directory
     logger = logging.getLogger('AUGUSTUS')
     if str(augustus_section.get('augustus-path')).lower() == 'conda':
@@ -261,11 +280,27 @@ def augustus_run(augustus_section, augustus_optional,  basename, seq_file):
                 aug_command += f" --{str(param)}={str(augustus_optional.get(param))}"
 
 
-    aug_command += f" {str(seq_file)} > AUGUSTUS_{str(basename)}.gff"
+    if int(chunk_size) > 0:
+        chunk_dir = pathlib.Path(f"AUGUSTUS_{str(basename)}_chunks")
+        try:
+            chunks, contigs = plan_chunks(seq_file, chunk_dir, chunk_size, overlap)
+        except ValueError as error:
+            logger.error(f"{str(error)}, check augustus-chunk-size and augustus-overlap in config file")
+            log_quit()
+        try:
+            run_chunks(chunks, aug_command, threads, logger)
+        except RuntimeError as error:
+            logger.error(f"{str(error)}, check {chunk_dir}")
+            log_quit()
+        genes = merge_chunks(chunks, contigs, f"AUGUSTUS_{str(basename)}.gff")
+        logger.info(f"AUGUSTUS chunks merged, {genes} genes predicted")
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+    else:
+        aug_command += f" {str(seq_file)} > AUGUSTUS_{str(basename)}.gff"
 
-    logger.debug(str(aug_command))
+        logger.debug(str(aug_command))
 
-    subprocess.getoutput(aug_command)
+        run_checked(aug_command, "AUGUSTUS", logger)
 
     # Check if expected file exists
     check_file(f"AUGUSTUS_{str(basename)}.gff")
@@ -277,56 +312,54 @@ def augustus_run(augustus_section, augustus_optional,  basename, seq_file):
 
     aug_file = f"AUGUSTUS_{str(basename)}"
 
-    if check_point(logger=logger, file="AUGUSTUS_{str(basename)}.gff"):
-        pass
+    if str(parser).lower() == "getannofasta":
+        run_checked([str(augustus_script), f"{aug_file}.gff", f"--seqfile={str(seq_file)}"], "getAnnoFasta.pl", logger)
     else:
-        subprocess.run([
-            str(augustus_script),
-            str(aug_file + ".gff"),
-            str("--seqfile=" + str(seq_file))
-            ]
-        )
+        # Same files as getAnnoFasta.pl (.aa, .codingseq, .cdsexons), genome is read through an index
+        transcripts = anno_fasta(f"{aug_file}.gff", seq_file, aug_file)
+        logger.info(f"{transcripts} transcripts extracted")
 
     logger.info("AUGUSTUS parsing is finished")
 
-    # Declare as global, so you can modify out of fuction
-    global aug_parsing
-    aug_parsing = aug_file + ".aa"
-
-# Create command line to run interproscan (functional prediction)
-def interpro_run(type, basename, blast_path, augustus_path, augustus_file, interpro_section):
+# Function to catch hypothetical/annotated proteins used by INTERPROSCAN, HMMSCAN and RPSBLAST
+#   BLAST lists have members of identical sequences, only their representatives are in Unique_Clear fasta
+def products_fetch(type, basename, blast_path, augustus_path, augustus_file):
     logger = logging.getLogger('INTERPROSCAN')
     logger.info(f"Preparing file for INTERPROSCAN {type.capitalize()} Proteins execution")
-    
+
+    duplicates_map = augustus_path / str(f"Duplicated_Clear_{augustus_file}.tsv")
+    members = {member for group in load_members(duplicates_map if duplicates_map.is_file() else None).values()
+               for member in group}
+
     if type == "hypothetical":
         hypothetical_id = str(blast_path / str(f"{basename}_{type}_products.txt"))
         no_hit_id = str(blast_path / str(f"{basename}_no_hit_products.txt"))
         hypothetical_id_strip = [line.strip() for line in open(hypothetical_id, "r")]
         no_hit_id_strip = [line.strip() for line in open(no_hit_id, "r")]
-        concatenate_list = [*hypothetical_id_strip, *no_hit_id_strip]
+        concatenate_list = [seq_id for seq_id in [*hypothetical_id_strip, *no_hit_id_strip] if seq_id not in members]
 
-        fasta_fetcher(str(augustus_path / str(f"Clear_{augustus_file}")),
+        fasta_fetcher(str(augustus_path / str(f"Unique_Clear_{augustus_file}")),
                 concatenate_list, f"{type.capitalize()}_Products.fasta")
     else:
         annotated_file = str(blast_path / str(f"{basename}_{type}_products.txt"))
         annotated_id = [line.strip().split()[0] for line in open(annotated_file, "r")]
-        fasta_fetcher(str(augustus_path / str(f"Clear_{augustus_file}")), 
+        annotated_id = [seq_id for seq_id in annotated_id if seq_id not in members]
+        fasta_fetcher(str(augustus_path / str(f"Unique_Clear_{augustus_file}")), 
                     annotated_id, f"{type.capitalize()}_Products.fasta")
 
-
     # Check if expected file exists
     check_file(f"{type.capitalize()}_Products.fasta")
 
     logger.info(f"{type.capitalize()} Proteins file preparation complete")
 
-    logger.info(f"Running with {type.capitalize()} Proteins")
-    # INTERPROSCAN: commandline
-
+# Create command line to run interproscan (functional prediction)
+#   output format follows output name: .tsv is TSV, anything else is GFF3
+def interpro_command(fasta, output, interpro_section):
     # General
     interpro_command_line = (
-        f"interproscan.sh -i {type.capitalize()}_Products.fasta "
-        f"-o {basename}_interproscan_{type}_output.gff3 "
-        f"-f GFF3 -t p -goterms -iprlookup"
+        f"interproscan.sh -i {fasta} "
+        f"-o {output} "
+        f"-f {'TSV' if is_tsv(output) else 'GFF3'} -t p -goterms -iprlookup"
     )
 
     # Optionals
@@ -337,29 +370,260 @@ def interpro_run(type, basename, blast_path, augustus_path, augustus_file, inter
             if interpro_section.get(variable) is not None:
                 interpro_command_line += f" -{str(variable)} {str(interpro_section.get(variable))}"
 
-    logger.debug(str(interpro_command_line))
+    return interpro_command_line
 
-    if check_point(logger=logger, file=f"{type.capitalize()}_Products.fasta"):
-        pass
+# Run interproscan for one fasta, output is always a valid file
+#   returns False when INTERPROSCAN failed (empty output is written), so the stage runs again next time
+#   chunk_size > 0 splits fasta in chunks of this many proteins, up to parallel
+#   interproscan instances run at once, each with its temp dir and threads/parallel CPUs
+#   cache is the path of a local match store (interpro_cache.py), only unseen sequences are searched
+def interpro_search(fasta, output, interpro_section, chunk_size=0, parallel=1, threads=1, cache=None):
+    logger = logging.getLogger('INTERPROSCAN')
+    if cache is not None:
+        version = tool_version("interproscan.sh -version")
+        if version != "unknown":
+            return cached_interpro(cache, version, fasta, output, interpro_section, chunk_size, parallel, threads)
+        logger.warning("INTERPROSCAN version is unknown, running without cache")
+    if int(chunk_size) > 0:
+        def chunk_command(chunk, chunk_output, temp_dir):
+            chunk_command_line = interpro_command(chunk, chunk_output, interpro_section) + f" -T {temp_dir}"
+            # CPUs given in config are used by each instance
+            if interpro_section.get("cpu") is None:
+                chunk_command_line += f" -cpu {threads_per_shard(threads, parallel)}"
+            return chunk_command_line
+        try:
+            run_interpro_chunks(fasta, output, chunk_size, parallel, chunk_command, logger)
+            succeeded = True
+        except RuntimeError as error:
+            # Finished chunks are kept, next run only processes the failed ones
+            logger.warning(str(error))
+            succeeded = False
     else:
-        subprocess.getoutput(interpro_command_line)
+        interpro_command_line = interpro_command(fasta, output, interpro_section)
+
+        logger.debug(str(interpro_command_line))
+
+        result = subprocess.run(interpro_command_line, shell=True, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, universal_newlines=True)
+        succeeded = result.returncode == 0
+        if not succeeded:
+            logger.debug(result.stdout)
+            logger.warning(f"INTERPROSCAN exited with code {result.returncode}")
 
     # INTERPROSCAN parser (info_parser.py) can run without this result, but must be a valid file.
-    if os.path.isfile(f"{basename}_interproscan_{type}_output.gff3") == 0:
+    #   output of a failed run may be partial, it is not used
+    if not succeeded or os.path.isfile(output) == 0:
         # Generate valid file
-        open(f"{basename}_interproscan_{type}_output.gff3", "w").close()
+        open(output, "w").close()
         logger.warning("INTERPROSCAN analysis return no results, moving on without this results.")
         logger.warning("Check if your sequences have special characters (like *), remove it and rerun")
+        return False
+    return True
 
+# Run interproscan only for sequences without results in cache, results of all sequences
+#   are written in output (fasta order) and new ones are stored; returns False when INTERPROSCAN failed
+def cached_interpro(cache_path, version, fasta, output, interpro_section, chunk_size=0, parallel=1, threads=1):
+    logger = logging.getLogger('INTERPROSCAN')
+    # CPUs don't change results, output format does
+    params = {key: value for key, value in interpro_section.items() if key != "cpu"}
+    params["format"] = "TSV" if is_tsv(output) else "GFF3"
+    cache = InterproCache(cache_path)
+    queries = []
+    misses = {}
+    for header, sequence in iter_fasta(fasta):
+        seq_id = header.split()[0] if header.split() else ""
+        queries.append((seq_id, InterproCache.key(sequence, version, params), sequence))
+    cached = cache.get_many(key for seq_id, key, sequence in queries)
+    # Identical sequences are searched only once
+    for seq_id, key, sequence in queries:
+        if key not in cached and key not in misses:
+            misses[key] = (seq_id, sequence)
+    logger.info(f"INTERPROSCAN cache: {len(queries) - len(misses)} of {len(queries)} sequences found")
+
+    gff_header = ["##gff-version 3\n", f"##interproscan-version {version.split()[-1]}\n"]
+    succeeded = True
+    if misses:
+        miss_fasta = f"{output}_cache_misses.fasta"
+        miss_out = f"{output}_cache_misses.{'tsv' if is_tsv(output) else 'gff3'}"
+        with open(miss_fasta, "w") as miss_file:
+            for seq_id, sequence in misses.values():
+                miss_file.write(f">{seq_id}\n{sequence}\n")
+        succeeded = interpro_search(miss_fasta, miss_out, interpro_section, chunk_size, parallel, threads)
+        # INTERPROSCAN always writes a GFF3 header, empty output is a failed run and nothing is stored
+        #   TSV has no header, so an empty TSV (no matches at all) is not stored either
+        if succeeded and os.path.getsize(miss_out) > 0:
+            miss_header, regions, records = read_output(miss_out)
+            gff_header = miss_header or gff_header
+            fresh = {}
+            for key, (seq_id, sequence) in misses.items():
+                cached[key] = to_template(seq_id, regions.get(seq_id, []), records.get(seq_id, []))
+                fresh[key] = (InterproCache.md5(sequence), *cached[key])
+            cache.put_many(fresh)
+        else:
+            logger.warning("INTERPROSCAN cache was not updated, sequences not found in cache have no results")
+        os.remove(miss_fasta)
+        os.remove(miss_out)
+    cache.close()
+
+    # Results of cached and new sequences are written the same way
+    found = [(seq_id, serial, cached[key]) for serial, (seq_id, key, sequence) in enumerate(queries) if key in cached]
+    with open(output, "w") as gff:
+        # TSV has only match lines
+        if not is_tsv(output):
+            gff.writelines(gff_header)
+        for seq_id, serial, (region, records) in found:
+            gff.write(from_template(region, seq_id, serial))
+        if not is_tsv(output):
+            gff.write("##FASTA\n")
+            for seq_id, serial, (region, records) in found:
+                gff.write(from_template(records, seq_id, serial))
+    return succeeded
+
+# Name of INTERPROSCAN output for type (hypothetical, annotated or all), extension is the format
+#   output_format is GFF3 or TSV
+def interpro_output(basename, type, output_format="GFF3"):
+    extension = "tsv" if str(output_format).upper() == "TSV" else "gff3"
+    return f"{basename}_interproscan_{type}_output.{extension}"
+
+def interpro_run(type, basename, interpro_section, chunk_size=0, parallel=1, threads=1, cache=None,
+                 output_format="GFF3"):
+    logger = logging.getLogger('INTERPROSCAN')
+    logger.info(f"Running with {type.capitalize()} Proteins")
+    succeeded = interpro_search(f"{type.capitalize()}_Products.fasta", interpro_output(basename, type, output_format),
+                                interpro_section, chunk_size, parallel, threads, cache)
     logger.info(f"INTERPROSCAN finished for {type.capitalize()} Proteins")
+    return succeeded
+
+# Run interproscan once for hypothetical and annotated proteins, then split output by ID
+#   INTERPROSCAN startup (JVM, member databases) is paid only once
+def interpro_unified_run(basename, interpro_section, chunk_size=0, parallel=1, threads=1, cache=None,
+                         output_format="GFF3"):
+    logger = logging.getLogger('INTERPROSCAN')
+    logger.info("Running with Hypothetical and Annotated Proteins at once")
+    ids = {}
+    with open("All_Products.fasta", "w") as all_products:
+        for type in ("hypothetical", "annotated"):
+            ids[type] = set()
+            for header, sequence in iter_fasta(f"{type.capitalize()}_Products.fasta"):
+                ids[type].add(header.split()[0] if header.split() else "")
+                all_products.write(f">{header}\n{sequence}\n")
+    succeeded = interpro_search("All_Products.fasta", interpro_output(basename, "all", output_format), interpro_section,
+                                chunk_size, parallel, threads, cache)
+    split_output(interpro_output(basename, "all", output_format),
+                 [(interpro_output(basename, type, output_format), ids[type]) for type in ("hypothetical", "annotated")])
+    os.remove("All_Products.fasta")
+    logger.info("INTERPROSCAN finished for Hypothetical and Annotated Proteins")
+    return succeeded
+
+# Create command line to run hmmscan (functional prediction of hypothetical proteins)
+#   shards > 1 runs hmmscan over query shards at the same time, big query sets (>= search_min_queries)
+#   run with hmmsearch; output is always the hmmscan --tblout table (hmmer_runner.py)
+def hmmscan_run(basename, hmmscan_section, pfam, threads, shards=1, search_min_queries=0, press_cache=None):
+    logger = logging.getLogger('HMMSCAN')
+    logger.info("Running HMMSCAN with Hypothetical Proteins")
+
+    # Optionals
+    hmmscan_options = ""
+    for param in hmmscan_section:
+        if str(hmmscan_section.get(param)).lower() == "flag":
+            hmmscan_options += f" --{str(param)}"
+        else:
+            # These specific arguments are passed through '-'
+            if any(arg == str(param) for arg in ("E", "Z", "T")):
+                hmmscan_options += f" -{str(param)} {str(hmmscan_section.get(param))}"
+            # Everyone else are passed through '--'
+            else:
+                hmmscan_options += f" --{str(param)} {str(hmmscan_section.get(param))}"
+
+    try:
+        run_hmmer("Hypothetical_Products.fasta", f"{str(basename)}_hmmscan_output.txt", pfam, hmmscan_options,
+                  threads, shards, search_min_queries, press_cache, logger)
+    except RuntimeError as error:
+        logger.error(str(error))
+        log_quit()
+
+    # Check if expected file exists
+    check_file(f"{str(basename)}_hmmscan_output.txt")
+
+    logger.info("HMMSCAN is finished")
+
+# Create command line to run rpsblast (functional prediction of hypothetical proteins)
+#   shards > 1 splits proteins in shards with about the same residues, running at the same time
+#   with threads/shards each; results are merged in query order
+def rpsblast_run(basename, rpsblast_section, cdd, threads, shards=1):
+    logger = logging.getLogger('RPSBLAST')
+    logger.info("Running RPSBLAST with Hypothetical Proteins")
+
+    def rpsblast_command(query, output, num_threads):
+        # General
+        rpsblast_command_line = (
+            f"rpsblast -query {str(query)} "
+            f"-out {str(output)} "
+            f"-db {str(cdd)} "
+            f"-outfmt \"6 qseqid sseqid sacc bitscore evalue ppos pident qcovs stitle\" "
+            f"-num_threads {str(num_threads)}"
+        )
+
+        # Optionals
+        for param in rpsblast_section:
+            if str(rpsblast_section.get(param)).lower() == "flag":
+                rpsblast_command_line += f" -{str(param)}"
+            else:
+                rpsblast_command_line += f" -{str(param)} {str(rpsblast_section.get(param))}"
+        return rpsblast_command_line
+
+    if int(shards) > 1:
+        # RPS-BLAST threads scale poorly, so run several rpsblast over query shards
+        shard_threads = threads_per_shard(threads, shards)
+        logger.info(f"Running RPSBLAST in {shards} shards with {shard_threads} thread(s) each")
+        try:
+            run_sharded("Hypothetical_Products.fasta", f"{str(basename)}_rpsblast_output.outfmt6", shards,
+                        lambda query, output: rpsblast_command(query, output, shard_threads), logger)
+        except RuntimeError as error:
+            logger.error(str(error))
+            log_quit()
+    else:
+        rpsblast_command_line = rpsblast_command("Hypothetical_Products.fasta",
+                                                 f"{str(basename)}_rpsblast_output.outfmt6", threads)
+        logger.debug(str(rpsblast_command_line))
+        run_checked(rpsblast_command_line, "RPSBLAST", logger)
+
+    # Check if expected file exists
+    check_file(f"{str(basename)}_rpsblast_output.outfmt6")
+
+    logger.info("RPSBLAST is finished")
+
+# Run functional annotation parser (INTERPROSCAN, HMMSCAN and RPSBLAST)
+def funcannotation_run(basename, duplicates, interpro_index, interpro_format="GFF3"):
+    logger = logging.getLogger('AnnotaPipeline')
+    logger.info("Parsing information from INTERPROSCAN, HMMSCAN and RPSBLAST")
+
+    run_checked([
+        str("funcannotation_parser"),
+        "-ipr_annot",
+        interpro_output(basename, "annotated", interpro_format),
+        "-ipr_hyp",
+        interpro_output(basename, "hypothetical", interpro_format),
+        "-hmm",
+        str(basename + "_hmmscan_output.txt"),
+        "-rpsblast",
+        str(basename + "_rpsblast_output.outfmt6"),
+        "-basename",
+        str(basename),
+        "-ipr_index",
+        str(interpro_index),
+        "-dup",
+        str(duplicates)
+        ], "funcannotation_parser", logger
+    )
 
 # Create command line to run kallisto (transcriptomics)
-def kallisto_run(python_path, kallisto, paired_end, method, basename, fasta):
+def kallisto_run(kallisto, paired_end, method, basename, fasta):
     
     logger.info("KALLISTO index has started")
     kallisto_command_index = f"kallisto index -i {basename}_kallisto_index.idx {fasta}"
     logger.debug(f"{kallisto_command_index}")
-    subprocess.getoutput(kallisto_command_index)
+    run_checked(kallisto_command_index, "KALLISTO index", logger)
     check_file(f"{basename}_kallisto_index.idx")
 
     # Standart command line for kallisto index
@@ -383,10 +647,7 @@ def kallisto_run(python_path, kallisto, paired_end, method, basename, fasta):
         )
         logger.info("KALLISTO quant has started")
         logger.debug(kallisto_command_quant)
-        if check_point(logger=logger, file=f"{basename}_kallisto_output"):
-            pass
-        else:
-            subprocess.getoutput(kallisto_command_quant)
+        run_checked(kallisto_command_quant, "KALLISTO quant", logger)
         # Standart command line for kallisto quant paired end
         # kallisto quant -i transcripts.idx -o output -b 100 reads_1.fastq reads_2.fastq
     else:
@@ -397,7 +658,7 @@ def kallisto_run(python_path, kallisto, paired_end, method, basename, fasta):
         )
         logger.info("KALLISTO quant has started")
         logger.debug(kallisto_command_quant)
-        subprocess.getoutput(kallisto_command_quant)
+        run_checked(kallisto_command_quant, "KALLISTO quant", logger)
         # Standart command line for kallisto quant single end
         # kallisto quant -i transcripts.idx -o output -b 100 --single -l 180 -s 20 reads_1.fastq
     check_file(f"{basename}_kallisto_output/abundance.tsv")
@@ -416,42 +677,9 @@ def kallisto_run(python_path, kallisto, paired_end, method, basename, fasta):
         f"-basename {basename} {kallisto_parser_flag}"
     )
     logger.info("KALLISTO parsing has started")
-    if check_point(logger=logger, file=f"{basename}_kallisto_output/abundance.tsv"):
-        pass
-    else:
-        subprocess.getoutput(kallisto_parser_command)
+    run_checked(kallisto_parser_command, "kallisto_parser", logger)
     check_file(f"{basename}_Transcript_Quantification.tsv")
 
-# Run fastatogff parser
-def run_fastatogff(gff_file, AnnotaBasename):
-    subprocess.run([
-        "fastatogff",
-        "-gff",
-        str(gff_file),
-        "-all",
-        str("All_Annotated_Products.txt"),
-        "-b",
-        str(AnnotaBasename)
-        ]
-    )
-
-# Run gff to fasta parser
-def gfftofasta(gff_file, AnnotaBasename, clear_file, organism):
-    subprocess.run([
-        str("gfftofasta_parser"),
-        "-gff",
-        str(gff_file),
-        "-annot",
-        str("All_Annotated_Products.txt"),
-        "-b",
-        str(AnnotaBasename),
-        "-faf",
-        str(clear_file),
-        "-org",
-        str('"%s"' % str(organism))
-        ]
-    )
-
 # ------------------------------------------ -------------------------------------------------
 # ------------------------- Check Parameters -------------------------------------------------
 # Part of check parameters function >> check specific entries for kallisto (transcriptomics)
@@ -580,6 +808,10 @@ def proteomics_check_parameters(proteomic_section):
             logger.error("[PERCOLATOR] qvalue cutoff invalid. Must be float between [0-1]")
             log_quit()
 
+# Parameters that can be left empty in config file
+optional_params = ("ms", "cache", "interproscan-cache", "hmmpress-cache")
+
+
 # Function to check if all parameters in config file are correct
 def check_parameters(sections, protein):
     for section, list_section in sections.items():
@@ -613,8 +845,8 @@ def check_parameters(sections, protein):
                 pass
             else:
                 for key in list_section:  # get variable for each box
-                    # MS is optional parameter for INTERPROSCAN
-                    if str(key) == "ms":
+                    # MS (INTERPROSCAN) and caches (BLAST, INTERPROSCAN) are optional parameters
+                    if str(key) in optional_params:
                         pass
                     elif list_section.get(key) is None:
                         # Crash pipeline if some required variable is empty
@@ -626,8 +858,8 @@ def check_parameters(sections, protein):
         else:
             # check if variable in list each section
             for key in list_section:  # get variable for each box
-                # MS is optional parameter for INTERPROSCAN
-                if str(key) == "ms":
+                # MS (INTERPROSCAN) and caches (BLAST, INTERPROSCAN) are optional parameters
+                if str(key) in optional_params:
                     pass
                 elif list_section.get(key) is None:
                     # Crash pipeline if some required variable is empty
@@ -635,32 +867,6 @@ def check_parameters(sections, protein):
                     log_quit()
 # -------------------------------------------------------------------------------------------
 
-# Function to annotate coding sequences
-def annotate_codingseq(aa_fasta, codingseq_fasta, basename):
-    # Linha de anotacao completa
-    anno_all = [line.strip() for line in open(aa_fasta) if ">" in line]
-    anno_all = [sub.replace(">", "") for sub in anno_all]
-    # IDs simplificadas
-    anno_ids = [name.split("|")[0].strip() for name in anno_all]
-
-    corrrected_ids = dict(zip(anno_ids, anno_all))
-
-    id_dict  = SeqIO.to_dict(SeqIO.parse(codingseq_fasta, "fasta"))
-
-    corrected_fasta = str(f"AnnotaPipeline_{basename}_transcripts.fasta")
-
-    logger.info(f"Generating AnnotaPipeline_{basename}_transcripts.fasta file from AnnotaPipeline_{basename}_proteins.fasta")
-
-    with open(corrected_fasta, "w") as corrected:
-        for key, record in id_dict.items():
-            for id_key in corrrected_ids.keys():
-                if id_key in key:
-                    record.id = corrrected_ids.get(id_key)
-                    record.description = ""
-                    record.seq = record.seq.upper()
-                    SeqIO.write(record, corrected, "fasta-2line")
-
-
 # part of proteomics parser >> count peptide and spectrum
 def add_features(feature, data, save):
     # Work on temp dataset
@@ -775,6 +981,11 @@ def main():
     rpsblast = config['rpsblast']
     kallisto = config['kallisto']
     proteomics = config['proteomics']
+    # INTERPROSCAN output format, TSV is smaller and faster to parse than GFF3
+    interpro_format = str(AnnotaPipeline.get('interproscan-format', "GFF3")).upper()
+    if interpro_format not in ("GFF3", "TSV"):
+        logger.error(f"interproscan-format must be GFF3 or TSV, not {interpro_format}")
+        log_quit()
 
     # AnnotaPipeline main directory
     home_dir = f"AnnotaPipeline_{str(AnnotaBasename)}"
@@ -784,6 +995,9 @@ def main():
     os.chdir(home_dir)
     annota_pwd = pathlib.Path(home_dir_pwd / home_dir)
 
+    # Stages completed in previous runs, with hashes of what they read and wrote
+    manifest = RunManifest(annota_pwd / "AnnotaPipeline_manifest.json")
+
     # --- AUGUSTUS -----------------------------------------------------------------
 
     augustus_folder = pathlib.Path(annota_pwd / str("1_GenePrediction_" + AnnotaBasename))
@@ -795,7 +1009,21 @@ def main():
     logger.info("---------------------------------------------------------------")
     logger.info("----------------- Gene Prediction has started -----------------")
     if args.protein is None:
-        augustus_run(augustus_main, augustus_optional, AnnotaBasename, seq_file)
+        aug_file = augustus_folder / str("AUGUSTUS_" + AnnotaBasename)
+        run_stage(Stage(
+            "augustus",
+            partial(augustus_run, augustus_main, augustus_optional, AnnotaBasename, seq_file,
+                    AnnotaPipeline.get('threads'), AnnotaPipeline.get('augustus-chunk-size', 0),
+                    AnnotaPipeline.get('augustus-overlap', 100000), AnnotaPipeline.get('augustus-parser', 'python')),
+            inputs=[seq_file],
+            outputs=[f"{aug_file}.gff", f"{aug_file}.aa", f"{aug_file}.codingseq"],
+            # Chunks can change predictions near window edges
+            params={"augustus": augustus_main, "augustus-optional": augustus_optional,
+                    "augustus-chunk-size": AnnotaPipeline.get('augustus-chunk-size', 0),
+                    "augustus-overlap": AnnotaPipeline.get('augustus-overlap', 100000)},
+            version=partial(tool_version, "augustus --version")
+        ), manifest)
+        aug_parsing = f"AUGUSTUS_{AnnotaBasename}.aa"
     else:
         # Copy protein file to AUGUSTUS path and patronized variable to run Annotapipeline after augustus
         shutil.copy2(prot_path, augustus_folder)
@@ -814,6 +1042,16 @@ def main():
 
     logger.info(f"Sequence Cleaner is finished. Please check Clear_{aug_parsing}")
 
+    # Identical proteins (alternative transcripts, multicopy genes) are annotated only once
+    #   results of each representative are copied to the other IDs by the parsers
+    unique_fasta = augustus_folder / str(f"Unique_Clear_{aug_parsing}")
+    duplicates_map = augustus_folder / str(f"Duplicated_Clear_{aug_parsing}.tsv")
+    records, unique = collapse_duplicates(f"Clear_{aug_parsing}", unique_fasta, duplicates_map)
+    logger.info(f"{records - unique} identical sequence(s) collapsed, {unique} unique sequence(s) will be annotated")
+
+    # Index unique file, used to fetch hypothetical and annotated proteins
+    build_faidx(unique_fasta)
+
     os.chdir(annota_pwd)
 
     # BLAST ------------------------------------------------------------------------
@@ -845,40 +1083,65 @@ def main():
         customsep = databases.get("customsep")
         customfield = databases.get("customcolumn")
 
-    if check_point(logger=logger, file=f"{AnnotaBasename}_BLASTp_AAvsSwissProt.outfmt6") and check_point(logger=logger, file=f"{AnnotaBasename}_BLASTp_AAvsSpecifiedDB.outfmt6"):
-        pass
-    else:
-        subprocess.run([
-            str("blastp_parser"),
-            "-s",
-            str(augustus_folder / str("Clear_" + aug_parsing)),
-            "-sp",
-            str(databases.get('swissprot-db')),
-            "-basename",
-            str(AnnotaBasename),
-            str(flag_spdb),  # Flag for databse
-            str(spdb_path),  # path to database
-            "-id",
-            str(blast.get('identity')),
-            "-pos",
-            str(blast.get('positivity')),
-            "-cov",
-            str(blast.get('coverage')),
-            "-kw",
-            str(f'{",".join(keyword_list)}'),
-            "-t",
-            str(AnnotaPipeline.get('threads')), 
-            "-max_target_seqs", 
-            str(blast.get('max_target_seqs')), 
-            "-evalue", 
-            str(blast.get('evalue')),
-            # Flags used only with customdb
-            "-customsep",
-            str(customsep), 
-            "-customcolumn", 
-            str(customfield)
-            ]
-        )
+    blastp_command = [
+        str("blastp_parser"),
+        "-s",
+        str(unique_fasta),
+        "-sp",
+        str(databases.get('swissprot-db')),
+        "-basename",
+        str(AnnotaBasename),
+        str(flag_spdb),  # Flag for databse
+        str(spdb_path),  # path to database
+        "-id",
+        str(blast.get('identity')),
+        "-pos",
+        str(blast.get('positivity')),
+        "-cov",
+        str(blast.get('coverage')),
+        "-kw",
+        str(f'{",".join(keyword_list)}'),
+        "-t",
+        str(AnnotaPipeline.get('threads')), 
+        "-max_target_seqs", 
+        str(blast.get('max_target_seqs')), 
+        "-shards",
+        str(blast.get('shards', 1)),
+        "-engine",
+        str(blast.get('parser-engine', 'python')),
+        "-evalue", 
+        str(blast.get('evalue')),
+        # Flags used only with customdb
+        "-customsep",
+        str(customsep), 
+        "-customcolumn", 
+        str(customfield),
+        "-dup",
+        str(duplicates_map)
+    ]
+    # Hits kept between runs, only queries not found in cache go to blastp
+    if blast.get('cache') is not None:
+        blastp_command += ["-cache", str(blast.get('cache')), "-cache_size", str(blast.get('cache-size', 10240))]
+
+    blast_outputs = [
+        f"{AnnotaBasename}_BLASTp_AAvsSwissProt.outfmt6",
+        f"{AnnotaBasename}_BLASTp_AAvsSpecifiedDB.outfmt6",
+        f"{AnnotaBasename}_BLASTp_AA_SwissProted.fasta",
+        f"{AnnotaBasename}_annotated_products.txt",
+        f"{AnnotaBasename}_hypothetical_products.txt",
+        f"{AnnotaBasename}_no_hit_products.txt"
+    ]
+    run_stage(Stage(
+        "blastp_parser",
+        partial(run_checked, blastp_command, "blastp_parser"),
+        inputs=[unique_fasta, duplicates_map],
+        outputs=[blast_folder / output for output in blast_outputs],
+        # threads, shards, cache and parser engine don't change results
+        params={"databases": databases, "keywords": keyword_list,
+                "local-aligner": {key: value for key, value in blast.items()
+                                  if key not in ("shards", "cache", "cache-size", "parser-engine")}},
+        version=partial(tool_version, "blastp -version")
+    ), manifest)
 
     logger.info("BLAST execution and parsing is finished")
 
@@ -897,115 +1160,132 @@ def main():
     os.chdir(interpro_folder)
     logger.info("---------------------------------------------------------------")
     logger.info("------------- Functional Annotation has started ---------------")
-    # Running interproscan with hypothetical proteins
-    interpro_run("hypothetical", AnnotaBasename, blast_folder, augustus_folder, aug_parsing, interpro)
-
-    # Running interproscan with annotated proteins 
-    interpro_run("annotated", AnnotaBasename, blast_folder, augustus_folder, aug_parsing, interpro)
 
-    # HMMER ------------------------------------------------------------------------
-    logger = logging.getLogger('HMMSCAN')
-    logger.info("Running HMMSCAN with Hypothetical Proteins")
-
-    # General
-    hmmscan_command_line = (
-        "hmmscan "
-        f"--cpu {str(AnnotaPipeline.get('threads'))} "
-        f"--tblout {str(AnnotaBasename)}_hmmscan_output.txt "
-        f"--noali"
-    )
-
-    # Optionals
-    for param in hmmscan:
-        if str(hmmscan.get(param)).lower() == "flag":
-            hmmscan_command_line += f" --{str(param)}"
-        else:
-            # These specific arguments are passed through '-'
-            if any(arg == str(param) for arg in ("E", "Z", "T")):
-                hmmscan_command_line += f" -{str(param)} {str(hmmscan.get(param))}"
-            # Everyone else are passed through '--'
-            else:
-                hmmscan_command_line += f" --{str(param)} {str(hmmscan.get(param))}"
-
-    # Add Database
-    hmmscan_command_line += (
-        f" {str(databases.get('pfam'))} "
-        f"Hypothetical_Products.fasta "
-        f"> /dev/null 2> hmmscan.err"
-    )
-
-    logger.debug(str(hmmscan_command_line))
-    if check_point(logger=logger, file=f"{str(AnnotaBasename)}_hmmscan_output.txt"):
-        pass
-    else:
-        subprocess.getoutput(hmmscan_command_line)
-
-    # Check if expected file exists
-    check_file(f"{str(AnnotaBasename)}_hmmscan_output.txt")
-
-    logger.info("HMMSCAN is finished")
-
-    # RPSBLAST ---------------------------------------------------------------------
-    logger = logging.getLogger('RPSBLAST')
-    logger.info("Running RPSBLAST with Hypothetical Proteins")
-
-    # General
-    rpsblast_command_line = (
-        f"rpsblast -query Hypothetical_Products.fasta "
-        f"-out {str(AnnotaBasename)}_rpsblast_output.outfmt6 "
-        f"-db {str(databases.get('cdd-db'))} "
-        f"-outfmt \"6 qseqid sseqid sacc bitscore evalue ppos pident qcovs stitle\" "
-        f"-num_threads {str(AnnotaPipeline.get('threads'))}"
-    )
-
-    # Optionals
-    for param in rpsblast:
-        if str(rpsblast.get(param)).lower() == "flag":
-            rpsblast_command_line += f" -{str(param)}"
-        else:
-            rpsblast_command_line += f" -{str(param)} {str(rpsblast.get(param))}"
-
-    logger.debug(str(rpsblast_command_line))
-    
-    if check_point(logger=logger, file=f"{str(AnnotaBasename)}_rpsblast_output.outfmt6"):
-        pass
+    # Stages without shared data (INTERPROSCAN runs, HMMSCAN and RPSBLAST) run at the same time
+    #   parallel-stages limits how many of them are running, each one uses all threads
+    hypothetical_fasta = interpro_folder / "Hypothetical_Products.fasta"
+    annotated_fasta = interpro_folder / "Annotated_Products.fasta"
+    interpro_index = interpro_folder / str(AnnotaBasename + "_interproscan_index.sqlite")
+    interpro_hypothetical = interpro_folder / interpro_output(AnnotaBasename, "hypothetical", interpro_format)
+    interpro_annotated = interpro_folder / interpro_output(AnnotaBasename, "annotated", interpro_format)
+    functional_stages = [
+        Stage(
+            "hypothetical_products",
+            partial(products_fetch, "hypothetical", AnnotaBasename, blast_folder, augustus_folder, aug_parsing),
+            inputs=[unique_fasta, duplicates_map,
+                    blast_folder / str(AnnotaBasename + "_hypothetical_products.txt"),
+                    blast_folder / str(AnnotaBasename + "_no_hit_products.txt")],
+            outputs=[hypothetical_fasta]
+        ),
+        Stage(
+            "annotated_products",
+            partial(products_fetch, "annotated", AnnotaBasename, blast_folder, augustus_folder, aug_parsing),
+            inputs=[unique_fasta, duplicates_map, blast_folder / str(AnnotaBasename + "_annotated_products.txt")],
+            outputs=[annotated_fasta]
+        ),
+    ]
+    # Proteins per INTERPROSCAN chunk (0: one run), instances at once, threads to share and match cache
+    interpro_chunks = (AnnotaPipeline.get('interproscan-chunk-size', 0), AnnotaPipeline.get('interproscan-parallel', 1),
+                       AnnotaPipeline.get('threads'), AnnotaPipeline.get('interproscan-cache'), interpro_format)
+    if AnnotaPipeline.get('interproscan-unified', False):
+        # Running interproscan once, output split in hypothetical and annotated
+        functional_stages.append(Stage(
+            "interproscan",
+            partial(interpro_unified_run, AnnotaBasename, interpro, *interpro_chunks),
+            inputs=[hypothetical_fasta, annotated_fasta],
+            outputs=[interpro_hypothetical, interpro_annotated],
+            requires=["hypothetical_products", "annotated_products"],
+            params=interpro,
+            version=partial(tool_version, "interproscan.sh -version")
+        ))
+        interpro_stages = ["interproscan"]
     else:
-        subprocess.getoutput(rpsblast_command_line)
-
-    # Check if expected file exists
-    check_file(f"{str(AnnotaBasename)}_rpsblast_output.outfmt6")
-
-    logger.info("RPSBLAST is finished")
+        functional_stages += [
+            # Running interproscan with hypothetical proteins
+            Stage(
+                "interproscan_hypothetical",
+                partial(interpro_run, "hypothetical", AnnotaBasename, interpro, *interpro_chunks),
+                inputs=[hypothetical_fasta],
+                outputs=[interpro_hypothetical],
+                requires=["hypothetical_products"],
+                params=interpro,
+                version=partial(tool_version, "interproscan.sh -version")
+            ),
+            # Running interproscan with annotated proteins
+            Stage(
+                "interproscan_annotated",
+                partial(interpro_run, "annotated", AnnotaBasename, interpro, *interpro_chunks),
+                inputs=[annotated_fasta],
+                outputs=[interpro_annotated],
+                requires=["annotated_products"],
+                params=interpro,
+                version=partial(tool_version, "interproscan.sh -version")
+            ),
+        ]
+        interpro_stages = ["interproscan_hypothetical", "interproscan_annotated"]
+    functional_stages += [
+        Stage(
+            "hmmscan",
+            partial(hmmscan_run, AnnotaBasename, hmmscan, databases.get('pfam'), AnnotaPipeline.get('threads'),
+                    AnnotaPipeline.get('hmmer-shards', 1), AnnotaPipeline.get('hmmsearch-min-queries', 0),
+                    AnnotaPipeline.get('hmmpress-cache') or interpro_folder / "hmmpress"),
+            inputs=[hypothetical_fasta],
+            outputs=[interpro_folder / str(AnnotaBasename + "_hmmscan_output.txt")],
+            requires=["hypothetical_products"],
+            params={"hmmer": hmmscan, "pfam": databases.get('pfam')},
+            version=partial(tool_version, "hmmscan -h | grep '^# HMMER'")
+        ),
+        Stage(
+            "rpsblast",
+            partial(rpsblast_run, AnnotaBasename, rpsblast, databases.get('cdd-db'), AnnotaPipeline.get('threads'),
+                    AnnotaPipeline.get('rpsblast-shards', 1)),
+            inputs=[hypothetical_fasta],
+            outputs=[interpro_folder / str(AnnotaBasename + "_rpsblast_output.outfmt6")],
+            requires=["hypothetical_products"],
+            params={"rpsblast": rpsblast, "cdd-db": databases.get('cdd-db')},
+            version=partial(tool_version, "rpsblast -version")
+        ),
+        # Both INTERPROSCAN outputs are read once, parsers use the index
+        Stage(
+            "interproscan_index",
+            partial(build_index, interpro_index, {"annotated": interpro_annotated, "hypothetical": interpro_hypothetical}),
+            inputs=[interpro_annotated, interpro_hypothetical],
+            outputs=[interpro_index],
+            requires=interpro_stages
+        ),
+        Stage(
+            "funcannotation_parser",
+            partial(funcannotation_run, AnnotaBasename, duplicates_map, interpro_index, interpro_format),
+            inputs=[interpro_index,
+                    interpro_folder / str(AnnotaBasename + "_hmmscan_output.txt"),
+                    interpro_folder / str(AnnotaBasename + "_rpsblast_output.outfmt6"),
+                    duplicates_map],
+            outputs=[interpro_folder / str(AnnotaBasename + "_Grouped_Hypothetical_Information.tsv")],
+            requires=["interproscan_index", "hmmscan", "rpsblast"]
+        ),
+    ]
+
+    run_stages(functional_stages, workers=AnnotaPipeline.get('parallel-stages', 1), manifest=manifest)
 
-    # -----------------------------------------------------------------------
     logger = logging.getLogger('AnnotaPipeline')
     logger.info("---------------------------------------------------------------")
     logger.info("---------------- Generating Annotation Files ------------------")
-    logger.info("Parsing information from INTERPROSCAN, HMMSCAN and RPSBLAST")
-
-    subprocess.run([
-        str("funcannotation_parser"),
-        "-ipr_annot",
-        str(AnnotaBasename + "_interproscan_annotated_output.gff3"),
-        "-ipr_hyp",
-        str(AnnotaBasename + "_interproscan_hypothetical_output.gff3"),
-        "-hmm",
-        str(AnnotaBasename + "_hmmscan_output.txt"),
-        "-rpsblast",
-        str(AnnotaBasename + "_rpsblast_output.outfmt6"),
-        "-basename",
-        str(AnnotaBasename)
-        ]
-    )
 
     # Cleaning the house
+    #   hmmer_runner writes stderr of hmmscan/hmmsearch (and of each shard) in <output>.err
+    hmmscan_output = str(AnnotaBasename + "_hmmscan_output.txt")
     try:
-        os.remove("hmmscan.err")
-        shutil.rmtree('temp', ignore_errors=True)
+        for err_file in (list(interpro_folder.glob(f"{hmmscan_output}*.err"))
+                         + list(interpro_folder.glob(f"{hmmscan_output}_shards/*.err"))):
+            try:
+                err_file.unlink()
+            except FileNotFoundError:
+                pass
     except Exception as warn:
-        logger.warning("Failed to remove HMMSCAN log and temp dir")
+        logger.warning("Failed to remove HMMSCAN logs")
         logger.debug(f"code error: {warn}")
         pass
+    shutil.rmtree('temp', ignore_errors=True)
 
     logger.info("INTERPROSCAN, HMMSCAN and RPSBLAST execution and parsing is finished")
 
@@ -1018,15 +1298,19 @@ def main():
     subprocess.run([
         str("info_parser"),
         "-ipr1",
-        str(interpro_folder / str(AnnotaBasename + "_interproscan_annotated_output.gff3")),
+        str(interpro_annotated),
         "-ipr2",
-        str(interpro_folder / str(AnnotaBasename + "_interproscan_hypothetical_output.gff3")),
+        str(interpro_hypothetical),
         "-a",
         str(blast_folder / str(AnnotaBasename + "_annotated_products.txt")),
         "-hy",
         str(blast_folder / str(AnnotaBasename + "_hypothetical_products.txt")),
         "-nh",
-        str(blast_folder / str(AnnotaBasename + "_no_hit_products.txt"))
+        str(blast_folder / str(AnnotaBasename + "_no_hit_products.txt")),
+        "-ipr_index",
+        str(interpro_index),
+        "-dup",
+        str(duplicates_map)
         ]
     )
 
@@ -1034,8 +1318,8 @@ def main():
     check_file("All_annotation_products.txt")
 
     try:
-        # Sort annotations
-        os.system("sort -V All_annotation_products.txt -o All_Annotated_Products.txt")
+        # Sort annotations (same order as sort -V)
+        sort_file("All_annotation_products.txt", "All_Annotated_Products.txt", key=version_key)
         os.remove("All_annotation_products.txt")
     except Exception as warn:
         logger.warning("Failed to sort All_annotation_products.txt")
@@ -1046,14 +1330,12 @@ def main():
 
     # ------------  Defining what file will be used ---------------------------
     if args.gff is not None and args.protein is not None:  # User gave protein file and gff file
-        # Run parser to generate fasta_file
+        # Annotated proteins and gff in one pass over each file
         gff_file = str(gff_path)
-        logger.info(f"Generating AnnotaPipeline_{AnnotaBasename}_proteins.fasta")
-        clear_file =  str(augustus_folder / str("Clear_" + aug_parsing)),
-        gfftofasta(clear_file=clear_file, AnnotaBasename=AnnotaBasename, gff_file=gff_file, organism=AnnotaPipeline.get('organism'))
-        logger.info("Generating annotated GFF file")
-        run_fastatogff(gff_file=gff_file, AnnotaBasename=AnnotaBasename)
-        logger.info(f"GFF file is ready - Check {AnnotaBasename}_Annotated_GFF.gff")
+        logger.info(f"Generating AnnotaPipeline_{AnnotaBasename}_proteins.fasta and annotated GFF file")
+        emit_annotations(gff=gff_file, annotation_file="All_Annotated_Products.txt",
+                         protein_fasta=augustus_folder / str("Clear_" + aug_parsing),
+                         basename=AnnotaBasename, organism=AnnotaPipeline.get('organism'), logger=logger)
     elif args.protein is not None and args.gff is None:  # User gave only protein file
         logger.info("GFF file wasn't given, FASTA file will only have annotations")
         logger.info("Generating simple FASTA")
@@ -1072,14 +1354,13 @@ def main():
         logger.info("GFF file wasn't given, skipping script fastatogff.py")
     else:  # User selected run Augustus
         gff_file = augustus_folder / str("AUGUSTUS_" + str(AnnotaBasename) + ".gff")
-        logger.info(f"Generating AnnotaPipeline_{AnnotaBasename}_proteins.fasta")
-        gfftofasta(clear_file=clear_file, AnnotaBasename=AnnotaBasename, gff_file=gff_file, organism=AnnotaPipeline.get('organism'))
-        logger.info("Generating annotated GFF file")
-        run_fastatogff(gff_file=gff_file, AnnotaBasename=AnnotaBasename)
-        logger.info(f"GFF file is ready - Check {str(AnnotaBasename)}_Annotated_GFF.gff")
-        # Transfer annotation from proteins to Transcript (codingseq) file
-        annotate_codingseq(annota_pwd / str("AnnotaPipeline_" + AnnotaBasename + "_proteins.fasta"), 
-            augustus_folder / str("AUGUSTUS_" + AnnotaBasename + ".codingseq"), AnnotaBasename)
+        logger.info(f"Generating AnnotaPipeline_{AnnotaBasename}_proteins.fasta and annotated GFF file")
+        # Annotation from proteins is also transferred to Transcript (codingseq) file
+        emit_annotations(gff=gff_file, annotation_file="All_Annotated_Products.txt",
+                         protein_fasta=augustus_folder / str("Clear_" + aug_parsing),
+                         basename=AnnotaBasename, organism=AnnotaPipeline.get('organism'),
+                         codingseq=augustus_folder / str("AUGUSTUS_" + AnnotaBasename + ".codingseq"),
+                         logger=logger)
 
     logger.info("AnnotaPipeline has annotated the annotations on the annotated file.")
 
@@ -1100,9 +1381,15 @@ def main():
         logger = logging.getLogger('KALLISTO')
 
         # Annotated_Products.cdsexon 
-        kallisto_run(kallisto, kallisto_paired_end, kallisto_method,
-            AnnotaBasename, f"{annota_pwd / f'AnnotaPipeline_{AnnotaBasename}_transcripts.fasta'}"
-            )
+        transcripts_fasta = annota_pwd / f'AnnotaPipeline_{AnnotaBasename}_transcripts.fasta'
+        run_stage(Stage(
+            "kallisto",
+            partial(kallisto_run, kallisto, kallisto_paired_end, kallisto_method, AnnotaBasename, f"{transcripts_fasta}"),
+            inputs=[transcripts_fasta, *kallisto.get('rna-seq')],
+            outputs=[kallisto_output_path / f"{AnnotaBasename}_Transcript_Quantification.tsv"],
+            params=kallisto,
+            version=partial(tool_version, "kallisto version")
+        ), manifest)
 
         logger.info("KALLISTO execution and parsing is finished")
 
@@ -1175,10 +1462,13 @@ def main():
             percolator_command = f"percolator -r {percolator_out_basename}_peptide_output.tsv" \
                                 f" -m {percolator_out_basename}_percolator_output.tsv" \
                                 f" -B {percolator_out_basename}_decoy_output.tsv {comet_output_file}"
-            if check_point(logger=logger, file=f"{percolator_out_basename}_percolator_output.tsv"):
-                pass
-            else:   
-                subprocess.getoutput(percolator_command)
+            run_stage(Stage(
+                f"percolator_{percolator_out_basename}",
+                partial(run_checked, percolator_command, "PERCOLATOR"),
+                inputs=[comet_output_file],
+                outputs=[percolator_path_raw / f"{percolator_out_basename}_percolator_output.tsv"],
+                version=partial(tool_version, "percolator -h 2>&1 | grep -i version")
+            ), manifest)
             check_file(f"{percolator_out_basename}_percolator_output.tsv")
             # --------- RUN Percolator parser inside Percolator PARSED path -------------------
             os.chdir(percolator_path_parsed)
@@ -1208,8 +1498,8 @@ def main():
         quantitative_proteomics(f"{percolator_path_parsed}", AnnotaBasename)
         try:
         # Sort spectrum count
-            os.system(f"sort -V {AnnotaBasename}_pre_total_Proteomics_Quantification.tsv " \
-                    f"-o  {AnnotaBasename}_Total_Proteomics_Quantification.tsv")
+            sort_file(f"{AnnotaBasename}_pre_total_Proteomics_Quantification.tsv",
+                      f"{AnnotaBasename}_Total_Proteomics_Quantification.tsv", key=version_key)
             os.remove(f"{AnnotaBasename}_pre_total_Proteomics_Quantification.tsv")
         except Exception as warn:
             logger.warning(f"Failed to sort {AnnotaBasename}_pre_total_Proteomics_Quantification.tsv")
@@ -1223,8 +1513,10 @@ def main():
     summary_parser_command_line = f"summary_parser " \
                                 f" -b {AnnotaBasename}" \
                                 f" -annot {str(annota_pwd / 'All_Annotated_Products.txt')}" \
-                                f" -ipr_hyp {str(interpro_folder / str(AnnotaBasename + '_interproscan_hypothetical_output.gff3'))}" \
-                                f" -ipr_annot {str(interpro_folder / str(AnnotaBasename + '_interproscan_annotated_output.gff3'))}"
+                                f" -ipr_hyp {str(interpro_hypothetical)}" \
+                                f" -ipr_annot {str(interpro_annotated)}" \
+                                f" -ipr_index {str(interpro_index)}" \
+                                f" -dup {str(duplicates_map)}"
 
     # Add optional parametes (if kallisto and/or comet were executed)
     if kallisto_method is not None and args.seq is not None:
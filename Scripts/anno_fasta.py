@@ -0,0 +1,189 @@
+#!/usr/bin/python3
+
+####################################################
+###   PROTEIN, CODING SEQUENCE AND CDS EXONS     ###
+###   FROM AUGUSTUS GFF (AS getAnnoFasta.pl)     ###
+###   ONE PASS OVER GFF, GENOME READ BY INDEX    ###
+####################################################
+
+import argparse
+import logging
+import pathlib
+import re
+import sys
+
+from Scripts.fasta_utils import build_faidx, fetch_sequence, iter_fasta, load_faidx
+
+# Sequence line width used by getAnnoFasta.pl
+LINE_WIDTH = 100
+
+COMPLEMENT = str.maketrans("ACGTURYKMBVDHNacgturykmbvdhn", "TGCAAYRMKVBHDNtgcaayrmkvbhdn")
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        add_help=False,  # removes original [--help]
+        description='''Extract protein (.aa), coding sequence (.codingseq) and CDS exons (.cdsexons)
+    from AUGUSTUS gff, replacing getAnnoFasta.pl
+    Example: anno_fasta AUGUSTUS_Hsapiens.gff --seqfile=genome.fasta''',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+
+    requiredNamed = parser.add_argument_group('required arguments')
+    optionalNamed = parser.add_argument_group('optional arguments')
+
+    requiredNamed.add_argument(
+        'gff',
+        metavar='[augustus_prediction.gff]',
+        help='AUGUSTUS prediction file'
+    )
+
+    optionalNamed.add_argument(
+        '--seqfile', dest='seqfile',
+        metavar='[genome.fasta]', default=None,
+        help='genome used for prediction, without it only proteins are written'
+    )
+
+    # custom [--help] argument
+    optionalNamed.add_argument(
+        '-h', '-help', '--help',
+        action='help',
+        default=argparse.SUPPRESS,  # hidden argument
+        help='Show this help message and exit'
+    )
+    return parser
+
+
+def reverse_complement(sequence):
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def _write_record(output, header, sequence):
+    output.write(f">{header}\n")
+    for start in range(0, len(sequence), LINE_WIDTH):
+        output.write(f"{sequence[start:start + LINE_WIDTH]}\n")
+
+
+# Transcript of a feature, works for AUGUSTUS gtf (default) and gff3 output
+def _transcript_id(feature, attributes):
+    if feature in ("transcript", "mRNA"):
+        match = re.search(r"ID=([^;]+)", attributes)
+        return match.group(1) if match else attributes.strip()
+    match = re.search(r'transcript_id "([^"]+)"', attributes) or re.search(r"Parent=([^;]+)", attributes)
+    return match.group(1) if match else None
+
+
+# Index genome, sequences with different line lengths are rewritten with the same width first
+def open_genome(genome, index_file, logger):
+    try:
+        return pathlib.Path(genome), load_faidx(genome, index_file)
+    except ValueError:
+        uniform = pathlib.Path(index_file).with_suffix(".fasta")
+        logger.info(f"Genome lines have different lengths, writing {uniform} to index it")
+        with open(str(uniform), "w") as output:
+            for header, sequence in iter_fasta(genome):
+                _write_record(output, header, sequence)
+        build_faidx(uniform, index_file)
+        return uniform, load_faidx(uniform, index_file)
+
+
+# Write <stem>.aa, <stem>.codingseq and <stem>.cdsexons from AUGUSTUS gff
+#   proteins come from "# protein sequence" comments, so genome is needed only for
+#   coding sequences; transcripts are written at the end of each gene
+#   returns number of transcripts
+def anno_fasta(gff_file, genome=None, stem=None, index_file=None, logger=None):
+    if logger is None:
+        logger = logging.getLogger('AUGUSTUS')
+    gff_file = pathlib.Path(gff_file)
+    stem = str(stem or gff_file.with_suffix(""))
+    faidx = None
+    fasta = None
+    codingseq = cdsexons = None
+    if genome is not None:
+        genome_file, faidx = open_genome(genome, index_file or f"{stem}_genome.fai", logger)
+        fasta = open(str(genome_file), "rb")
+        codingseq = open(f"{stem}.codingseq", "w")
+        cdsexons = open(f"{stem}.cdsexons", "w")
+    protein = open(f"{stem}.aa", "w")
+
+    transcripts = {}
+    last_transcript = None
+    protein_lines = None
+    count = 0
+
+    def write_transcripts():
+        for transcript_id, transcript in transcripts.items():
+            if transcript["protein"]:
+                _write_record(protein, transcript_id, transcript["protein"])
+            if fasta is None or not transcript["cds"] or transcript["contig"] not in faidx:
+                continue
+            exons = sorted(transcript["cds"])
+            if transcript["strand"] == "-":
+                exons = [(start, end, reverse_complement(fetch_sequence(fasta, faidx, transcript["contig"], start, end)))
+                         for start, end in reversed(exons)]
+            else:
+                exons = [(start, end, fetch_sequence(fasta, faidx, transcript["contig"], start, end))
+                         for start, end in exons]
+            _write_record(codingseq, transcript_id, "".join(exon[2] for exon in exons).lower())
+            for number, exon in enumerate(exons, start=1):
+                _write_record(cdsexons, f"{transcript_id}.cds{number}", exon[2].lower())
+
+    try:
+        with open(str(gff_file), "r") as gff:
+            for line in gff:
+                line = line.rstrip("\n")
+                if protein_lines is not None:
+                    # Protein continues in next comments until "]"
+                    protein_lines.append(line.lstrip("# ").rstrip("]"))
+                    if line.endswith("]"):
+                        transcripts[last_transcript]["protein"] = "".join(protein_lines)
+                        protein_lines = None
+                elif line.startswith("# protein sequence = ["):
+                    sequence = line.split("[", 1)[1]
+                    if last_transcript is None:
+                        continue
+                    if sequence.endswith("]"):
+                        transcripts[last_transcript]["protein"] = sequence.rstrip("]")
+                    else:
+                        protein_lines = [sequence]
+                elif line.startswith("# end gene"):
+                    write_transcripts()
+                    count += len(transcripts)
+                    transcripts = {}
+                    last_transcript = None
+                elif line and not line.startswith("#"):
+                    fields = line.split("\t")
+                    if len(fields) < 9:
+                        continue
+                    transcript_id = _transcript_id(fields[2], fields[8])
+                    if transcript_id is None:
+                        continue
+                    transcript = transcripts.setdefault(transcript_id, {
+                        "contig": fields[0], "strand": fields[6], "cds": [], "protein": None})
+                    if fields[2] in ("transcript", "mRNA"):
+                        last_transcript = transcript_id
+                    elif fields[2] == "CDS":
+                        transcript["cds"].append((int(fields[3]), int(fields[4])))
+        # gff without "# end gene" comments
+        write_transcripts()
+        count += len(transcripts)
+    finally:
+        protein.close()
+        if fasta is not None:
+            fasta.close()
+            codingseq.close()
+            cdsexons.close()
+    return count
+
+
+def main():
+    parser = cli()
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s | %(name)s | %(levelname)s | %(message)s',
+                        datefmt='%d/%m/%Y %H:%M:%S')
+    count = anno_fasta(args.gff, args.seqfile)
+    logging.getLogger('AUGUSTUS').info(f"{count} transcripts written")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
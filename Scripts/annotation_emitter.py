@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+
+####################################################
+###   FINAL OUTPUTS IN ONE PASS OVER EACH INPUT: ###
+###   ANNOTATED GFF, PROTEINS AND TRANSCRIPTS    ###
+###   (gfftofasta_parser, fastatogff, codingseq) ###
+####################################################
+
+import logging
+
+from Scripts.fasta_utils import iter_fasta
+from Scripts.gff_utils import annotate_gff
+
+
+# Annotations of All_Annotated_Products.txt as {id: description}, description keeps its line end
+#   (lines without annotation are skipped, last line of an id wins)
+def load_annotations(annotation_file):
+    descriptions = {}
+    with open(str(annotation_file), "r") as annotations:
+        for line in annotations:
+            fields = line.split("\t")
+            if len(fields) > 1:
+                descriptions[fields[0]] = fields[1]
+    return descriptions
+
+
+# Write proteins of protein_fasta with location (transcript index of gff) and annotation in their header
+#   ids without location or annotation are written to missing_output (only created when there is one);
+#   returns ({protein id: header} of written proteins, empty without keep_headers; number of missing ids)
+def write_proteins(protein_fasta, output, locations, descriptions, organism, missing_output, keep_headers=True):
+    headers = {}
+    missing = 0
+    warn_seq = None
+    keep = False
+    with open(str(protein_fasta), "r") as fasta, open(str(output), "w") as proteins:
+        for line in fasta:
+            if line.startswith(">"):
+                seq_id = line[1:-1] if line.endswith("\n") else line[1:]
+                location = locations.get(seq_id)
+                keep = location is not None and seq_id in descriptions
+                if not keep:
+                    if warn_seq is None:
+                        warn_seq = open(str(missing_output), "w")
+                    warn_seq.write(str(seq_id) + "\n")
+                    missing += 1
+                    continue
+                header = (
+                    f"{str(seq_id)} | "
+                    f"Organism: {organism} | "
+                    f"Location: {str(location[0])} | "
+                    f"Start: {str(location[1])} | "
+                    f"End: {str(location[2])} | "
+                    f"Strand: {str(location[3])} | "
+                    f"Description: {descriptions[seq_id].rstrip(chr(13) + chr(10))}"
+                )
+                proteins.write(f">{header}\n")
+                if keep_headers:
+                    headers[header.split("|")[0].strip()] = header.strip().replace(">", "")
+            elif keep:
+                proteins.write(line)
+    if warn_seq is not None:
+        warn_seq.close()
+    return headers, missing
+
+
+# Write coding sequences with header of their protein, headers is {protein id: protein header}
+#   each record is looked up by its exact id (first word of header), so g1.t1 is never given to g1.t10;
+#   codingseq is read one record at a time, records without annotated protein are skipped
+def annotate_codingseq(headers, codingseq_fasta, output):
+    with open(str(output), "w") as corrected:
+        for header, sequence in iter_fasta(codingseq_fasta):
+            seq_id = header.split()[0] if header.split() else ""
+            if seq_id in headers:
+                corrected.write(f">{headers[seq_id]}\n{sequence.upper()}\n")
+
+
+# Write final outputs from gff (AUGUSTUS or gff3), annotations and proteins (codingseq is optional):
+#   <basename>_Annotated_GFF.gff, AnnotaPipeline_<basename>_proteins.fasta and, with codingseq,
+#   AnnotaPipeline_<basename>_transcripts.fasta; each input is read once
+def emit_annotations(gff, annotation_file, protein_fasta, basename, organism, codingseq=None, logger=None):
+    if logger is None:
+        logger = logging.getLogger('AnnotaPipeline')
+    descriptions = load_annotations(annotation_file)
+    # Quotes are not part of organism name
+    organism = str(organism).replace("\"", "").replace("\'", "")
+
+    # Annotated gff is written while locations of transcripts are kept
+    locations = annotate_gff(gff, descriptions, f"{str(basename)}_Annotated_GFF.gff", index={})
+    logger.info(f"GFF file is ready - Check {str(basename)}_Annotated_GFF.gff")
+
+    headers, missing = write_proteins(protein_fasta, f"AnnotaPipeline_{str(basename)}_proteins.fasta",
+                                      locations, descriptions, organism,
+                                      f"{str(basename)}_ids_with_no_annotations.txt", codingseq is not None)
+    if missing:
+        logger.warning("Not all sequences from fasta file were in annotation file")
+        logger.warning(f"IDs stored in {str(basename)}_ids_with_no_annotations.txt")
+    logger.info(f"AnnotaPipeline_{str(basename)}_proteins.fasta is ready")
+
+    if codingseq is not None:
+        logger.info(f"Generating AnnotaPipeline_{str(basename)}_transcripts.fasta file from protein annotations")
+        annotate_codingseq(headers, codingseq, f"AnnotaPipeline_{str(basename)}_transcripts.fasta")
@@ -0,0 +1,233 @@
+#!/usr/bin/python3
+
+####################################################
+###   AUGUSTUS OVER GENOME CHUNKS: SMALL CONTIGS ###
+###   ARE GROUPED, BIG ONES ARE SPLIT IN         ###
+###   OVERLAPPING WINDOWS. CHUNK GFFS ARE MERGED ###
+###   IN ONE FILE, AS A SINGLE AUGUSTUS RUN      ###
+####################################################
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import pathlib
+import re
+import subprocess
+
+from Scripts.fasta_utils import iter_fasta
+
+
+class Chunk(object):
+    """
+    One AUGUSTUS run: a fasta file with one or more contigs and, for windows
+    of a big contig, the range given to --predictionStart/--predictionEnd.
+    """
+
+    def __init__(self, fasta, contigs, residues, start=None, end=None):
+        self.fasta = pathlib.Path(fasta)
+        self.contigs = contigs
+        self.residues = residues
+        self.start = start
+        self.end = end
+        self.gff = pathlib.Path(f"{self.fasta.with_suffix('')}" + (f"_{start}-{end}" if start else "") + ".gff")
+
+
+# Write chunk files in chunk_dir, returns (chunks, [(contig, length), ...] in genome order)
+#   contigs up to chunk_size are grouped until chunk_size residues, bigger contigs are
+#   split in windows of chunk_size overlapping by overlap residues
+def plan_chunks(genome, chunk_dir, chunk_size, overlap):
+    chunk_dir = pathlib.Path(chunk_dir)
+    chunk_dir.mkdir(exist_ok=True)
+    chunk_size = int(chunk_size)
+    overlap = int(overlap)
+    if overlap >= chunk_size:
+        raise ValueError("AUGUSTUS overlap must be smaller than chunk size")
+    chunks = []
+    contigs = []
+    group = []
+    group_residues = 0
+
+    def write_chunk(records):
+        fasta = chunk_dir / f"chunk_{len(chunks) + 1}.fasta"
+        with open(str(fasta), "w") as output:
+            for header, sequence in records:
+                output.write(f">{header}\n{sequence}\n")
+        return fasta
+
+    for header, sequence in iter_fasta(genome):
+        name = header.split()[0] if header.split() else ""
+        contigs.append((name, len(sequence)))
+        if len(sequence) > chunk_size:
+            fasta = write_chunk([(header, sequence)])
+            step = chunk_size - overlap
+            start = 1
+            while True:
+                end = min(start + chunk_size - 1, len(sequence))
+                chunks.append(Chunk(fasta, [name], end - start + 1, start, end))
+                if end == len(sequence):
+                    break
+                start += step
+            continue
+        if group and group_residues + len(sequence) > chunk_size:
+            chunks.append(Chunk(write_chunk(group), [record[0].split()[0] for record in group], group_residues))
+            group = []
+            group_residues = 0
+        group.append((header, sequence))
+        group_residues += len(sequence)
+    if group:
+        chunks.append(Chunk(write_chunk(group), [record[0].split()[0] for record in group], group_residues))
+    return chunks, contigs
+
+
+# Run AUGUSTUS for all chunks, biggest first, up to threads at once
+#   command is the AUGUSTUS command line without sequence file
+def run_chunks(chunks, command, threads, logger=None):
+    if logger is None:
+        logger = logging.getLogger('AUGUSTUS')
+
+    def run_chunk(chunk):
+        chunk_command = command
+        if chunk.start is not None:
+            chunk_command += f" --predictionStart={chunk.start} --predictionEnd={chunk.end}"
+        chunk_command += f" {chunk.fasta} > {chunk.gff}"
+        logger.debug(chunk_command)
+        return subprocess.run(chunk_command, shell=True, stderr=subprocess.PIPE, universal_newlines=True)
+
+    # Biggest chunks first, so the last running ones are the small ones
+    ordered = sorted(chunks, key=lambda chunk: chunk.residues, reverse=True)
+    logger.info(f"Running AUGUSTUS on {len(chunks)} chunk(s), {threads} at once")
+    with ThreadPoolExecutor(max_workers=max(1, int(threads))) as executor:
+        results = list(executor.map(run_chunk, ordered))
+
+    failed = []
+    for chunk, result in zip(ordered, results):
+        if result.returncode != 0:
+            logger.error(f"AUGUSTUS exited with code {result.returncode} for {chunk.gff.name}")
+            logger.debug(result.stderr)
+            failed.append(chunk)
+    if failed:
+        raise RuntimeError(f"{len(failed)} AUGUSTUS chunk(s) failed")
+
+
+class PredictedGene(object):
+    """
+    Lines from "# start gene" to "# end gene" of an AUGUSTUS output and its position.
+    """
+
+    def __init__(self, gene_id, lines, chunk):
+        self.gene_id = gene_id
+        self.lines = lines
+        self.chunk = chunk
+        features = [line.split("\t") for line in lines if not line.startswith("#")]
+        features = [fields for fields in features if len(fields) >= 9]
+        self.contig = features[0][0]
+        self.strand = features[0][6]
+        self.start = min(int(fields[3]) for fields in features)
+        self.end = max(int(fields[4]) for fields in features)
+
+
+# Read header and gene blocks of one AUGUSTUS output
+def read_chunk_gff(chunk):
+    header = []
+    in_header = True
+    genes = []
+    strands = None
+    block = None
+    with open(str(chunk.gff), "r") as gff:
+        for line in gff:
+            line = line.rstrip("\n")
+            if line.startswith("# start gene "):
+                block = [line]
+            elif block is not None:
+                block.append(line)
+                if line.startswith("# end gene "):
+                    genes.append(PredictedGene(block[0].split()[-1], block, chunk))
+                    block = None
+            elif line == "###" and genes:
+                genes[-1].lines.append(line)
+            elif line.startswith("# ----- prediction on sequence number"):
+                in_header = False
+            elif line.startswith("# Predicted genes for sequence number") and strands is None:
+                strands = line.split(" on ", 1)[-1]
+            elif in_header:
+                header.append(line)
+    return header, genes, strands
+
+
+# Distance between gene and the window edges that are not contig ends
+def _edge_distance(gene, length):
+    chunk = gene.chunk
+    if chunk.start is None:
+        return float("inf")
+    left = gene.start - chunk.start if chunk.start > 1 else float("inf")
+    right = chunk.end - gene.end if chunk.end < length else float("inf")
+    return min(left, right)
+
+
+# Keep one prediction of each gene found in overlapping windows
+#   genes only inside their own window are kept, genes in overlaps are compared
+#   and the one farther from a window edge (so predicted with more context) wins;
+#   a gene in an overlap is also dropped when it overlaps a kept gene of an adjacent window
+def resolve_overlaps(genes, windows, length):
+    kept = []
+    kept_by_window = {}
+    contested = []
+    for gene in genes:
+        chunk = gene.chunk
+        if chunk.start is None:
+            kept.append(gene)
+            continue
+        index = windows.index(chunk)
+        previous_end = windows[index - 1].end if index > 0 else 0
+        next_start = windows[index + 1].start if index + 1 < len(windows) else length + 1
+        if gene.start > previous_end and gene.end < next_start:
+            kept.append(gene)
+            kept_by_window.setdefault(index, []).append(gene)
+        else:
+            contested.append((index, gene))
+    accepted = []
+    for index, gene in sorted(contested, key=lambda item: _edge_distance(item[1], length), reverse=True):
+        neighbours = kept_by_window.get(index - 1, []) + kept_by_window.get(index + 1, []) + accepted
+        if not any(other.chunk is not gene.chunk and other.strand == gene.strand
+                   and other.start <= gene.end and gene.start <= other.end for other in neighbours):
+            accepted.append(gene)
+    return kept + accepted
+
+
+# Merge chunk outputs in output, genes are renumbered g1, g2 ... in genome order
+def merge_chunks(chunks, contigs, output):
+    header = None
+    strands = None
+    genes_by_contig = {}
+    for chunk in chunks:
+        chunk_header, genes, chunk_strands = read_chunk_gff(chunk)
+        if header is None:
+            header = chunk_header
+        if strands is None:
+            strands = chunk_strands
+        for gene in genes:
+            genes_by_contig.setdefault(gene.contig, []).append(gene)
+
+    windows_by_contig = {}
+    for chunk in chunks:
+        if chunk.start is not None:
+            windows_by_contig.setdefault(chunk.contigs[0], []).append(chunk)
+
+    gene_count = 0
+    with open(str(output), "w") as merged:
+        merged.write("\n".join(header or []) + ("\n" if header else ""))
+        for number, (contig, length) in enumerate(contigs, start=1):
+            merged.write(f"# ----- prediction on sequence number {number} (length = {length}, name = {contig}) -----\n")
+            merged.write("#\n")
+            merged.write(f"# Predicted genes for sequence number {number} on {strands or 'both strands'}\n")
+            genes = genes_by_contig.get(contig, [])
+            if contig in windows_by_contig:
+                windows = sorted(windows_by_contig[contig], key=lambda chunk: chunk.start)
+                genes = resolve_overlaps(genes, windows, length)
+            if not genes:
+                merged.write("# (none)\n")
+            for gene in sorted(genes, key=lambda item: (item.start, item.end)):
+                gene_count += 1
+                old_id = re.compile(rf"\b{re.escape(gene.gene_id)}\b")
+                for line in gene.lines:
+                    merged.write(old_id.sub(f"g{gene_count}", line) + "\n")
+    return gene_count
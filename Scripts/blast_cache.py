@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+####################################################
+###   LOCAL BLAST HIT CACHE SHARED BETWEEN RUNS  ###
+###   KEY: SEQUENCE + DATABASE + SEARCH PARAMS   ###
+####################################################
+
+import glob
+import hashlib
+import os
+import sqlite3
+import time
+
+
+# Identify database by its files, a rebuilt or updated database gives another fingerprint
+def db_fingerprint(db):
+    files = sorted(glob.glob(f"{db}.*")) or [str(db)]
+    digest = hashlib.sha256()
+    for db_file in files:
+        digest.update(os.path.basename(db_file).encode())
+        if os.path.isfile(db_file):
+            stat = os.stat(db_file)
+            digest.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+
+class BlastCache(object):
+    """
+    SQLite store of raw outfmt6 rows (without qseqid) for each query sequence.
+    Entries not used for longer are removed first when max_bytes is reached.
+    """
+
+    def __init__(self, path, max_bytes):
+        self.path = str(path)
+        self.max_bytes = int(max_bytes)
+        self.connection = sqlite3.connect(self.path, timeout=600)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS hits ("
+            "key TEXT PRIMARY KEY, rows TEXT NOT NULL, size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        self.connection.execute("CREATE INDEX IF NOT EXISTS hits_last_used ON hits (last_used)")
+        self.connection.commit()
+
+    @staticmethod
+    def key(sequence, fingerprint, evalue, max_target_seqs):
+        sequence_digest = hashlib.sha256(sequence.upper().encode()).hexdigest()
+        return hashlib.sha256(f"{sequence_digest}|{fingerprint}|{float(evalue)!r}|{int(max_target_seqs)}".encode()).hexdigest()
+
+    # Rows for each key found, as {key: [row without qseqid, ...]}
+    def get_many(self, keys):
+        found = {}
+        keys = list(set(keys))
+        # SQLite limits the number of variables in a query
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            query = f"SELECT key, rows FROM hits WHERE key IN ({','.join('?' * len(batch))})"
+            for key, rows in self.connection.execute(query, batch):
+                found[key] = rows.split("\n") if rows else []
+        now = time.time()
+        self.connection.executemany("UPDATE hits SET last_used = ? WHERE key = ?", ((now, key) for key in found))
+        self.connection.commit()
+        return found
+
+    # Store {key: [row without qseqid, ...]}, empty list means query without hits
+    def put_many(self, entries):
+        now = time.time()
+        records = []
+        for key, rows in entries.items():
+            text = "\n".join(rows)
+            records.append((key, text, len(text) + len(key), now))
+        self.connection.executemany("INSERT OR REPLACE INTO hits VALUES (?, ?, ?, ?)", records)
+        self.connection.commit()
+
+    # Remove least recently used entries until cache fits in max_bytes
+    def evict(self):
+        total = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM hits").fetchone()[0]
+        if total <= self.max_bytes:
+            return 0
+        removed = []
+        for key, size in self.connection.execute("SELECT key, size FROM hits ORDER BY last_used ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            removed.append((key,))
+            total -= size
+        self.connection.executemany("DELETE FROM hits WHERE key = ?", removed)
+        self.connection.commit()
+        return len(removed)
+
+    def close(self):
+        self.connection.close()
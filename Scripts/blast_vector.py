@@ -0,0 +1,129 @@
+#!/usr/bin/python3
+
+####################################################
+###   VECTOR ENGINE FOR BLASTP_PARSER: HSPS ARE  ###
+###   READ IN CHUNKS AND CLASSIFIED WITH PANDAS  ###
+###   MASKS, SAME RESULTS AS check_query()       ###
+####################################################
+
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+# outfmt6 columns written by blastp_parser.blast()
+COLUMNS = ["qseqid", "sseqid", "sacc", "bitscore", "evalue", "ppos", "pident", "qcovs", "stitle"]
+USED_COLUMNS = ["qseqid", "bitscore", "ppos", "pident", "qcovs", "stitle"]
+COLUMN_TYPES = {"qseqid": object, "stitle": object, "bitscore": float, "ppos": float, "pident": float, "qcovs": float}
+
+
+# Description of each HSP, same rules as get_pattern() and process_swiss()
+def describe(titles, dbtype, customsep="|", customcolumn=5):
+    if dbtype in ("swissprot", "trembl"):
+        description = titles.str.split(" ", n=1).str[-1].str.split("OS=", n=1).str[0]
+    elif dbtype == "nr":
+        description = titles.str.extract(r"\s(.*?)\s\[.*", expand=False)
+        description = description.fillna(titles.str.replace("\n", "", regex=False))
+    elif dbtype == "specificdb":
+        description = titles.str.split(str(customsep), regex=False).str[int(customcolumn)]
+        description = description.str.replace("transcript_product=", "", regex=False)
+    else:
+        raise ValueError(f"Wrong dbtype: {dbtype}")
+    return description.str.strip()
+
+
+# Read outfmt6 in chunks of about chunk_rows HSPs, never splitting one query between chunks
+#   numbers are parsed as python float() does (round_trip), so thresholds give the same result
+def read_chunks(blast_file, chunk_rows=1000000):
+    if os.path.getsize(str(blast_file)) == 0:
+        return
+    reader = pd.read_csv(str(blast_file), sep="\t", header=None, names=COLUMNS, usecols=USED_COLUMNS,
+                         dtype=COLUMN_TYPES, quoting=csv.QUOTE_NONE, na_filter=False,
+                         float_precision="round_trip", chunksize=chunk_rows)
+    carry = None
+    for chunk in reader:
+        if carry is not None:
+            chunk = pd.concat([carry, chunk], ignore_index=True)
+        # Last query may continue in next chunk, it is kept for the next one
+        other_queries = np.flatnonzero(chunk["qseqid"].to_numpy() != chunk["qseqid"].iloc[-1])
+        split = other_queries[-1] + 1 if len(other_queries) else 0
+        carry = chunk.iloc[split:]
+        if split:
+            yield chunk.iloc[:split]
+    if carry is not None and len(carry):
+        yield carry
+
+
+# Classify each query of a chunk, as check_query() does for every HSP
+#   returns one row per query (in file order): qseqid, annotated, best, count, annotations
+def classify(chunk, dbtype, coverage, keywords, identity, positivity, customsep="|", customcolumn=5):
+    query = chunk["qseqid"].to_numpy()
+    # Consecutive rows of the same query are one query, as in the streaming parser
+    first_rows = np.flatnonzero(np.concatenate(([True], query[1:] != query[:-1])))
+    run = np.repeat(np.arange(len(first_rows)), np.diff(np.append(first_rows, len(query))))
+
+    # Numeric thresholds first, only titles of HSPs that pass them are described
+    candidates = np.flatnonzero(
+        (chunk["qcovs"].to_numpy() > float(coverage))
+        & (chunk["ppos"].to_numpy() >= float(positivity))
+        & (chunk["pident"].to_numpy() >= float(identity))
+    )
+    # Subject titles repeat a lot, descriptions and keywords are checked once per title
+    title_codes, titles = pd.factorize(chunk["stitle"].to_numpy()[candidates])
+    descriptions = describe(pd.Series(titles, dtype=object), dbtype, customsep, customcolumn)
+    has_keyword = np.fromiter((keywords.found(description) for description in descriptions),
+                              dtype=bool, count=len(descriptions))
+    kept = ~has_keyword[title_codes]
+    passing = candidates[kept]
+
+    # Passing HSPs grouped by query (runs are already in order)
+    hit_runs = run[passing]
+    hit_bits = chunk["bitscore"].to_numpy()[passing]
+    hit_descriptions = descriptions.to_numpy(dtype=object)[title_codes[kept]]
+    starts = np.flatnonzero(np.concatenate(([True], hit_runs[1:] != hit_runs[:-1]))) if len(hit_runs) else np.array([], dtype=int)
+    counts = np.diff(np.append(starts, len(hit_runs)))
+    # First HSP with the best bitscore, as the stable sort of hit objects
+    if len(hit_runs):
+        best_bits = np.maximum.reduceat(hit_bits, starts)
+        positions = np.where(hit_bits == np.repeat(best_bits, counts), np.arange(len(hit_bits)), len(hit_bits))
+        best = hit_descriptions[np.minimum.reduceat(positions, starts)]
+    else:
+        best = np.array([], dtype=object)
+
+    annotated_runs = hit_runs[starts]
+    queries = pd.DataFrame({"qseqid": query[first_rows], "annotated": False, "best": None,
+                            "count": 0, "annotations": None})
+    queries = queries.astype({"best": object, "annotations": object})
+    queries.loc[annotated_runs, "annotated"] = True
+    queries.loc[annotated_runs, "best"] = best
+    queries.loc[annotated_runs, "count"] = counts
+    hit_descriptions = hit_descriptions.tolist()
+    queries.loc[annotated_runs, "annotations"] = [";".join(hit_descriptions[start:end])
+                                                  for start, end in zip(starts, np.append(starts[1:], len(hit_descriptions)))]
+    return queries
+
+
+# Classify all queries of outfmt6, chunk by chunk
+def classify_chunks(blast_file, dbtype, coverage, keywords, identity, positivity,
+                    customsep="|", customcolumn=5, chunk_rows=1000000):
+    for chunk in read_chunks(blast_file, chunk_rows):
+        yield classify(chunk, dbtype, coverage, keywords, identity, positivity, customsep, customcolumn)
+
+
+# Lines "<query>\t<best description>" of annotated queries
+def annotated_lines(queries):
+    annotated = queries[queries["annotated"]]
+    return "".join(annotated["qseqid"] + "\t" + annotated["best"] + "\n")
+
+
+# Lines "<query>\t<N> Annotation(s): [<descriptions>]" of annotated queries
+def annotation_lines(queries):
+    annotated = queries[queries["annotated"]]
+    counts = annotated["count"].astype(str)
+    return "".join(annotated["qseqid"] + "\t" + counts + " Annotation(s): [" + annotated["annotations"] + "]\n")
+
+
+# Lines "<query>" of hypothetical queries
+def hypothetical_lines(queries):
+    return "".join(queries.loc[~queries["annotated"], "qseqid"] + "\n")
@@ -18,6 +18,12 @@ import sys
 import re
 import os
 from venv import logger
+from Scripts.blast_cache import BlastCache, db_fingerprint
+from Scripts import blast_vector
+from Scripts.duplicates import expand_file, load_members
+from Scripts.fasta_utils import filter_records, iter_fasta
+from Scripts.keywords import KeywordMatcher
+from Scripts.shard_runner import run_sharded, threads_per_shard
 
 '''---ARGUMENTS AND [--help / -help / -h]------------------------------------'''
 
@@ -126,6 +132,40 @@ def cli():
         help='number of threads [int] (default: 20)'
     )
 
+    optionalNamed.add_argument(
+        '-shards', dest='shards',
+        metavar='', type=int, default=1,
+        help=('split query file in N shards and run blastp for each one at the same time,'
+            + ' threads are divided between shards [int] (default: 1)')
+    )
+
+    optionalNamed.add_argument(
+        '-cache', dest='cache',
+        metavar='[blast_cache.sqlite]', default=None,
+        help=('SQLite file with BLAST hits from previous runs, created if needed.'
+            + ' Only sequences not found in it are searched')
+    )
+
+    optionalNamed.add_argument(
+        '-cache_size', dest='cache_size',
+        metavar='', type=int, default=10240,
+        help='maximum size of BLAST cache in MB, least recently used hits are removed [int] (default: 10240)'
+    )
+
+    optionalNamed.add_argument(
+        '-engine', dest='engine',
+        metavar='', choices=['python', 'vector'], default='python',
+        help=('parser engine: python (one HSP at a time) or vector (HSPs classified in chunks'
+            + ' with pandas, faster for big outputs). Both give the same results (default: python)')
+    )
+
+    optionalNamed.add_argument(
+        '-dup', dest='duplicates',
+        metavar='[duplicates.tsv]', default=None,
+        help=('representative and member IDs of identical sequences (tab separated).'
+            + ' Results of each representative are copied to its members')
+    )
+
     optionalNamed.add_argument(
         '-max_target_seqs', dest='hsps',
         metavar='', type=int, default=10,
@@ -213,18 +253,90 @@ class hit:
         return self.bitscore > other.bitscore
 
 
-def blast(blastp, arq1, arq2, db, hsps, evalue, logger, threads):
+def blast(blastp, arq1, arq2, db, hsps, evalue, logger, threads, shards=1):
     datab = str(db)
     fmt = str("\"6 qseqid sseqid sacc bitscore"
               + " evalue ppos pident qcovs stitle\"")
 
-    command = f"{blastp} -query {arq1} -out {arq2}" \
+    def command_line(query, output, num_threads):
+        return f"{blastp} -query {query} -out {output}" \
                     f" -db {datab} -evalue {evalue}" \
                     f" -outfmt {fmt}" \
                     f" -max_target_seqs {hsps}" \
-                    f" -num_threads {str(threads)}"
-    logger.debug(command)
-    subprocess.getoutput(command)
+                    f" -num_threads {str(num_threads)}"
+
+    if int(shards) > 1:
+        # blastp threads scale poorly, so run several blastp over query shards
+        shard_threads = threads_per_shard(threads, shards)
+        logger.info(f"Running blastp in {shards} shards with {shard_threads} thread(s) each")
+        try:
+            run_sharded(arq1, arq2, shards,
+                        lambda query, output: command_line(query, output, shard_threads), logger)
+        except RuntimeError as error:
+            logger.error(str(error))
+            log_quit(logger)
+    else:
+        command = command_line(arq1, arq2, threads)
+        logger.debug(command)
+        result = subprocess.run(command, shell=True, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, universal_newlines=True)
+        # A crashed or killed blastp may leave a partial output, it must not be used
+        if result.returncode != 0:
+            logger.debug(result.stdout)
+            logger.error(f"blastp exited with code {result.returncode} for {arq1}")
+            log_quit(logger)
+
+
+# Run blast only for sequences that aren't in cache, outfmt6 is rebuilt in query order
+def cached_blast(cache, blastp, arq1, arq2, db, hsps, evalue, logger, threads, shards=1):
+    fingerprint = db_fingerprint(db)
+    queries = []
+    misses = {}
+    for header, sequence in iter_fasta(arq1):
+        seq_id = header.split()[0] if header.split() else ""
+        key = BlastCache.key(sequence, fingerprint, evalue, hsps)
+        queries.append((seq_id, key, sequence))
+    cached = cache.get_many(key for seq_id, key, sequence in queries)
+    # Identical sequences are searched only once
+    for seq_id, key, sequence in queries:
+        if key not in cached and key not in misses:
+            misses[key] = (seq_id, sequence)
+    logger.info(f"BLAST cache: {len(queries) - len(misses)} of {len(queries)} sequences found")
+
+    fresh = {}
+    if misses:
+        miss_fasta = f"{arq2}_cache_misses.fasta"
+        miss_out = f"{arq2}_cache_misses.outfmt6"
+        with open(miss_fasta, "w") as miss_file:
+            for seq_id, sequence in misses.values():
+                miss_file.write(f">{seq_id}\n{sequence}\n")
+        # blast quits on a non-zero exit (any shard), so nothing is stored from a search that didn't finish
+        blast(blastp, miss_fasta, miss_out, db, hsps, evalue, logger, threads, shards)
+        if not os.path.isfile(miss_out):
+            logger.error(f"BLAST output {miss_out} was not created, cache was not updated")
+            log_quit(logger)
+        rows_by_id = {}
+        with open(miss_out, "r") as miss_result:
+            for row in miss_result:
+                row = row.rstrip("\n")
+                if row:
+                    qseqid, rest = row.split("\t", 1)
+                    rows_by_id.setdefault(qseqid, []).append(rest)
+        # Queries without rows had no hits, this is also stored
+        fresh = {key: rows_by_id.get(seq_id, []) for key, (seq_id, sequence) in misses.items()}
+        cache.put_many(fresh)
+        os.remove(miss_fasta)
+        os.remove(miss_out)
+
+    with open(str(arq2), "w") as output:
+        for seq_id, key, sequence in queries:
+            rows = cached[key] if key in cached else fresh[key]
+            for row in rows:
+                output.write(f"{seq_id}\t{row}\n")
+
+    removed = cache.evict()
+    if removed:
+        logger.info(f"BLAST cache: {removed} least recently used entries removed")
 
 
 # Function to close log and quit AnnotaPipeline if some expected file/parameter cant be found
@@ -234,22 +346,33 @@ def log_quit(logger):
     sys.exit(1)
 
 
-def temporary_query(arq):
-    # temporary adding a line to the BLAST analysis
-    #   so it accounts for the last query found by the BLAST algorithm
-    try:
-        temp = arq[-1].split("\t")
-        del temp[0]
-        temp.insert(0, "QueryTemp")
-        arq.append("\t".join(temp))
-        # Index error ocours when Interproscan returns no results, as consequence, arq is empty, and split empty file is not allowed
-    except IndexError:
-        arq.append("\t".join("QueryTemp"))
-
-
-def check_query(full_line_list, coverage, word_list, id, pos, list_classification, list_annot, list_desc, description):
+# Read BLAST outfmt6 one query at a time, giving (query id, [hsp line, ...])
+#   hsps of one query are consecutive in BLAST output, so only one query is kept in memory
+#   blast_file can be a path or an open file (pipe)
+def iter_queries(blast_file):
+    if isinstance(blast_file, (str, os.PathLike)):
+        with open(str(blast_file), "r") as blast_handle:
+            yield from iter_queries(blast_handle)
+        return
+    query_id = None
+    hsps = []
+    for line in blast_file:
+        line = line.rstrip("\r\n")
+        if not line:
+            continue
+        new_id = line.split("\t", 1)[0]
+        if new_id != query_id and hsps:
+            yield query_id, hsps
+            hsps = []
+        query_id = new_id
+        hsps.append(line)
+    if hsps:
+        yield query_id, hsps
+
+
+def check_query(full_line_list, coverage, keywords, id, pos, list_classification, list_annot, list_desc, description):
     if float(full_line_list[7]) > float(coverage):
-        if not any(word.lower() in description.lower() for word in word_list):
+        if not keywords.found(description):
             if float(full_line_list[5]) >= float(pos) and float(full_line_list[6]) >= float(id):
                 # If annotation is strong, is considered as non_hypothetical
                 list_classification.append("non_hypothetical")
@@ -327,126 +450,81 @@ def get_pattern(query, dbtype, customsep, customcolumn, logger):
     return seqname, desc.strip(), fields
 
 
-def parser_blast(basename, result_blast, identidade, positividade, cov, dbtype, keyword_list, customsep, customcolumn):
-    result_blast_file = open(str(result_blast), "r").read().splitlines()
+def parser_blast(basename, result_blast, identidade, positividade, cov, dbtype, keyword_list, customsep, customcolumn, engine="python"):
     hyp = open(f"{str(basename)}_hypothetical_products.txt", "w")
     nhyp = open(f"{str(basename)}_annotated_products.txt", "a")
     all_anot = open(f"{str(basename)}_SpecifiedDB_annotations.txt", "w")
-    # temporary adding a line
-    #   so it accounts for the last query found by the BLAST analysis
-    temporary_query(result_blast_file)
-    # creating the lists and counter that will be used
-    #   to make sure the script goes through each HSP in every query
-    # it's important that these lists are set back to NULL
-    #   and the counter is set to zero before we start
-    old_id = result_blast_file[0].split("\t")  # recebe a primeira query para começar a contagem
-    old_id = old_id[0]
-    annots = []
-    classification = []
-    desc_list = []
-
-    for query in result_blast_file:
-        new_id, desc, fields = get_pattern(query, dbtype, customsep, customcolumn, logger)
-        # defining which file will receive each HSP depending on the counter number
-        #   the script will write each HSP on its corresponding .txt file
-        # IMPORTANT: the first time this loop runs it will add an empty line ("\n")
-        #            to the first line of the hyp_file.txt
-        if old_id != new_id:
+
+    if engine == "vector":
+        for queries in blast_vector.classify_chunks(result_blast, dbtype, cov, keyword_list, identidade,
+                                                    positividade, customsep, customcolumn):
+            nhyp.write(blast_vector.annotated_lines(queries))
+            all_anot.write(blast_vector.annotation_lines(queries))
+            hyp.write(blast_vector.hypothetical_lines(queries))
+    else:
+        # each query is classified with all its HSPs, then written in its corresponding .txt file
+        for query_id, hsps in iter_queries(result_blast):
+            annots = []
+            classification = []
+            desc_list = []
+            for query in hsps:
+                new_id, desc, fields = get_pattern(query, dbtype, customsep, customcolumn, logger)
+                check_query(fields, cov, keyword_list, identidade, positividade,
+                            classification, annots, desc_list, desc)
             if "non_hypothetical" in ' '.join(classification):
-                nhyp.write(f"{str(old_id)}\t")
+                nhyp.write(f"{str(query_id)}\t")
                 # Sort annotations by bitscore
                 annots.sort()
                 # Get best identity, first position of array
                 nhyp.write(f"{str(annots[0].desc)}\n")
-                all_anot.write(f"{old_id}\t{len(desc_list)} Annotation(s): [{';'.join(desc_list)}]\n")
+                all_anot.write(f"{query_id}\t{len(desc_list)} Annotation(s): [{';'.join(desc_list)}]\n")
             else:
-                hyp.write(f"{str(old_id)}\n")
-            # this just resets the count back to zero, before it starts again
-            classification.clear()
-            annots.clear()
-            desc_list.clear()
-            # check first query of new ID
-            check_query(fields, cov, keyword_list, identidade, positividade, 
-                        classification, annots, desc_list, desc)
-        else:
-            check_query(fields, cov, keyword_list, identidade, positividade, 
-                        classification, annots, desc_list, desc)
-        # saving the information that will be written in the .txt files
-        old_id = new_id
+                hyp.write(f"{str(query_id)}\n")
 
     hyp.close()
     nhyp.close()
     all_anot.close()
 
 
-def process_swiss(basename, protein_seq, swiss_out, identidade, positividade, cov, keyword_list):
+def process_swiss(basename, protein_seq, swiss_out, identidade, positividade, cov, keyword_list, engine="python"):
     # --------------------------Parser ----------------------------------------------------
-    swiss = open(str(swiss_out), "r").read().splitlines()
-
     nhyp = open(f"{str(basename)}_annotated_products.txt", "w")
     swiss_anot = open(f"{str(basename)}_SwissProt_annotations.txt", "w")
-    # temporary adding a line
-    #   so it accounts for the last query found by the BLAST analysis
-    temporary_query(swiss)
-
-    # creating the lists and counter that will be used
-    #   to make sure the script goes through each HSP in every query
-    # it's important that these lists are set back to NULL
-    #   and the counter is set to zero before we start
-    old_id = swiss[0].split("\t")  # recebe a primeira query para começar a contagem
-    old_id = old_id[0]
     nhyp_list = []
-    classification = []
-    desc = []
-    annots = []
 
-    # loop starting and parsing preparation
-    for query in swiss:
-        # split line by \t > separate columns > each line becomes a list
-        line_split = query.split("\t")
-        title = line_split[-1]  # get description
-        title_split = title.split(" ", 1)[-1]  # get last part of description
-        description = title_split.split("OS=")[0].strip().rstrip()  # get only description
-        new_id = line_split[0]
-        # defining which file will receive each HSP depending on the counter number
-        #   the script will write each HSP on its corresponding .txt file
-        # IMPORTANT: the first time this loop runs it will add an empty line ("\n")
-        #            to the first line of the hyp_file.txt
-        if old_id != new_id:
+    if engine == "vector":
+        for queries in blast_vector.classify_chunks(swiss_out, "swissprot", cov, keyword_list,
+                                                    identidade, positividade):
+            nhyp.write(blast_vector.annotated_lines(queries))
+            swiss_anot.write(blast_vector.annotation_lines(queries))
+            nhyp_list.extend(queries.loc[queries["annotated"], "qseqid"])
+    else:
+        # each query is classified with all its HSPs, only annotated ones are written
+        for query_id, hsps in iter_queries(swiss_out):
+            classification = []
+            desc = []
+            annots = []
+            for query in hsps:
+                # split line by \t > separate columns > each line becomes a list
+                line_split = query.split("\t")
+                title = line_split[-1]  # get description
+                title_split = title.split(" ", 1)[-1]  # get last part of description
+                description = title_split.split("OS=")[0].strip().rstrip()  # get only description
+                check_query(line_split, cov, keyword_list, identidade, positividade,
+                            classification, annots, desc, description)
             if "non_hypothetical" in ' '.join(classification):
-                nhyp.write(f"{str(old_id)}\t")
+                nhyp.write(f"{str(query_id)}\t")
                 # Sort annotations by bitscore
                 annots.sort()
                 # Get best identity, first position of array
                 nhyp.write(f"{str(annots[0].desc)}\n")
 
-                nhyp_list.append(str(old_id))
+                nhyp_list.append(str(query_id))
 
-                swiss_anot.write(f"{old_id}\t{len(desc)} Annotation(s): [{';'.join(desc)}]\n")
-
-            desc.clear()
-            classification.clear()
-            annots.clear()
-            # check first query of new ID
-            check_query(line_split, cov, keyword_list, identidade, positividade,
-                        classification, annots, desc, description)
-        else:
-            check_query(line_split, cov, keyword_list, identidade, positividade,
-                        classification, annots, desc, description)
-        # saving the information that will be written in the .txt files
-        old_id = new_id
+                swiss_anot.write(f"{query_id}\t{len(desc)} Annotation(s): [{';'.join(desc)}]\n")
 
     # remove HSPs found by SwissProt from the original fasta_file input
-    fasta = open(str(protein_seq), "r").read().split(">")
-
-    for id_list in nhyp_list:
-        for seq in fasta:
-            if id_list in seq:
-                fasta.remove(seq)
-
-    new_fasta = open(f"{str(basename)}_BLASTp_AA_SwissProted.fasta", "w")
-    new_fasta.write(">".join(fasta))
-    new_fasta.close()
+    filter_records(protein_seq, nhyp_list, f"{str(basename)}_BLASTp_AA_SwissProted.fasta")
     swiss_anot.close()
     nhyp.close()
 
@@ -457,26 +535,27 @@ def no_hit(basename, blast6):
     # Get hit headers
     list_hit = set([line.strip().split()[0] for line in open(blast6, "r")])
 
-    # Get all headers
-    list_all = [
-        line.strip().replace(">", "")
-        for line in open(f"{str(basename)}_BLASTp_AA_SwissProted.fasta", "r")
-        if line.startswith(">")
-    ]
+    # Headers without hits, in fasta order
+    list_all = filter_records(f"{str(basename)}_BLASTp_AA_SwissProted.fasta", list_hit)
 
     no_hit_file = open(f"{str(basename)}_no_hit_products.txt", "w")
-    for annotated in list_hit:
-        if annotated in list_all:
-            list_all.remove(annotated)
     if len(list_all) > 0:
         no_hit_file.write("\n".join(list_all) + "\n")
     no_hit_file.close()
 
     # =========================================================================================
 
-def swiss_run(blastp, arq1, arq2, db, hsps, evalue, logger, threads):
+# Run blast through cache when it was given
+def blast_search(blastp, arq1, arq2, db, hsps, evalue, logger, threads, shards=1, cache=None):
+    if cache is not None:
+        cached_blast(cache, blastp, arq1, arq2, db, hsps, evalue, logger, threads, shards)
+    else:
+        blast(blastp, arq1, arq2, db, hsps, evalue, logger, threads, shards)
+
+
+def swiss_run(blastp, arq1, arq2, db, hsps, evalue, logger, threads, shards=1, cache=None):
     logger.info("Running BLAST against SwissProt")
-    blast(blastp, arq1, arq2, db, hsps, evalue, logger, threads)
+    blast_search(blastp, arq1, arq2, db, hsps, evalue, logger, threads, shards, cache)
     logger.info("Running parser SwissProt")
 
 
@@ -486,30 +565,44 @@ def main():
     args = parser.parse_args()
     # ----------------------- Create LogFile ------------------------------------
     logger = logging.getLogger('Blast')
+    # Hits from previous runs
+    if args.cache is not None:
+        cache = BlastCache(args.cache, args.cache_size * 1024 * 1024)
+    else:
+        cache = None
     #'''---Keywords-------------------------------------------------------------'''
     swiss_out = f"{str(args.basename)}_BLASTp_AAvsSwissProt.outfmt6"
-    swiss_run(blastp=args.blastp, arq1=args.seq, arq2=swiss_out, db=args.spdb, hsps=args.hsps, evalue=args.evalue, logger=logger, threads=args.threads)
+    swiss_run(blastp=args.blastp, arq1=args.seq, arq2=swiss_out, db=args.spdb, hsps=args.hsps, evalue=args.evalue, logger=logger, threads=args.threads, shards=args.shards, cache=cache)
     # defining the keywords that will be used
     #   to separate each HSP found in the BLAST output_file.txt:
-    keyword_list = args.keywords.split(",")
+    keyword_list = KeywordMatcher(args.keywords.split(","))
     # ----------------------Redirect STDOUT and STDERR to logfile--------------
     dbtype, second_db = define_db(args, logger)
     # Run BLAST against swissprotDB
-    process_swiss(args.basename, args.seq, swiss_out, args.id, args.pos, args.cov, keyword_list)
+    process_swiss(args.basename, args.seq, swiss_out, args.id, args.pos, args.cov, keyword_list, args.engine)
     # Secondary database
     odb_out_name = f"{str(args.basename)}_BLASTp_AAvsSpecifiedDB.outfmt6"
     logger.info(f"Running BLAST against {dbtype}")
-    blast(blastp=args.blastp, arq1=f"{args.basename}_BLASTp_AA_SwissProted.fasta", arq2=odb_out_name, db=second_db, hsps=args.hsps, evalue=args.evalue, logger=logger, threads=args.threads)
+    blast_search(blastp=args.blastp, arq1=f"{args.basename}_BLASTp_AA_SwissProted.fasta", arq2=odb_out_name, db=second_db, hsps=args.hsps, evalue=args.evalue, logger=logger, threads=args.threads, shards=args.shards, cache=cache)
+    if cache is not None:
+        cache.close()
     # check file for secondary database
     # -----------------------------
     check_file(odb_out_name, logger)
     # ------------------------------
     logger.info(f"Running parser {dbtype}")
-    parser_blast(basename=args.basename, result_blast=odb_out_name, identidade=args.id, positividade=args.pos, cov=args.cov,dbtype=dbtype,keyword_list=keyword_list, customsep=args.customsep, customcolumn=args.customcolumn)
+    parser_blast(basename=args.basename, result_blast=odb_out_name, identidade=args.id, positividade=args.pos, cov=args.cov,dbtype=dbtype,keyword_list=keyword_list, customsep=args.customsep, customcolumn=args.customcolumn, engine=args.engine)
     logger.info("Parser blast done")
     # -------------No hit-----------
     logger.info(f"Identifying proteins with no hits in Swissprot and {dbtype} databases")
     no_hit(str(args.basename), odb_out_name)
+    # -------------Duplicates-------
+    members = load_members(args.duplicates)
+    if members:
+        logger.info("Copying results of representatives to identical sequences")
+        for products in ("annotated_products", "hypothetical_products", "no_hit_products",
+                         "SwissProt_annotations", "SpecifiedDB_annotations"):
+            expand_file(f"{str(args.basename)}_{products}.txt", members)
     # ------------------------------
     logger.info("Blastp_parser is Finished")
 
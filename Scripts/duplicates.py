@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+####################################################
+###   IDENTICAL PROTEINS ARE ANNOTATED ONCE, ONE ###
+###   REPRESENTATIVE GOES TO BLAST, INTERPRO,    ###
+###   HMMER AND RPSBLAST, RESULTS ARE COPIED TO  ###
+###   THE OTHER IDS (MEMBERS) AFTERWARDS         ###
+####################################################
+
+import hashlib
+import os
+import pathlib
+
+from Scripts.fasta_utils import iter_fasta
+
+
+# Write first record of each sequence to unique_file and "representative\tmember" lines to members_file
+#   returns (number of records, number of unique sequences)
+def collapse_duplicates(fasta_file, unique_file, members_file):
+    # Digest instead of sequence as key, keeps memory low for big proteomes
+    representatives = {}
+    records = 0
+    with open(str(unique_file), "w") as unique, open(str(members_file), "w") as members:
+        for header, sequence in iter_fasta(fasta_file):
+            records += 1
+            seq_id = header.split()[0] if header.split() else ""
+            digest = hashlib.sha256(sequence.upper().encode()).digest()
+            if digest in representatives:
+                members.write(f"{representatives[digest]}\t{seq_id}\n")
+            else:
+                representatives[digest] = seq_id
+                unique.write(f">{header}\n{sequence}\n")
+    return records, len(representatives)
+
+
+# Load members file as {representative: [member, ...]}
+def load_members(members_file):
+    members = {}
+    if members_file is None:
+        return members
+    with open(str(members_file), "r") as pairs:
+        for pair in pairs:
+            pair = pair.rstrip("\n")
+            if pair:
+                representative, member = pair.split("\t")[:2]
+                members.setdefault(representative, []).append(member)
+    return members
+
+
+# Copy lines of representatives to their members, ID is taken from column (tab separated)
+#   consecutive lines of one ID are copied together, so each ID stays grouped
+def expand_file(table_file, members, column=0):
+    if not members or not os.path.isfile(str(table_file)):
+        return
+
+    def key(line):
+        fields = line.rstrip("\n").split("\t")
+        return fields[column] if len(fields) > column else None
+
+    def write_block(output, block):
+        output.writelines(block)
+        for member in members.get(key(block[0]), []):
+            for line in block:
+                fields = line.rstrip("\n").split("\t")
+                fields[column] = member
+                output.write("\t".join(fields) + "\n")
+
+    temp_file = pathlib.Path(f"{table_file}.tmp")
+    with open(str(table_file), "r") as table, open(str(temp_file), "w") as output:
+        block = []
+        for line in table:
+            if not line.endswith("\n"):
+                line += "\n"
+            if block and key(line) != key(block[0]):
+                write_block(output, block)
+                block = []
+            block.append(line)
+        if block:
+            write_block(output, block)
+    os.replace(str(temp_file), str(table_file))
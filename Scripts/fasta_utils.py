@@ -0,0 +1,187 @@
+#!/usr/bin/python3
+
+####################################################
+###         FASTA HELPERS SHARED BY SCRIPTS      ###
+####################################################
+
+import os
+import pathlib
+import threading
+
+
+# Read fasta file one record at a time, returning (header, sequence) without ">"
+def iter_fasta(fasta_file):
+    header = None
+    sequence = []
+    with open(str(fasta_file), "r") as fasta:
+        for line in fasta:
+            line = line.rstrip("\r\n")
+            if line.startswith(">"):
+                if header is not None:
+                    yield header, "".join(sequence)
+                header = line[1:]
+                sequence = []
+            elif header is not None:
+                sequence.append(line.strip())
+    if header is not None:
+        yield header, "".join(sequence)
+
+
+# Copy fasta without records whose id (first word of header) is in exclude_ids
+#   lines are copied as they are, one at a time; returns headers of kept records
+def filter_records(fasta_file, exclude_ids, output_file=None):
+    exclude_ids = set(exclude_ids)
+    kept = []
+    keep = True
+    output = open(str(output_file), "w") if output_file is not None else None
+    try:
+        with open(str(fasta_file), "r") as fasta:
+            for line in fasta:
+                if line.startswith(">"):
+                    header = line[1:].strip()
+                    keep = (header.split()[0] if header else "") not in exclude_ids
+                    if keep:
+                        kept.append(header)
+                if keep and output is not None:
+                    output.write(line)
+    finally:
+        if output is not None:
+            output.close()
+    return kept
+
+
+# Split fasta in consecutive shards with almost the same number of residues
+#   shards keep the original order, so concatenating shard results gives
+#   the same order as running the whole file at once
+def split_fasta(fasta_file, shards, prefix):
+    lengths = [len(sequence) for header, sequence in iter_fasta(fasta_file)]
+    if not lengths:
+        return []
+    shards = max(1, min(int(shards), len(lengths)))
+    total = sum(lengths)
+    shard_files = []
+    output = None
+    residues = 0
+    for index, (header, sequence) in enumerate(iter_fasta(fasta_file)):
+        # Open next shard when this one reached its share of residues,
+        # but leave at least one record to each remaining shard
+        remaining_records = len(lengths) - index
+        remaining_shards = shards - len(shard_files)
+        if output is None or (
+            remaining_shards > 0
+            and (residues >= total * len(shard_files) / shards or remaining_records <= remaining_shards)
+        ):
+            if output is not None:
+                output.close()
+            shard_files.append(pathlib.Path(f"{prefix}_{len(shard_files) + 1}.fasta"))
+            output = open(str(shard_files[-1]), "w")
+        output.write(f">{header}\n{sequence}\n")
+        residues += len(sequence)
+    output.close()
+    return shard_files
+
+
+# ----------------------------- FASTA index ------------------------------------
+# Same layout as samtools faidx (.fai):
+#   name  sequence length  offset of first base  bases per line  bytes per line
+
+# Create index for fasta file, reading it once
+#   index_file defaults to <fasta_file>.fai
+def build_faidx(fasta_file, index_file=None):
+    fasta_file = pathlib.Path(fasta_file)
+    entries = []
+    names = set()
+    name = None
+    length = offset = line_bases = line_width = 0
+    short_line = False
+
+    def close_record():
+        if name is not None and name not in names:
+            names.add(name)
+            entries.append(f"{name}\t{length}\t{offset}\t{line_bases}\t{line_width}\n")
+
+    position = 0
+    with open(str(fasta_file), "rb") as fasta:
+        for line in fasta:
+            if line.startswith(b">"):
+                close_record()
+                header = line[1:].decode().split()
+                name = header[0] if header else ""
+                length = line_bases = line_width = 0
+                offset = position + len(line)
+                short_line = False
+            elif name is not None:
+                bases = len(line.rstrip(b"\r\n"))
+                if bases > 0:
+                    # Only the last line of a record can be shorter than the others
+                    if short_line or (line_bases and bases > line_bases):
+                        raise ValueError(f"Different line lengths in record {name} of {fasta_file}, "
+                                         "rewrite it with the same line length to index")
+                    if line_bases == 0:
+                        line_bases = bases
+                        line_width = len(line)
+                    elif bases < line_bases:
+                        short_line = True
+                    length += bases
+            position += len(line)
+        close_record()
+
+    # Write in a temporary file first, two stages can index the same file at once
+    index = pathlib.Path(index_file or f"{fasta_file}.fai")
+    temp_index = pathlib.Path(f"{index}.{os.getpid()}.{threading.get_ident()}.tmp")
+    with open(str(temp_index), "w") as output:
+        output.writelines(entries)
+    os.replace(str(temp_index), str(index))
+    return index
+
+
+# Load index as {name: (length, offset, line_bases, line_width)}, (re)creating it when needed
+def load_faidx(fasta_file, index_file=None):
+    index = pathlib.Path(index_file or f"{fasta_file}.fai")
+    if not index.is_file() or index.stat().st_mtime < pathlib.Path(fasta_file).stat().st_mtime:
+        build_faidx(fasta_file, index)
+    faidx = {}
+    with open(str(index), "r") as entries:
+        for entry in entries:
+            name, length, offset, line_bases, line_width = entry.rstrip("\n").split("\t")[:5]
+            faidx[name] = (int(length), int(offset), int(line_bases), int(line_width))
+    return faidx
+
+
+# Number of bytes used by a sequence with this length, counting line breaks
+def _sequence_bytes(length, line_bases, line_width):
+    if length == 0:
+        return 0
+    full_lines, rest = divmod(length, line_bases)
+    return full_lines * line_width + rest
+
+
+# Write records with exactly these ids, in the same order as the fasta file
+#   returns how many records were written
+def fetch_records(fasta_file, id_list, output_file, faidx=None):
+    if faidx is None:
+        faidx = load_faidx(fasta_file)
+    wanted = sorted((faidx[name][1], name) for name in set(id_list) if name in faidx)
+    with open(str(fasta_file), "rb") as fasta, open(str(output_file), "wb") as output:
+        for offset, name in wanted:
+            length, offset, line_bases, line_width = faidx[name]
+            fasta.seek(offset)
+            sequence = fasta.read(_sequence_bytes(length, line_bases, line_width))
+            output.write(b">" + name.encode() + b"\n" + sequence)
+            if sequence and not sequence.endswith(b"\n"):
+                output.write(b"\n")
+    return len(wanted)
+
+
+# Read bases start..end (1-based, inclusive) of one sequence from an open binary fasta
+#   only this slice is read, whole sequence is never loaded
+def fetch_sequence(fasta, faidx, name, start, end):
+    length, offset, line_bases, line_width = faidx[name]
+    start = max(1, int(start))
+    end = min(int(end), length)
+    if end < start:
+        return ""
+    first = offset + (start - 1) // line_bases * line_width + (start - 1) % line_bases
+    last = offset + (end - 1) // line_bases * line_width + (end - 1) % line_bases
+    fasta.seek(first)
+    return fasta.read(last - first + 1).replace(b"\n", b"").replace(b"\r", b"").decode()
@@ -1,11 +1,15 @@
 #!/usr/bin/python3
 
-import re
 import logging
 import os
 import argparse
 import sys
 
+from Scripts.duplicates import expand_file, load_members
+from Scripts.hmmer_runner import iter_tblout
+from Scripts.interpro_index import interpro_matches, open_index
+from Scripts.sort_utils import sort_file
+
 def cli():
     # ---------------Parser arguments ----------------
     parser = argparse.ArgumentParser(
@@ -59,6 +63,19 @@ def cli():
         required=True
     )
 
+    optionalNamed.add_argument(
+        '-ipr_index', dest='ipr_index',
+        metavar='[InterProScan_index.sqlite]', default=None,
+        help='InterProScan outputs indexed by interpro_index.py, without it gff3 files are read'
+    )
+
+    optionalNamed.add_argument(
+        '-dup', dest='duplicates',
+        metavar='[duplicates.tsv]', default=None,
+        help=('representative and member IDs of identical sequences (tab separated).'
+            + ' Results of each representative are copied to its members')
+    )
+
     # custom [--help] argument
     optionalNamed.add_argument(
         '-h', '-help', '--help',
@@ -108,70 +125,22 @@ sys.stderr = sl
 # --------------------------------------------------------------------------
 
 
-def parser_interproscan(arq_entrada, arq_ipr, arq_saida):
-    entrada = open(str(arq_entrada), "r").read().split("##FASTA")  # SPLITTING THE GFF3 FILE IN TWO CATEGORIES
-    interp = entrada[0].split("##sequence-region")  # WE'LL BE USING ONLY THE FIRST PART OF THE GFF3 OUTPUT FILE
-    del interp[0]
+def parser_interproscan(index, source, arq_ipr, arq_saida):
     ipr = open(str(arq_ipr), "a")
     output = open(str(arq_saida), "a")
 
-    db_list = ["Coils", "Gene3D", "MobiDBLite"]
-
-    # TREATING EACH QUERY, RETRIEVING THE INFORMATION THAT WILL BE WRITTEN ON THE FIRST OUTPUT FILE
-    for seq_reg in interp:
-        seq_reg = seq_reg.splitlines()
-        for linha in seq_reg:
-            if linha == seq_reg[0]:
-                linha = linha.split(" ")
-                del linha[0]
-            elif linha == seq_reg[1]:  # IGNORING THE FIRST LINE ON EACH GROUP OF QUERIES, AS IT'S NON-INFORMATIVE
-                pass
-            else:
-                ontology = str(None)
-                anotation_db = str(None)
-                name = str(None)
-                interpro = str(None)
-                linha = linha.split("\t")
-                name_subject = linha[0]
-                db = linha[1]
-                if not any(unwanted in db for unwanted in db_list):
-                    correct_db = db
-                    anotation = linha[-1].split(";")
-                    for query in anotation:
-                        if "Ontology" in query:
-                            ontology = query.replace('"', "").replace("Ontology_term=", "")
-                        if "signature_" in query:
-                            anotation_db = query.replace("signature_desc=", "")
-                        if "Name" in query:
-                            name = query.replace('"', "").replace("Name=", "")
-                        if "Dbxref" in query:
-                            interpro = query.replace('"', "").replace("Dbxref=", "")
-                    ipr.write(f"{name_subject}\t{correct_db}\t{name}\t{anotation_db}\t{interpro}\t{ontology}\n")
-                    output.write(f"{name_subject}\t{correct_db}\t{name}\t{anotation_db}\t{interpro}\t{ontology}\n")
+    # Matches of Coils, Gene3D and MobiDBLite are not in index queries
+    for name_subject, correct_db, evalue, name, anotation_db, interpro, ontology in interpro_matches(index, source):
+        ipr.write(f"{name_subject}\t{correct_db}\t{name}\t{anotation_db}\t{interpro}\t{ontology}\n")
+        output.write(f"{name_subject}\t{correct_db}\t{name}\t{anotation_db}\t{interpro}\t{ontology}\n")
     output.close()
     ipr.close()
 
 
-def pfam_format(arq_entrada, arq_saida):
-    input = open(str(arq_entrada), "r").read().splitlines()
-    output = open(str(arq_saida), "w")
-    del input[0:3] 
-    del input[-10:]  
-    for line in input:
-        line = re.sub(r'\s+', ' ', line).split(" ")  
-        aux = " ".join(line[18:]) 
-        del line[18:]  
-        line.append(aux) 
-        output.write("\t".join(line) + "\n")
-    output.close()
-
-
+# Read hmmscan --tblout in one pass, hits are written straight to grouped records
 def parser_pfam(arq_entrada, arq_saida):
-    input = open(str(arq_entrada), "r").read().splitlines()
     output = open(str(arq_saida), "a")
-    for line in input:
-        line = line.strip()
-        line = line.split("\t")
+    for line in iter_tblout(arq_entrada):
         query = line[2]
         db = "Pfam"  # ESPECIFICALLY WRITING THIS, AS THERE ARE NO OTHER DBs ON THIS PART OF THE ANALYSIS
         ontologia = str(None)
@@ -200,15 +169,9 @@ def parser_rpsblast(arq_entrada, arq_rps, arq_saida):
     rps.close()
 
 
+# Sort grouped records in bounded memory (runs in temporary files), header first
 def sort_arq(arq_entrada, arq_saida):
-    hits = open(str(arq_entrada), "r")
-    ordered = open(str(arq_saida), "w")
-    ordered.write("ID\tDB\tDB_ACCESS\tDESCRIPTION\tIPR\tGO\n")
-    lines = hits.readlines()
-    lines.sort()
-    for line in lines:
-        ordered.write(str(line))
-    ordered.close()
+    sort_file(arq_entrada, arq_saida, header="ID\tDB\tDB_ACCESS\tDESCRIPTION\tIPR\tGO\n")
 
 
 def main():
@@ -216,25 +179,33 @@ def main():
     # arguments saved here
     args = parser.parse_args()
     logger = logging.getLogger('Functional Annotation')
+    # Both InterProScan outputs, read only once
+    index = open_index(args.ipr_index, {"annotated": args.ipr_annot, "hypothetical": args.ipr_hyp})
     # ------------ Hipothetical ---------------------------------------
     # Parse interproscan file
-    parser_interproscan(args.ipr_hyp, f"InterProScan_Out_{args.basename}.tsv", f"Temp_{args.basename}.tsv")
+    parser_interproscan(index, "hypothetical", f"InterProScan_Out_{args.basename}.tsv", f"Temp_{args.basename}.tsv")
     logger.info("InterProScan parser done")
     # Parse HMMer file
-    pfam_format(args.hmm, f"Hmmscan_Out_{args.basename}.tsv")
-    logger.info("Hmmscan format done")
-    parser_pfam(f"Hmmscan_Out_{args.basename}.tsv", f"Temp_{args.basename}.tsv")
+    parser_pfam(args.hmm, f"Temp_{args.basename}.tsv")
     logger.info("Hmmscan parser done")
     # Parse RPSblast file
     parser_rpsblast(args.rpsblast, f"RPSblast_Out_{args.basename}.tsv", f"Temp_{args.basename}.tsv")
     logger.info("RPSblast parser done")
+    # Identical sequences were searched only once
+    members = load_members(args.duplicates)
+    if members:
+        expand_file(f"Temp_{args.basename}.tsv", members)
+        expand_file(f"RPSblast_Out_{args.basename}.tsv", members)
+        logger.info("Results copied to identical sequences")
     # Group and sort 
     sort_arq(f"Temp_{args.basename}.tsv", f"{args.basename}_Grouped_Hypothetical_Information.tsv")
     logger.info("Sorting queryes in files")
 
     # ------------ Annotated -----------------------------------------
     # Save annotated proteins in Interpro_Out
-    parser_interproscan(args.ipr_annot, f"InterProScan_Out_{args.basename}.tsv", f"Temp_{args.basename}.tsv")
+    parser_interproscan(index, "annotated", f"InterProScan_Out_{args.basename}.tsv", f"Temp_{args.basename}.tsv")
+    index.close()
+    expand_file(f"InterProScan_Out_{args.basename}.tsv", members)
     # Cleaning the house
     os.system(f"rm Temp_{args.basename}.tsv")
     logger.info("Temporary file removed")
@@ -0,0 +1,178 @@
+#!/usr/bin/python3
+
+####################################################
+###   STREAMING GFF: TRANSCRIPT INDEX AND        ###
+###   ANNOTATED ATTRIBUTES, ONE GENE AT A TIME   ###
+###   (AUGUSTUS GTF-LIKE OUTPUT AND ANY GFF3)    ###
+####################################################
+
+import re
+import sys
+
+# Features annotated with protein descriptions
+TRANSCRIPT_TYPES = ("transcript", "mRNA")
+# Features starting a gene when the gff has no AUGUSTUS comments
+GENE_TYPES = ("gene", "pseudogene")
+# AUGUSTUS writes each gene between "# start gene <name>" and "# end gene <name>"
+GENE_START = "# start gene "
+
+# Characters with special meaning in gff3 attribute values (column 9)
+_ESCAPE = {character: f"%{ord(character):02X}" for character in "%;=&,\t\n\r"}
+
+
+# ID of a feature: ID of gff3 attributes, or the attribute column itself for AUGUSTUS
+#   transcripts ("g1.t1"); None for gff3 features with no ID
+def feature_id(attributes):
+    attributes = attributes.strip()
+    if "=" not in attributes:
+        if ";" in attributes:
+            attributes = attributes[:attributes.index(";")].strip()
+        return attributes or None
+    match = re.search(r'(?:^|;)\s*ID=([^;]+)', attributes)
+    return match.group(1).strip() if match else None
+
+
+# Keep location of transcripts in index: {id: (seqid, start, end, strand, offset of its line)}
+#   first line of each transcript is kept; seqid and strand are shared strings, start and end numbers
+def index_transcripts(records, index):
+    for offset, line, fields in records:
+        if fields is not None and fields[2] in TRANSCRIPT_TYPES:
+            transcript_id = feature_id(fields[8])
+            if transcript_id is not None and transcript_id not in index:
+                index[transcript_id] = (sys.intern(fields[0]), int(fields[3]), int(fields[4]),
+                                        sys.intern(fields[6]), offset)
+    return index
+
+
+# Tab before the feature type of a transcript line, zero width after the tab so a line is never skipped
+_TRANSCRIPT_TYPE = re.compile(rb"\t(?=" + b"|".join(feature.encode() + b"\t" for feature in TRANSCRIPT_TYPES) + rb")")
+# Bytes read at a time by transcript_index()
+BLOCK_SIZE = 1 << 24
+
+
+# Location of each transcript of gff, read in blocks keeping only the index (same values as index_transcripts())
+#   blocks are searched for transcript types, only lines found are split and decoded;
+#   with wanted (set or dict of ids), other transcripts are left out of the index
+def transcript_index(gff, wanted=None):
+    index = {}
+    base = 0
+    rest = b""
+    with open(str(gff), "rb") as lines:
+        while True:
+            data = lines.read(BLOCK_SIZE)
+            block = rest + data
+            # Block ends at its last complete line, the rest goes to the next one
+            #   (a last line with no line end is read alone at the end of file)
+            if data:
+                cut = block.rfind(b"\n") + 1
+                block, rest = block[:cut], block[cut:]
+            # Sequences after "##FASTA" are not searched
+            fasta = 0 if block.startswith(b"##FASTA") else block.find(b"\n##FASTA")
+            for match in _TRANSCRIPT_TYPE.finditer(block, 0, len(block) if fasta == -1 else fasta):
+                line_start = block.rfind(b"\n", 0, match.start()) + 1
+                # Type must be the third column of a feature line
+                if block.startswith(b"#", line_start) or block.count(b"\t", line_start, match.start()) != 1:
+                    continue
+                line_end = block.find(b"\n", match.end())
+                fields = block[line_start:line_end if line_end != -1 else len(block)].decode().rstrip("\r\n").split("\t")
+                if len(fields) < 9:
+                    continue
+                transcript_id = feature_id(fields[8])
+                if transcript_id is None or transcript_id in index or (wanted is not None and transcript_id not in wanted):
+                    continue
+                index[transcript_id] = (sys.intern(fields[0]), int(fields[3]), int(fields[4]),
+                                        sys.intern(fields[6]), base + line_start)
+            if fasta != -1 or not data:
+                break
+            base += len(block)
+    return index
+
+
+# Attribute column with an annotation: AUGUSTUS transcript ids are replaced by it,
+#   gff3 attributes keep their values and get it as product
+def annotated_attributes(attributes, description):
+    description = description.rstrip("\r\n")
+    if "=" not in attributes:
+        return description
+    kept = [attribute for attribute in attributes.strip().rstrip(";").split(";")
+            if attribute.strip() and not attribute.strip().startswith("product=")]
+    product = "".join(_ESCAPE.get(character, character) for character in description)
+    return ";".join(kept + [f"product={product}"])
+
+
+# Write gff with annotations of descriptions ({transcript id: description}), one gene at a time
+#   a gene starts at "# start gene" comment (AUGUSTUS) or at a top level feature (gene, or gff3
+#   feature without Parent) and goes until the next one, with comments after it ("# end gene", "###");
+#   "##" directives and lines before the first gene are written as they are, lines after "##FASTA" too;
+#   genes with transcripts, but none annotated, are not written; transcripts of genes are kept in index when given
+#   lines are handled as bytes, only transcript lines are decoded
+def annotate_gff(gff, descriptions, output, index=None):
+    gene_start = GENE_START.encode()
+    gene_types = tuple(feature.encode() for feature in GENE_TYPES)
+    transcript_types = tuple(feature.encode() for feature in TRANSCRIPT_TYPES)
+    block = []
+    # Position in block and (offset, line, fields) of transcript lines
+    transcripts = []
+    is_gene = False
+    has_feature = False
+    in_fasta = False
+    offset = 0
+
+    with open(str(gff), "rb") as lines, open(str(output), "wb") as annotated_gff:
+        def write_block():
+            if not is_gene:
+                annotated_gff.write(b"".join(block))
+                return
+            records = [(line_offset, line, line.decode().rstrip("\r\n").split("\t"))
+                       for position, (line_offset, line) in transcripts]
+            if index is not None:
+                index_transcripts(records, index)
+            annotated = False
+            for (position, record), (line_offset, line, fields) in zip(transcripts, records):
+                transcript_id = feature_id(fields[8])
+                if transcript_id in descriptions:
+                    annotated = True
+                    block[position] = ("\t".join(fields[0:-1] + [annotated_attributes(fields[-1], descriptions[transcript_id])])
+                                       + "\n").encode()
+            if annotated or not transcripts:
+                annotated_gff.write(b"".join(block))
+
+        for line in lines:
+            # Comments (35 is "#"), blank lines and sequences after "##FASTA" have no fields
+            if line[0] == 35 or in_fasta or line.isspace():
+                if line.startswith(gene_start):
+                    if block:
+                        write_block()
+                    block = []
+                    transcripts = []
+                    is_gene = True
+                    has_feature = False
+                elif line.startswith(b"##") and not line.startswith(b"###"):
+                    in_fasta = in_fasta or line.startswith(b"##FASTA")
+                    if block:
+                        write_block()
+                    annotated_gff.write(line)
+                    block = []
+                    transcripts = []
+                    is_gene = False
+                    has_feature = False
+                    offset += len(line)
+                    continue
+            else:
+                fields = line.rstrip(b"\r\n").split(b"\t")
+                if len(fields) >= 9:
+                    if (has_feature or not is_gene) and (fields[2] in gene_types
+                                                         or (b"=" in fields[8] and b"Parent=" not in fields[8])):
+                        if block:
+                            write_block()
+                        block = []
+                        transcripts = []
+                        is_gene = True
+                    has_feature = True
+                    if fields[2] in transcript_types:
+                        transcripts.append((len(block), (offset, line)))
+            block.append(line)
+            offset += len(line)
+        if block:
+            write_block()
+    return index
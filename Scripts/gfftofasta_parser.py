@@ -2,9 +2,11 @@
 
 import argparse
 import warnings
-import re
 import sys
 
+from Scripts.annotation_emitter import load_annotations, write_proteins
+from Scripts.gff_utils import transcript_index
+
 def cli():
     parser = argparse.ArgumentParser(
         add_help=False,  # removes original [--help]
@@ -25,7 +27,7 @@ def cli():
     requiredNamed.add_argument(
         '-gff', dest='gff',
         metavar='[augustus_prediction.gff]',
-        help='Augustus prediction file',
+        help='Augustus prediction file (or any gff3, with mRNA/transcript IDs of proteins)',
         required=True
     )
 
@@ -73,73 +75,27 @@ def main():
     # arguments saved here
     args = parser.parse_args()
 
-    # Info from transcript products will be stored here
-    trans = {}
-    # Info from annotation will be stored here
-    ant = {}
-
-    # ============================= Extract info from gff =========================
-    gff = open(str(args.gff), "r").read().split("# start gene ")
-    # Delete header with information of model and other blablabla
-    del gff[0]
-
-    for gene in gff:
-        gene = gene.split("\n")
-        gene_features = gene[2].split()
-        # use regex to remove ID= and ;PARENT from annotation ID in gff AUGUSTUS output
-        id_store =  re.sub(r';.*', '', gene_features[-1])
-        id_store =  re.sub(r'.*=', '', id_store )
-        trans[id_store] = {"scaff": str(gene_features[0]), "start": str(gene_features[3]),
-                                    "end": str(gene_features[4]), "strand": str(gene_features[6])}
-
     # ============================= Extract annotations ==========================
+    ant = load_annotations(args.annot)
 
-    annot = open(str(args.annot)).read().splitlines()
-    for line in annot:
-        line = line.split("\t")
-        ant[line[0]] = line[1]
-
-    fasta = open(str(args.seqs), "r").read().split(">")
-    del fasta[0]  # remove empty value
+    # ============================= Extract info from gff =========================
+    # Location of annotated transcripts, gff is read in blocks (AUGUSTUS or gff3)
+    trans = transcript_index(args.gff, ant)
 
     # ============== Write fasta file with new header ==========================
 
     # Remove quotes from organism 
     organism = str(args.org).replace("\"", "").replace("\'", "")
 
-    # annotafile = open("AnnotaPipeline_" + str(args.basename) + ".fasta", "w")
-    with open(f"AnnotaPipeline_{str(args.basename)}_proteins.fasta", "w") as annotafile:
-        ids_warn = []  # store ids with no annotation
-        for sequence in fasta:
-            sequence = sequence.split("\n")
-            id = sequence[0]
-            try:
-                annotafile.write(
-                    f">{str(id)} | "
-                    f"Organism: {organism} | "
-                    f"Location: {str(trans[id]['scaff'])} | "
-                    f"Start: {str(trans[id]['start'])} | "
-                    f"End: {str(trans[id]['end'])} | "
-                    f"Strand: {str(trans[id]['strand'])} | "
-                    f"Description: {str(ant[id])}\n"
-                )
-                annotafile.write(str("\n".join(sequence[1:])))
-            except Exception as warn:
-                print(warn)
-                # warn ignored, user will be informed all at once
-                ids_warn.append(id)
-                pass
-
-    # annotafile.close()
+    # Proteins are read one line at a time, ids with no annotation are written as they are found
+    headers, ids_warn = write_proteins(args.seqs, f"AnnotaPipeline_{str(args.basename)}_proteins.fasta",
+                                       trans, ant, organism, f"{str(args.basename)}_ids_with_no_annotations.txt",
+                                       keep_headers=False)
 
     # =============== Warning message, if something goes wrong =====================
 
-    if len(ids_warn) > 0:
+    if ids_warn > 0:
         warnings.warn("WARNING: Not all sequences from fasta file were in annotation file", stacklevel=2)
-        warn_seq = open(f"{str(args.basename)}_ids_with_no_annotations.txt", "w")
-        for a in ids_warn:
-            warn_seq.write(str(a) + "\n")
-        warn_seq.close()
         warnings.warn("INFO: IDs stored in ids_with_no_annotations.txt", stacklevel=2)
 
 
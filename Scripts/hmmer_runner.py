@@ -0,0 +1,211 @@
+#!/usr/bin/python3
+
+####################################################
+###   HMMER ENGINE: HMMSCAN IN SHARDS OR ONE     ###
+###   HMMSEARCH FOR BIG QUERY SETS, RESULTS IN   ###
+###   THE SAME HMMSCAN --tblout TABLE            ###
+####################################################
+
+import hashlib
+import logging
+import os
+import pathlib
+import shutil
+import subprocess
+
+from Scripts.fasta_utils import iter_fasta
+from Scripts.shard_runner import run_sharded, threads_per_shard
+
+# Files written by hmmpress, hmmscan needs all of them
+PRESS_SUFFIXES = (".h3f", ".h3i", ".h3m", ".h3p")
+
+# --tblout lines have 18 fields separated by spaces and a description (it may have spaces)
+TBLOUT_FIELDS = 18
+
+
+# Profile database is pressed when every hmmpress file exists and is newer than it
+def is_pressed(hmm_db):
+    hmm_db = pathlib.Path(hmm_db)
+    pressed = [pathlib.Path(f"{hmm_db}{suffix}") for suffix in PRESS_SUFFIXES]
+    return all(press.is_file() and press.stat().st_mtime >= hmm_db.stat().st_mtime for press in pressed)
+
+
+# Directory in cache_dir for one profile database (path, size and date), it keeps pressed files
+#   and the profile table, so they are made once for each database version
+def _db_cache(hmm_db, cache_dir):
+    hmm_db = pathlib.Path(hmm_db).absolute()
+    stat = hmm_db.stat()
+    key = hashlib.sha256(f"{hmm_db}|{stat.st_size}|{stat.st_mtime}".encode()).hexdigest()[:16]
+    return pathlib.Path(cache_dir) / f"{hmm_db.name}_{key}"
+
+
+# Pressed profile database for hmmscan: hmm_db itself when pressed, else a copy pressed in cache_dir
+def pressed_db(hmm_db, cache_dir, logger=None):
+    if logger is None:
+        logger = logging.getLogger('HMMSCAN')
+    if is_pressed(hmm_db):
+        return pathlib.Path(hmm_db)
+    db_dir = _db_cache(hmm_db, cache_dir)
+    cached_db = db_dir / pathlib.Path(hmm_db).name
+    if is_pressed(cached_db):
+        logger.info(f"Using pressed {pathlib.Path(hmm_db).name} from {db_dir}")
+        return cached_db
+    logger.info(f"{hmm_db} is not pressed, running hmmpress in {db_dir}")
+    # Press in a temporary directory first, cached database is complete or missing
+    temp_dir = pathlib.Path(f"{db_dir}.{os.getpid()}.tmp")
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    temp_dir.mkdir(parents=True)
+    (temp_dir / cached_db.name).symlink_to(pathlib.Path(hmm_db).absolute())
+    result = subprocess.run(f"hmmpress -f {temp_dir / cached_db.name}", shell=True, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, universal_newlines=True)
+    if result.returncode != 0:
+        logger.debug(result.stdout)
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        raise RuntimeError(f"hmmpress exited with code {result.returncode} for {hmm_db}")
+    if db_dir.exists():
+        # Another run pressed it first
+        shutil.rmtree(temp_dir, ignore_errors=True)
+    else:
+        os.replace(str(temp_dir), str(db_dir))
+    return cached_db
+
+
+# Number of profiles and {profile name: description} of hmm_db, read once and kept in cache_dir
+def profile_table(hmm_db, cache_dir):
+    table = _db_cache(hmm_db, cache_dir) / "profiles.tsv"
+    if not table.is_file():
+        table.parent.mkdir(parents=True, exist_ok=True)
+        temp_table = pathlib.Path(f"{table}.{os.getpid()}.tmp")
+        with open(str(hmm_db), "r") as hmm, open(str(temp_table), "w") as output:
+            name = None
+            description = "-"
+            for line in hmm:
+                if line.startswith("NAME "):
+                    name = line[5:].strip()
+                    description = "-"
+                elif line.startswith("DESC "):
+                    description = line[5:].strip()
+                elif line.startswith("//") and name is not None:
+                    output.write(f"{name}\t{description}\n")
+                    name = None
+        os.replace(str(temp_table), str(table))
+    descriptions = {}
+    profiles = 0
+    with open(str(table), "r") as lines:
+        for line in lines:
+            name, description = line.rstrip("\n").split("\t", 1)
+            descriptions[name] = description
+            profiles += 1
+    return profiles, descriptions
+
+
+# Read --tblout one hit at a time, as 18 fields and description; "#" lines are comments
+#   header and footer size change between HMMER versions, so they are not counted
+def iter_tblout(tblout):
+    with open(str(tblout), "r") as table:
+        for line in table:
+            if line.startswith("#") or not line.strip():
+                continue
+            fields = line.split(None, TBLOUT_FIELDS)
+            fields += [""] * (TBLOUT_FIELDS + 1 - len(fields))
+            fields[-1] = " ".join(fields[-1].split())
+            yield fields
+
+
+# Comment lines of a --tblout as (header, footer): header ends with the "#---" column ruler
+def _tblout_comments(tblout):
+    header = []
+    footer = []
+    with open(str(tblout), "r") as table:
+        for line in table:
+            if not line.startswith("#"):
+                continue
+            if footer or (header and header[-1].startswith("#-")):
+                footer.append(line)
+            else:
+                header.append(line)
+    return header, footer
+
+
+# Join --tblout files of hmmscan shards: header and footer of the first one, hits of all in order
+def merge_tblout(parts, output):
+    header, footer = _tblout_comments(parts[0]) if parts else ([], [])
+    with open(str(output), "w") as merged:
+        merged.writelines(header)
+        for part in parts:
+            with open(str(part), "r") as table:
+                merged.writelines(line for line in table if not line.startswith("#"))
+        merged.writelines(footer)
+
+
+# Rewrite hmmsearch --tblout as hmmscan would write it
+#   hmmsearch lines are (protein, -, profile, accession, ...), hmmscan lines are (profile, accession,
+#   protein, -, ...) with profile description; hits are grouped by protein in fasta order, best score first
+def hmmsearch_to_tblout(tblout, output, query_fasta, descriptions):
+    order = {}
+    for header, sequence in iter_fasta(query_fasta):
+        order.setdefault(header.split()[0] if header.split() else "", len(order))
+    hits = []
+    for fields in iter_tblout(tblout):
+        fields[0], fields[1], fields[2], fields[3] = fields[2], fields[3], fields[0], fields[1]
+        fields[-1] = descriptions.get(fields[0], "-")
+        hits.append((order.get(fields[2], len(order)), -float(fields[5]), " ".join(fields) + "\n"))
+    hits.sort(key=lambda hit: hit[:2])
+    header, footer = _tblout_comments(tblout)
+    with open(str(output), "w") as table:
+        table.writelines(header)
+        table.writelines(hit[2] for hit in hits)
+        table.writelines(footer)
+
+
+# Search query_fasta against hmm_db and write hmmscan --tblout in output
+#   options are extra command line options (thresholds); queries >= search_min_queries (0: never) run
+#   with hmmsearch, with -Z as number of profiles so full sequence E-values are the ones of hmmscan;
+#   domain E-values (and --domE/--incdomE) are not: hmmscan domain Z is the number of significant
+#   profiles of each query, hmmsearch one is the number of significant proteins of each profile;
+#   otherwise hmmscan runs in shards (threads are divided between them)
+#   hmm_db not pressed is pressed in cache_dir (default: hmmpress folder next to output)
+def run_hmmer(query_fasta, output, hmm_db, options="", threads=1, shards=1, search_min_queries=0,
+              cache_dir=None, logger=None):
+    if logger is None:
+        logger = logging.getLogger('HMMSCAN')
+    if cache_dir is None:
+        cache_dir = pathlib.Path(output).absolute().parent / "hmmpress"
+    queries = sum(1 for record in iter_fasta(query_fasta))
+
+    if 0 < int(search_min_queries) <= queries:
+        logger.info(f"{queries} queries, running HMMSEARCH instead of HMMSCAN")
+        profiles, descriptions = profile_table(hmm_db, cache_dir)
+        search_options = options
+        # User given size is kept
+        if " -Z " not in f" {options} ":
+            search_options += f" -Z {profiles}"
+        search_output = f"{output}_hmmsearch"
+        command_line = (f"hmmsearch --cpu {str(threads)} --tblout {search_output} --noali{search_options} "
+                        f"{str(hmm_db)} {str(query_fasta)} > /dev/null 2> {output}.err")
+        logger.debug(command_line)
+        result = subprocess.run(command_line, shell=True)
+        if result.returncode != 0:
+            raise RuntimeError(f"HMMSEARCH exited with code {result.returncode}, check {output}.err")
+        hmmsearch_to_tblout(search_output, output, query_fasta, descriptions)
+        os.remove(search_output)
+        return
+
+    pressed = pressed_db(hmm_db, cache_dir, logger)
+
+    def scan_command(query, scan_output, cpu):
+        return (f"hmmscan --cpu {str(cpu)} --tblout {scan_output} --noali{options} "
+                f"{str(pressed)} {str(query)} > /dev/null 2> {scan_output}.err")
+
+    if int(shards) > 1:
+        cpu = threads_per_shard(threads, shards)
+        run_sharded(query_fasta, output, int(shards),
+                    lambda query, scan_output: scan_command(query, scan_output, cpu),
+                    logger, merge=merge_tblout)
+        return
+
+    command_line = scan_command(query_fasta, output, threads)
+    logger.debug(command_line)
+    result = subprocess.run(command_line, shell=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"HMMSCAN exited with code {result.returncode}, check {output}.err")
@@ -5,6 +5,9 @@ import os.path
 from shutil import ExecError
 import sys
 
+from Scripts.duplicates import load_members
+from Scripts.interpro_index import interpro_matches, open_index
+
 def cli():
         parser = argparse.ArgumentParser(
                 add_help=False,  # removes original [--help]
@@ -59,6 +62,19 @@ def cli():
                 required=True
         )
 
+        optionalNamed.add_argument(
+                '-ipr_index', dest='ipr_index',
+                metavar='[InterProScan_index.sqlite]', default=None,
+                help='InterProScan outputs indexed by interpro_index.py, without it gff3 files are read'
+        )
+
+        optionalNamed.add_argument(
+                '-dup', dest='duplicates',
+                metavar='[duplicates.tsv]', default=None,
+                help=('representative and member IDs of identical sequences (tab separated).'
+                        + ' InterProScan results of each representative are copied to its members')
+        )
+
         # custom [--help] argument
         optionalNamed.add_argument(
                 '-h', '-help', '--help',
@@ -69,64 +85,55 @@ def cli():
         )
         return parser
 
-def temporary_query(arq):
-        # temporary adding a line to the BLAST analysis
-        #   so it accounts for the last query found by the BLAST algorithm
-        try:
-                temp = arq[-1].split("\t")
-                del temp[0]
-                temp.insert(0, "QueryTemp")
-                arq.append("\t".join(temp))
-        # Index error ocours when Interproscan returns no results, as consequence, arq is empty, and split empty file is not allowed
-        except IndexError:
-                arq.append("\t".join("QueryTemp"))
-
-
-def parser_interproscan(arq_entrada, arq_ipr):
-        entrada = open(str(arq_entrada), "r").read().split("##FASTA")  # SPLITTING THE GFF3 FILE IN TWO CATEGORIES
-        interp = entrada[0].split("##sequence-region")  # WE'LL BE USING ONLY THE FIRST PART OF THE GFF3 OUTPUT FILE
-        del interp[0]
-        ipr = open(str(arq_ipr), "a")
-
-        lista = ["Coils", "Gene3D", "MobiDBLite"]
-
-        # TREATING EACH QUERY, RETRIEVING THE INFORMATION THAT WILL BE WRITTEN ON THE FIRST OUTPUT FILE
-        for seq_reg in interp:
-                seq_reg = seq_reg.splitlines()
-                for linha in seq_reg:
-                        if linha == seq_reg[0]:
-                                linha = linha.split(" ")
-                                del linha[0]
-                        elif linha == seq_reg[1]:
-                                # IGNORING THE FIRST LINE ON EACH GROUP OF QUERIES, AS IT'S NON-INFORMATIVE
-                                pass
-                        else:
-                                ontologia = str(None)
-                                anotacao_db = str(None)
-                                name = str(None)
-                                interpro = str(None)
-                                linha = linha.split("\t")
-                                nome_subject = linha[0]
-                                db = linha[1]
-                                try:
-                                        evalue = str(linha[5]).replace(",", ".").lower()
-                                except Exception:
-                                        # Type of evalue format
-                                        evalue = str(linha[5])
-                                if not any(s in db for s in lista):
-                                        db_certo = db
-                                        anotacao = linha[-1].split(";")
-                                        for a in anotacao:
-                                                if "Ontology" in a:
-                                                        ontologia = a.replace('"', "").replace("Ontology_term=", "")
-                                                if "signature_" in a:
-                                                        anotacao_db = a.replace("signature_desc=", "")
-                                                if "Name" in a:
-                                                        name = a.replace('"', "").replace("Name=", "")
-                                                if "Dbxref" in a:
-                                                        interpro = a.replace('"', "").replace("Dbxref=", "")
-                                        ipr.write(f"{nome_subject}\t{db_certo}\t{name}\t{evalue}\t{anotacao_db}\t{interpro}\t{ontologia}\n")
-        ipr.close()
+# IPRs and GOs of each protein, in order of first match: {protein: (iprs, gos)}
+#   iprs and gos are ordered sets (dict keys), members of identical sequences get terms of their representative
+def interpro_terms(index, members):
+        terms = {}
+        for source in ("annotated", "hypothetical"):
+                # Matches of Coils, Gene3D and MobiDBLite are not in index queries
+                for protein, db, evalue, name, signature, interpro, ontology in interpro_matches(index, source):
+                        iprs, gos = terms.setdefault(protein, ({}, {}))
+                        for match in str(interpro).split(","):
+                                if match != "None":
+                                        iprs[match] = None
+                        for match in str(ontology).split(","):
+                                if match != "None":
+                                        gos[match] = None
+        if not members:
+                return terms
+        # InterProScan ran only with representatives of identical sequences
+        expanded = {}
+        for protein, protein_terms in terms.items():
+                expanded[protein] = protein_terms
+                for member in members.get(protein, []):
+                        expanded.setdefault(member, protein_terms)
+        return expanded
+
+
+# Sort IPRs by number and GOs by term, each key is computed once
+#   IPRs with no number (like Reactome) leave both lists as found, GOs with no term leave GOs as found
+def sort_terms(iprs, gos):
+        ipr_keys = {match: match.split("IPR") for match in iprs}
+        go_keys = {match: match.split("GO") for match in gos}
+        iprs = list(iprs)
+        gos = list(gos)
+        if all(len(key) > 1 for key in ipr_keys.values()):
+                iprs.sort(key=lambda match: ipr_keys[match][1])
+                if all(len(key) > 1 for key in go_keys.values()):
+                        gos.sort(key=lambda match: go_keys[match][1])
+        return iprs, gos
+
+
+# IDs of a list without the first occurrence of each removed ID
+def remaining_ids(ids, removed):
+        removed = set(removed)
+        kept = []
+        for seq_id in ids:
+                if seq_id in removed:
+                        removed.discard(seq_id)
+                else:
+                        kept.append(seq_id)
+        return kept
 
 
 # Function to write ids with no ipr and no GO (no result from InterproScan)
@@ -146,96 +153,40 @@ def write_no_ipr(ids_dict, output, hypo, nohit):
 
 
 # Function to join IPRs and GOs from InterproScan with IDs hypothetical or without hits
-def intepro_process(ids_dict, output, hypo, nohit):
-        # File pre-precessed with IDs, IPRs and go_list
-        interpro_out = open("Interpro_out_tmp.txt", "r").read().splitlines()
-        temporary_query(interpro_out)
-
-        old_id = interpro_out[0].split("\t") 
-        old_id = old_id[0]
-
-        # Initialize lists
-        go_list = []
-        ipr_list = []
-        for query in interpro_out:
-                title = query.split("\t")
-                new_id = title[0]
-                ipr = str(title[5]).split(",")
-                go = str(title[6]).split(",")
-                if old_id != new_id:
-                        # Sort IPRs and go_list
-                        try:
-                                ipr_list.sort(key=lambda item: str(item).split("IPR")[1])
-                                go_list.sort(key=lambda item: str(item).split("GO")[1])
-                        except Exception:
-                                # No GO or IP for this protein (not a true warning)
-                                pass
-                        # Check if interpro_result is in annotated
-                        if old_id in ids_dict.keys():
-                                if (len(ipr_list) > 0) and (len(go_list) > 0):
-                                        output.write(f"{old_id}\t{str(ids_dict.get(old_id)).strip()} ({str(','.join(ipr_list))},{str(','.join(go_list))})\n")
-                                elif (len(ipr_list) > 0) and (len(go_list) == 0):
-                                        output.write(f"{old_id}\t{str(ids_dict.get(old_id)).strip()} ({str(','.join(ipr_list))})\n")
-                                elif (len(ipr_list) == 0) and (len(go_list) > 0):
-                                        output.write(f"{old_id}\t{str(ids_dict.get(old_id)).strip()} ({str(','.join(go_list))})\n")
-                                else:
-                                        output.write(f"{old_id}\t{str(ids_dict.get(old_id)).strip()}\n")
-                                del ids_dict[old_id]
-                        # Else, interpro_result must be in hypothetical
-                        elif old_id in hypo:
-                                if (len(ipr_list) > 0) and (len(go_list) > 0):
-                                        output.write(f"{old_id}\thypothetical protein ({str(','.join(ipr_list))},{str(','.join(go_list))})\n")
-                                elif (len(ipr_list) > 0) and (len(go_list) == 0):
-                                        output.write(f"{old_id}\thypothetical protein ({str(','.join(ipr_list))})\n")
-                                elif (len(ipr_list) == 0) and (len(go_list) > 0):
-                                        output.write(f"{old_id}\thypothetical protein ({str(','.join(go_list))})\n")
-                                else:
-                                        output.write(f"{old_id}\thypothetical protein\n")
-                                hypo.remove(old_id)
-                        else:
-                                if (len(ipr_list) > 0) and (len(go_list) > 0):
-                                        output.write(f"{old_id}\thypothetical protein ({str(','.join(ipr_list))},{str(','.join(go_list))})\n")
-                                elif (len(ipr_list) > 0) and (len(go_list) == 0):
-                                        output.write(f"{old_id}\thypothetical protein ({str(','.join(ipr_list))})\n")
-                                elif (len(ipr_list) == 0) and (len(go_list) > 0):
-                                        output.write(f"{old_id}\thypothetical protein ({str(','.join(go_list))})\n")
-                                else:
-                                        output.write(f"{old_id}\thypothetical protein\n")
-                                nohit.remove(old_id)
-                        go_list.clear()
-                        ipr_list.clear()
-                        # GET FIRST ITEM FOR NEW ID - After save old
-                        for match in ipr:
-                                if (match != "None") and (match not in ipr_list):
-                                        ipr_list.append(match)
-                        for match in go:
-                                if (match != "None") and (match not in go_list):
-                                        go_list.append(match)
+#   hash join: each protein with terms is looked up in annotated dict, others are hypothetical
+def intepro_process(terms, ids_dict, output, hypo, nohit):
+        hypo_set = set(hypo)
+        hypo_found = []
+        nohit_found = []
+        for protein, (iprs, gos) in terms.items():
+                iprs, gos = sort_terms(iprs, gos)
+                # Check if interpro_result is in annotated
+                if protein in ids_dict:
+                        description = str(ids_dict.pop(protein)).strip()
+                # Else, interpro_result must be in hypothetical or no hit
+                else:
+                        description = "hypothetical protein"
+                        (hypo_found if protein in hypo_set else nohit_found).append(protein)
+                if iprs or gos:
+                        output.write(f"{protein}\t{description} ({','.join(iprs + gos)})\n")
                 else:
-                        for match in ipr:
-                                if (match != "None") and (match not in ipr_list):
-                                        ipr_list.append(match)
-                        for match in go:
-                                if (match != "None") and (match not in go_list):
-                                        go_list.append(match)
-                old_id = new_id
-        write_no_ipr(ids_dict=ids_dict, output=output, hypo=hypo, nohit=nohit)
-        os.remove("Interpro_out_tmp.txt")
+                        output.write(f"{protein}\t{description}\n")
+        write_no_ipr(ids_dict=ids_dict, output=output, hypo=remaining_ids(hypo, hypo_found),
+                     nohit=remaining_ids(nohit, nohit_found))
 
 def main():
         parser=cli()
         # arguments saved here
         args = parser.parse_args()
-        # ---------------------- Create organized file with iprs and gos -----------------------
+        # ---------------------- Collect iprs and gos of each protein -----------------------
         if (os.path.getsize(args.ipr1) == 0) and (os.path.getsize(args.ipr2) == 0):
                 # Can't process empty file
-                pass
+                terms = {}
         else:
-                # Almost one file has result - but, if one of them hasn't parser will crash
-                if os.path.getsize(args.ipr1) != 0:
-                        parser_interproscan(args.ipr1, "Interpro_out_tmp.txt")
-                if os.path.getsize(args.ipr2) != 0:
-                        parser_interproscan(args.ipr2, "Interpro_out_tmp.txt")
+                # Almost one file has result - empty ones have nothing in index
+                index = open_index(args.ipr_index, {"annotated": args.ipr1, "hypothetical": args.ipr2})
+                terms = interpro_terms(index, load_members(args.duplicates))
+                index.close()
 
         # ---------------------- Pre-parse annotated products -------------------------
         annot = open(args.annot, "r").read().splitlines()
@@ -264,7 +215,7 @@ def main():
         if os.path.getsize(args.ipr1) == 0 and os.path.getsize(args.ipr2) == 0:
                 write_no_ipr(ids_dict, output=output, hypo=hypo, nohit=nohit)
         else:
-                intepro_process(ids_dict=ids_dict, output=output, hypo=hypo, nohit=nohit)
+                intepro_process(terms=terms, ids_dict=ids_dict, output=output, hypo=hypo, nohit=nohit)
 
 
 
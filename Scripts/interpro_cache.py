@@ -0,0 +1,100 @@
+#!/usr/bin/python3
+
+####################################################
+###   LOCAL INTERPROSCAN MATCH CACHE: RESULTS    ###
+###   OF EACH PROTEIN ARE KEPT BY SEQUENCE MD5,  ###
+###   INTERPROSCAN VERSION AND RUN PARAMETERS    ###
+####################################################
+
+import hashlib
+import json
+import re
+import sqlite3
+import time
+
+# Stored records don't have protein and match ids, they are written again for each use
+PROTEIN_MARK = "\x00P\x00"
+MATCH_MARK = "\x00M\x00"
+
+
+class InterproCache(object):
+    """
+    SQLite store of InterProScan GFF3 records (region block and FASTA records) for
+    each protein sequence. InterProScan version fixes member database versions,
+    so a new InterProScan release never reads results of an older one.
+    Proteins without matches are stored too, they are not searched again.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.connection = sqlite3.connect(self.path, timeout=600)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS matches ("
+            "key TEXT PRIMARY KEY, md5 TEXT NOT NULL, region TEXT NOT NULL, fasta TEXT NOT NULL, "
+            "last_used REAL NOT NULL)"
+        )
+        self.connection.commit()
+
+    # Same MD5 as InterProScan uses for its match lookup service
+    @staticmethod
+    def md5(sequence):
+        return hashlib.md5(sequence.upper().encode()).hexdigest()
+
+    @staticmethod
+    def key(sequence, version, params):
+        params = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(f"{InterproCache.md5(sequence)}|{version}|{params}".encode()).hexdigest()
+
+    # Records for each key found, as {key: (region, fasta)}
+    def get_many(self, keys):
+        found = {}
+        keys = list(set(keys))
+        # SQLite limits the number of variables in a query
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            query = f"SELECT key, region, fasta FROM matches WHERE key IN ({','.join('?' * len(batch))})"
+            for key, region, fasta in self.connection.execute(query, batch):
+                found[key] = (region, fasta)
+        now = time.time()
+        self.connection.executemany("UPDATE matches SET last_used = ? WHERE key = ?", ((now, key) for key in found))
+        self.connection.commit()
+        return found
+
+    # Store {key: (md5, region, fasta)}, empty region and fasta mean protein without matches
+    def put_many(self, entries):
+        now = time.time()
+        records = [(key, md5, region, fasta, now) for key, (md5, region, fasta) in entries.items()]
+        self.connection.executemany("INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?, ?)", records)
+        self.connection.commit()
+
+    def close(self):
+        self.connection.close()
+
+
+# Replace protein and match ids of one protein records by marks
+def to_template(protein_id, region_lines, fasta_lines):
+    protein = re.compile(rf"(?<=[=,]){re.escape(protein_id)}(?=[;,\s]|$)")
+    region = []
+    for line in region_lines:
+        if line.startswith("##sequence-region"):
+            fields = line.split(" ")
+            fields[1] = PROTEIN_MARK
+            line = " ".join(fields)
+        elif not line.startswith("#"):
+            fields = line.split("\t")
+            if fields[0] == protein_id:
+                fields[0] = PROTEIN_MARK
+            fields[-1] = protein.sub(PROTEIN_MARK, fields[-1])
+            line = "\t".join(fields)
+        region.append(line.replace("match$", f"match${MATCH_MARK}"))
+    fasta = []
+    for line in fasta_lines:
+        if line.startswith(">") and line[1:].split()[:1] == [protein_id]:
+            line = f">{PROTEIN_MARK}{line[1 + len(protein_id):]}"
+        fasta.append(line.replace("match$", f"match${MATCH_MARK}"))
+    return "".join(region), "".join(fasta)
+
+
+# Records of a cached protein with its id, match ids get a prefix unique in this output
+def from_template(text, protein_id, serial):
+    return text.replace(PROTEIN_MARK, protein_id).replace(MATCH_MARK, f"c{serial}.")
@@ -0,0 +1,138 @@
+#!/usr/bin/python3
+
+####################################################
+###   INTERPROSCAN INDEX: GFF3 OR TSV OUTPUTS    ###
+###   ARE READ ONCE INTO SQLITE, FUNCANNOTATION, ###
+###   INFO AND SUMMARY PARSERS READ FROM THERE   ###
+####################################################
+
+import os
+import pathlib
+import re
+import sqlite3
+import threading
+
+from Scripts.interpro_utils import is_tsv
+
+# Matches of these databases are not used by parsers
+UNWANTED_DB = ("Coils", "Gene3D", "MobiDBLite")
+
+
+# Name, signature description, Dbxref and Ontology_term of one match (None when missing)
+#   same rules parsers always used: last attribute containing the word wins
+def parse_attributes(attributes):
+    ontology = signature = name = interpro = None
+    for attribute in attributes.split(";"):
+        if "Ontology" in attribute:
+            ontology = attribute.replace('"', "").replace("Ontology_term=", "")
+        if "signature_" in attribute:
+            signature = attribute.replace("signature_desc=", "")
+        if "Name" in attribute:
+            name = attribute.replace('"', "").replace("Name=", "")
+        if "Dbxref" in attribute:
+            interpro = attribute.replace('"', "").replace("Dbxref=", "")
+    return name, signature, interpro, ontology
+
+
+# Read InterProScan gff3 one line at a time, giving ("protein", id) for each region block
+#   and ("match", (protein, db, evalue, name, signature, dbxref, ontology)) for each match
+#   first line of each block (polypeptide) is not a match; "##FASTA" section is not read
+def iter_gff3(gff3):
+    with open(str(gff3), "r") as gff:
+        polypeptide = False
+        for line in gff:
+            line = line.rstrip("\r\n")
+            if line.startswith("##FASTA"):
+                break
+            if line.startswith("##sequence-region"):
+                fields = line.split(" ")
+                yield "protein", fields[1] if len(fields) > 1 else ""
+                polypeptide = True
+            elif not line or line.startswith("#"):
+                continue
+            elif polypeptide:
+                polypeptide = False
+            else:
+                fields = line.split("\t")
+                yield "match", (fields[0], fields[1], fields[5], *parse_attributes(fields[-1]))
+
+
+# Read InterProScan TSV one line at a time, giving the same records as iter_gff3()
+#   columns: protein, md5, length, analysis, signature accession, signature description,
+#   start, stop, score, status, date, InterPro accession, InterPro description, GO, pathways
+def iter_tsv(tsv):
+    proteins = set()
+    with open(str(tsv), "r") as matches:
+        for line in matches:
+            fields = line.rstrip("\r\n").split("\t")
+            if len(fields) < 9:
+                continue
+            if fields[0] not in proteins:
+                proteins.add(fields[0])
+                yield "protein", fields[0]
+            fields += ["-"] * (15 - len(fields))
+            signature = fields[5] if fields[5] not in ("", "-") else None
+            interpro = f"InterPro:{fields[11]}" if fields[11] not in ("", "-") else None
+            # GO terms are separated by "|", newer versions tell their source: GO:0005515(InterPro)
+            ontology = ",".join(re.sub(r"\(.*\)$", "", go) for go in fields[13].split("|")) if fields[13] not in ("", "-") else None
+            yield "match", (fields[0], fields[3], fields[8], fields[4], signature, interpro, ontology)
+
+
+# Write index of InterProScan outputs, gff3_files is {source: gff3 or tsv}, e.g. {"annotated": ..., "hypothetical": ...}
+#   proteins and matches keep the order of each file
+def build_index(index_file, gff3_files):
+    index = pathlib.Path(index_file)
+    # Write in a temporary file first, index is complete or missing
+    temp_index = pathlib.Path(f"{index}.{os.getpid()}.{threading.get_ident()}.tmp")
+    if temp_index.exists():
+        temp_index.unlink()
+    connection = sqlite3.connect(str(temp_index))
+    _fill(connection, gff3_files)
+    connection.close()
+    os.replace(str(temp_index), str(index))
+    return index
+
+
+def _fill(connection, gff3_files):
+    connection.execute("CREATE TABLE proteins (source TEXT NOT NULL, protein TEXT NOT NULL)")
+    connection.execute(
+        "CREATE TABLE matches (source TEXT NOT NULL, protein TEXT NOT NULL, db TEXT NOT NULL, evalue TEXT, "
+        "name TEXT, signature TEXT, dbxref TEXT, ontology TEXT)"
+    )
+    for source, gff3 in gff3_files.items():
+        proteins = []
+        matches = []
+        if os.path.isfile(str(gff3)) and os.path.getsize(str(gff3)) > 0:
+            for kind, record in (iter_tsv(gff3) if is_tsv(gff3) else iter_gff3(gff3)):
+                if kind == "protein":
+                    proteins.append((source, record))
+                else:
+                    matches.append((source, *record))
+        connection.executemany("INSERT INTO proteins VALUES (?, ?)", proteins)
+        connection.executemany("INSERT INTO matches VALUES (?, ?, ?, ?, ?, ?, ?, ?)", matches)
+    connection.execute("CREATE INDEX matches_source ON matches (source)")
+    connection.execute("CREATE INDEX matches_protein ON matches (protein)")
+    connection.commit()
+
+
+# Open index_file, or index gff3_files in memory when there is no index
+def open_index(index_file=None, gff3_files=None):
+    if index_file is not None and os.path.isfile(str(index_file)):
+        return sqlite3.connect(str(index_file))
+    connection = sqlite3.connect(":memory:")
+    _fill(connection, gff3_files or {})
+    return connection
+
+
+# Matches of one source in file order, as (protein, db, evalue, name, signature, dbxref, ontology)
+#   matches of UNWANTED_DB are left out
+def interpro_matches(connection, source):
+    query = ("SELECT protein, db, evalue, name, signature, dbxref, ontology FROM matches "
+             f"WHERE source = ? AND {' AND '.join('instr(db, ?) = 0' for db in UNWANTED_DB)} ORDER BY rowid")
+    return connection.execute(query, (source, *UNWANTED_DB))
+
+
+# Proteins of one source with a region block (so with any match), in file order
+def interpro_proteins(connection, source):
+    return [protein for (protein,) in connection.execute(
+        "SELECT protein FROM proteins WHERE source = ? ORDER BY rowid", (source,))]
@@ -0,0 +1,298 @@
+#!/usr/bin/python3
+
+####################################################
+###   INTERPROSCAN OUTPUT HELPERS (GFF3, TSV):   ###
+###   OUTPUTS ARE SPLIT BY PROTEIN ID OR RUN IN  ###
+###   CHUNKS AND JOINED, SO PARSERS READ THE     ###
+###   SAME FILES                                 ###
+####################################################
+
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import logging
+import pathlib
+import re
+import shutil
+import subprocess
+
+from Scripts.fasta_utils import iter_fasta
+
+# InterProScan GFF3 layout:
+#   header (##gff-version, ##interproscan-version)
+#   one "##sequence-region <protein> <start> <end>" block for each protein with matches
+#   "##FASTA" and records of proteins and matches (>match$N_start_end)
+
+
+# InterProScan TSV layout: one match per line, protein id in the first column, no header
+
+
+# Output format given by file name: .tsv is TSV, anything else is GFF3
+def is_tsv(path):
+    return str(path).endswith(".tsv")
+
+
+# Feature id of a region block line, used to know which protein owns each match record
+def _feature_id(line):
+    match = re.search(r"(?:^|;)ID=([^;\s]+)", line.rstrip("\n").split("\t")[-1])
+    return match.group(1) if match else None
+
+
+# Write records of gff3 in one output for each id set
+#   outputs is a list of (path, set of protein ids); header and "##FASTA" go to every output,
+#   region blocks and fasta records go where their protein is (proteins in no set are dropped)
+def split_gff3(gff3, outputs):
+    handles = [(open(str(path), "w"), set(ids)) for path, ids in outputs]
+    owners = {}
+    current = None
+    in_header = True
+    in_fasta = False
+    try:
+        with open(str(gff3), "r") as gff:
+            for line in gff:
+                if line.startswith("##FASTA"):
+                    in_header = False
+                    in_fasta = True
+                    current = None
+                    for handle, ids in handles:
+                        handle.write(line)
+                    continue
+                if in_fasta:
+                    if line.startswith(">"):
+                        record_id = line[1:].split()[0] if line[1:].split() else ""
+                        current = _owner(handles, record_id) or owners.get(record_id)
+                    if current is not None:
+                        current.write(line)
+                    continue
+                if line.startswith("##sequence-region"):
+                    in_header = False
+                    fields = line.split()
+                    current = _owner(handles, fields[1] if len(fields) > 1 else "")
+                elif in_header:
+                    for handle, ids in handles:
+                        handle.write(line)
+                    continue
+                elif current is not None and not line.startswith("#"):
+                    feature_id = _feature_id(line)
+                    if feature_id is not None:
+                        owners[feature_id] = current
+                if current is not None:
+                    current.write(line)
+    finally:
+        for handle, ids in handles:
+            handle.close()
+
+
+# Read gff3 as (header lines, {protein: region block lines}, {protein: fasta lines})
+#   fasta lines of a protein are its own record and records of its matches
+def read_gff3(gff3):
+    header = []
+    regions = {}
+    fasta = {}
+    owners = {}
+    current = None
+    in_header = True
+    in_fasta = False
+    with open(str(gff3), "r") as gff:
+        for line in gff:
+            if line.startswith("##FASTA"):
+                in_header = False
+                in_fasta = True
+                current = None
+            elif in_fasta:
+                if line.startswith(">"):
+                    record_id = line[1:].split()[0] if line[1:].split() else ""
+                    current = record_id if record_id in regions else owners.get(record_id)
+                if current is not None:
+                    fasta.setdefault(current, []).append(line)
+            elif line.startswith("##sequence-region"):
+                in_header = False
+                fields = line.split()
+                current = fields[1] if len(fields) > 1 else ""
+                regions.setdefault(current, []).append(line)
+            elif in_header:
+                header.append(line)
+            elif current is not None:
+                if not line.startswith("#"):
+                    feature_id = _feature_id(line)
+                    if feature_id is not None:
+                        owners[feature_id] = current
+                regions[current].append(line)
+    return header, regions, fasta
+
+
+def _owner(handles, protein_id):
+    for handle, ids in handles:
+        if protein_id in ids:
+            return handle
+    return None
+
+
+# Join InterProScan gff3 files in output: header of the first one, all region blocks,
+#   then one "##FASTA" section with records of all files
+#   match ids (match$N_start_end) start again in each file, so they get the file number (match$K.N_...)
+def merge_gff3(parts, output):
+    header_written = False
+
+    def unique_matches(line, number):
+        return line.replace("match$", f"match${number}.") if len(parts) > 1 else line
+
+    with open(str(output), "w") as merged:
+        for number, part in enumerate(parts, start=1):
+            in_header = True
+            part_header = False
+            with open(str(part), "r") as gff:
+                for line in gff:
+                    if line.startswith("##FASTA"):
+                        break
+                    if line.startswith("##sequence-region"):
+                        in_header = False
+                    if in_header:
+                        if header_written:
+                            continue
+                        part_header = True
+                    merged.write(unique_matches(line, number))
+            header_written = header_written or part_header
+        fasta_written = False
+        for number, part in enumerate(parts, start=1):
+            in_fasta = False
+            with open(str(part), "r") as gff:
+                for line in gff:
+                    if in_fasta:
+                        merged.write(unique_matches(line, number))
+                    elif line.startswith("##FASTA"):
+                        in_fasta = True
+                        if not fasta_written:
+                            merged.write(line)
+                            fasta_written = True
+
+
+# Write lines of InterProScan TSV in one output for each id set, as split_gff3()
+def split_tsv(tsv, outputs):
+    handles = [(open(str(path), "w"), set(ids)) for path, ids in outputs]
+    try:
+        with open(str(tsv), "r") as matches:
+            for line in matches:
+                owner = _owner(handles, line.split("\t", 1)[0])
+                if owner is not None:
+                    owner.write(line)
+    finally:
+        for handle, ids in handles:
+            handle.close()
+
+
+# Read TSV as read_gff3() does: (no header, {protein: match lines}, no fasta)
+def read_tsv(tsv):
+    matches = {}
+    with open(str(tsv), "r") as lines:
+        for line in lines:
+            if line.strip():
+                matches.setdefault(line.split("\t", 1)[0], []).append(line)
+    return [], matches, {}
+
+
+# Join TSV files in output, in the given order
+def merge_tsv(parts, output):
+    with open(str(output), "w") as merged:
+        for part in parts:
+            with open(str(part), "r") as matches:
+                shutil.copyfileobj(matches, merged)
+
+
+# Split, read and join InterProScan output of any format
+def split_output(path, outputs):
+    return split_tsv(path, outputs) if is_tsv(path) else split_gff3(path, outputs)
+
+
+def read_output(path):
+    return read_tsv(path) if is_tsv(path) else read_gff3(path)
+
+
+def merge_output(parts, output):
+    return merge_tsv(parts, output) if is_tsv(output) else merge_gff3(parts, output)
+
+
+# Write fasta in files of chunk_size records: <chunk_dir>/chunk_1.fasta, chunk_2.fasta ...
+#   same input gives the same chunks, so a restart finds chunks of the previous run
+def write_chunks(fasta_file, chunk_dir, chunk_size):
+    chunk_dir = pathlib.Path(chunk_dir)
+    chunk_dir.mkdir(exist_ok=True)
+    chunk_size = max(1, int(chunk_size))
+    chunks = []
+    output = None
+    records = 0
+    for header, sequence in iter_fasta(fasta_file):
+        if output is None or records == chunk_size:
+            if output is not None:
+                output.close()
+            chunks.append(chunk_dir / f"chunk_{len(chunks) + 1}.fasta")
+            output = open(str(chunks[-1]), "w")
+            records = 0
+        output.write(f">{header}\n{sequence}\n")
+        records += 1
+    if output is not None:
+        output.close()
+    return chunks
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(str(path), "rb") as content:
+        for block in iter(lambda: content.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Run InterProScan over chunks of fasta_file, up to workers at once, and join them in output (GFF3 or TSV)
+#   command is a function receiving (chunk fasta, chunk output, temp dir) and returning the command line
+#   finished chunks are marked with <chunk>.done (hash of chunk fasta), so a restart after
+#   a crash only runs chunks without result
+def run_interpro_chunks(fasta_file, output, chunk_size, workers, command, logger=None):
+    if logger is None:
+        logger = logging.getLogger('INTERPROSCAN')
+    chunk_dir = pathlib.Path(f"{output}_chunks")
+    chunks = write_chunks(fasta_file, chunk_dir, chunk_size)
+    # Chunks are written in the format of output
+    suffix = ".tsv" if is_tsv(output) else ".gff3"
+    results = [chunk.with_suffix(suffix) for chunk in chunks]
+
+    def is_done(chunk):
+        marker = chunk.with_suffix(".done")
+        return (chunk.with_suffix(suffix).is_file() and marker.is_file()
+                and marker.read_text().strip() == _sha256(chunk))
+
+    missing = [chunk for chunk in chunks if not is_done(chunk)]
+    if len(missing) < len(chunks):
+        logger.info(f"{len(chunks) - len(missing)} of {len(chunks)} chunk(s) finished in a previous run")
+    logger.info(f"Running INTERPROSCAN on {len(missing)} chunk(s), {workers} at once")
+
+    def run_chunk(chunk):
+        temp_dir = chunk_dir / f"temp_{chunk.stem}"
+        temp_dir.mkdir(exist_ok=True)
+        chunk_command = command(chunk, chunk.with_suffix(suffix), temp_dir)
+        logger.debug(chunk_command)
+        result = subprocess.run(chunk_command, shell=True, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, universal_newlines=True)
+        if result.returncode == 0:
+            # Chunk without matches may have no output, but it is finished
+            if not chunk.with_suffix(suffix).is_file():
+                open(str(chunk.with_suffix(suffix)), "w").close()
+            chunk.with_suffix(".done").write_text(_sha256(chunk) + "\n")
+            shutil.rmtree(temp_dir, ignore_errors=True)
+        return result
+
+    with ThreadPoolExecutor(max_workers=max(1, int(workers))) as executor:
+        finished = list(executor.map(run_chunk, missing))
+
+    failed = []
+    for chunk, result in zip(missing, finished):
+        if result.returncode != 0:
+            logger.error(f"INTERPROSCAN exited with code {result.returncode} for {chunk.name}")
+            logger.debug(result.stdout)
+            failed.append(chunk)
+    if failed:
+        # Keep chunk directory, next run starts from finished chunks
+        raise RuntimeError(f"{len(failed)} INTERPROSCAN chunk(s) failed, check {chunk_dir}")
+
+    merge_output(results, output)
+    shutil.rmtree(chunk_dir, ignore_errors=True)
+    logger.info(f"Chunks joined into {output}")
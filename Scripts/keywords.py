@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+
+####################################################
+###   HYPOTHETICAL KEYWORDS: ALL KEYWORDS ARE    ###
+###   CHECKED AT ONCE WITH ONE COMPILED REGEX,   ###
+###   EACH DESCRIPTION IS CHECKED ONLY ONCE      ###
+####################################################
+
+import functools
+import re
+
+# Verdicts remembered at most, least recently used descriptions are forgotten first
+MEMO_SIZE = 100000
+
+
+class KeywordMatcher(object):
+    """
+    Case insensitive substring search of pipeline keywords in hit descriptions.
+    Same verdict as any(word.lower() in description.lower() for word in words),
+    remembered for the last MEMO_SIZE descriptions, since subject titles repeat across queries.
+    """
+
+    def __init__(self, words, memo_size=MEMO_SIZE):
+        self.words = [str(word) for word in words]
+        alternatives = sorted({re.escape(word.lower()) for word in self.words})
+        self.pattern = re.compile("|".join(alternatives)) if alternatives else None
+        # Bounded memo, memory doesn't grow with the number of distinct descriptions
+        self.found = functools.lru_cache(maxsize=memo_size)(self._match)
+
+    def _match(self, description):
+        return self.pattern is not None and self.pattern.search(description.lower()) is not None
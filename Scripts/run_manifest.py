@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+####################################################
+###    RUN MANIFEST: WHAT EACH STAGE READ, USED  ###
+###    AND WROTE, SO RESUME ONLY RERUNS STAGES   ###
+###    WHOSE INPUTS OR PARAMETERS HAVE CHANGED   ###
+####################################################
+
+import datetime
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import subprocess
+import threading
+
+MANIFEST_VERSION = 1
+
+# Versions are asked only once for each command line
+_tool_versions = {}
+_tool_versions_lock = threading.Lock()
+
+
+# Get first line of "<tool> --version" like commands, "unknown" if it fails
+def tool_version(command):
+    with _tool_versions_lock:
+        if command not in _tool_versions:
+            try:
+                output = subprocess.run(command, shell=True, stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT, universal_newlines=True).stdout
+                lines = [line.strip() for line in output.splitlines() if line.strip()]
+                _tool_versions[command] = lines[0] if lines else "unknown"
+            except Exception:
+                _tool_versions[command] = "unknown"
+        return _tool_versions[command]
+
+
+# Turn params into what json gives back, so stored and current params can be compared
+def _normalize(value):
+    return json.loads(json.dumps(value, sort_keys=True, default=str))
+
+
+class RunManifest(object):
+    """
+    JSON file in the run directory with, for each stage: status, input and output
+    hashes, parameters and tool version.
+    """
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        self.logger = logging.getLogger('AnnotaPipeline')
+        self.lock = threading.RLock()
+        # (path, size, mtime) -> sha256, so one file is hashed once per run
+        self.hashes = {}
+        self.stages = {}
+        if self.path.is_file():
+            try:
+                with open(str(self.path), "r") as manifest:
+                    content = json.load(manifest)
+                if content.get("version") == MANIFEST_VERSION:
+                    self.stages = content.get("stages", {})
+            except ValueError:
+                self.logger.warning(f"Manifest {self.path} is corrupted, all stages will run again")
+
+    def save(self):
+        with self.lock:
+            temp_path = pathlib.Path(f"{self.path}.tmp")
+            with open(str(temp_path), "w") as manifest:
+                json.dump({"version": MANIFEST_VERSION, "stages": self.stages}, manifest, indent=2, sort_keys=True)
+            os.replace(str(temp_path), str(self.path))
+
+    def file_hash(self, path):
+        path = pathlib.Path(path)
+        if path.is_dir():
+            digest = hashlib.sha256()
+            for child in sorted(item for item in path.rglob("*") if item.is_file()):
+                digest.update(str(child.relative_to(path)).encode())
+                digest.update(self.file_hash(child).encode())
+            return digest.hexdigest()
+        stat = path.stat()
+        key = (str(path.absolute()), stat.st_size, stat.st_mtime_ns)
+        if key not in self.hashes:
+            digest = hashlib.sha256()
+            with open(str(path), "rb") as content:
+                for block in iter(lambda: content.read(1 << 20), b""):
+                    digest.update(block)
+            self.hashes[key] = digest.hexdigest()
+        return self.hashes[key]
+
+    # Hash for each path, None if file doesn't exist
+    def hash_files(self, paths):
+        hashes = {}
+        for path in paths:
+            path = str(path)
+            hashes[path] = self.file_hash(path) if os.path.exists(path) else None
+        return hashes
+
+    # True if stage finished before with the same inputs, params and version and outputs are untouched
+    def is_valid(self, name, inputs=(), outputs=(), params=None, version=None):
+        with self.lock:
+            entry = self.stages.get(name)
+        if entry is None or entry.get("status") != "complete":
+            return False
+        if entry.get("params") != _normalize(params) or entry.get("tool_version") != version:
+            return False
+        current_inputs = self.hash_files(inputs)
+        if None in current_inputs.values() or current_inputs != entry.get("inputs"):
+            return False
+        current_outputs = self.hash_files(outputs)
+        if None in current_outputs.values() or current_outputs != entry.get("outputs"):
+            return False
+        return True
+
+    # Stage is running: if pipeline dies now, stage stays incomplete and runs again
+    def start(self, name):
+        with self.lock:
+            self.stages[name] = {
+                "status": "running",
+                "started": datetime.datetime.now().isoformat(timespec="seconds")
+            }
+            self.save()
+
+    def complete(self, name, inputs=(), outputs=(), params=None, version=None):
+        inputs = self.hash_files(inputs)
+        outputs = self.hash_files(outputs)
+        with self.lock:
+            entry = self.stages.setdefault(name, {})
+            entry.update({
+                "status": "complete",
+                "inputs": inputs,
+                "outputs": outputs,
+                "params": _normalize(params),
+                "tool_version": version,
+                "finished": datetime.datetime.now().isoformat(timespec="seconds")
+            })
+            self.save()
@@ -0,0 +1,62 @@
+#!/usr/bin/python3
+
+####################################################
+###     RUN ONE COMMAND OVER QUERY SHARDS AND    ###
+###     MERGE OUTPUTS IN THE ORIGINAL ORDER      ###
+####################################################
+
+from concurrent.futures import ThreadPoolExecutor
+import logging
+import pathlib
+import shutil
+import subprocess
+
+from Scripts.fasta_utils import split_fasta
+
+
+# Divide threads between shards, every shard gets at least one
+def threads_per_shard(threads, shards):
+    return max(1, int(threads) // max(1, int(shards)))
+
+
+# Concatenate shard outputs, in shard order, into final output
+def merge_outputs(shard_outputs, output):
+    with open(str(output), "w") as merged:
+        for shard_output in shard_outputs:
+            with open(str(shard_output), "r") as shard:
+                shutil.copyfileobj(shard, merged)
+
+
+# Split query in shards, run command for each one at the same time and merge results
+#   command is a function receiving (query_shard, output_shard) and returning the command line
+def run_sharded(query, output, shards, command, logger=None, merge=merge_outputs):
+    if logger is None:
+        logger = logging.getLogger('AnnotaPipeline')
+    shard_dir = pathlib.Path(f"{output}_shards")
+    shard_dir.mkdir(exist_ok=True)
+    queries = split_fasta(query, shards, shard_dir / pathlib.Path(str(query)).stem)
+    outputs = [pathlib.Path(f"{shard}.out") for shard in queries]
+    logger.info(f"Running {len(queries)} shard(s) of {query}")
+
+    def run_shard(shard):
+        shard_command = command(shard, f"{shard}.out")
+        logger.debug(shard_command)
+        return subprocess.run(shard_command, shell=True, stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT, universal_newlines=True)
+
+    with ThreadPoolExecutor(max_workers=max(1, len(queries))) as executor:
+        results = list(executor.map(run_shard, queries))
+
+    failed = []
+    for shard, result in zip(queries, results):
+        if result.returncode != 0:
+            logger.error(f"Shard {shard} exited with code {result.returncode}")
+            logger.debug(result.stdout)
+            failed.append(shard)
+    if failed:
+        # Keep shard directory to check what went wrong
+        raise RuntimeError(f"{len(failed)} shard(s) failed for {query}, check {shard_dir}")
+
+    merge(outputs, output)
+    shutil.rmtree(shard_dir, ignore_errors=True)
+    logger.info(f"Shards merged into {output}")
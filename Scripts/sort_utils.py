@@ -0,0 +1,122 @@
+#!/usr/bin/python3
+
+####################################################
+###   SORT TEXT FILES IN BOUNDED MEMORY: SORTED  ###
+###   RUNS IN TEMPORARY FILES JOINED BY A HEAP   ###
+###   MERGE, WITH THE ORDER OF "sort -V"         ###
+####################################################
+
+import heapq
+import os
+import pathlib
+import re
+import tempfile
+
+# Lines sorted in memory at once, each sorted run goes to a temporary file
+CHUNK_LINES = 500000
+# Runs merged at once, more runs are merged in several passes
+MERGE_FANIN = 64
+
+# Non-digit and digit runs of a version string
+_RUNS = re.compile(rb"([^0-9]*)([0-9]*)")
+# File suffix ignored in a first comparison (".tar.gz"), as sort -V does
+_SUFFIX = re.compile(rb"(?:\.[A-Za-z~][A-Za-z0-9~]*)*$")
+
+
+# Weight of each byte in non-digit runs: "~" before anything (even the end), letters, then other bytes
+def _byte_order(byte):
+    if 48 <= byte <= 57:
+        return 0
+    if 65 <= byte <= 90 or 97 <= byte <= 122:
+        return byte
+    if byte == 126:
+        return -1
+    return byte + 256
+
+
+_ORDER = [_byte_order(byte) for byte in range(256)]
+
+
+# Key of one version string: non-digit runs (weights closed by 0, the weight of their end)
+#   alternating with digit runs as numbers, and a final empty run
+def _version_runs(text):
+    key = []
+    for letters, digits in _RUNS.findall(text):
+        if letters or digits:
+            key.append(tuple(_ORDER[byte] for byte in letters) + (0,))
+            key.append(int(digits or 0))
+    key.append((0,))
+    return key
+
+
+# Sort key giving the order of GNU "sort -V" (filevercmp) for one line
+#   empty line, ".", ".." and lines starting with "." come first; lines are compared without
+#   their suffix, then whole; lines still equal are ordered by bytes
+def version_key(line):
+    text = line.rstrip("\n").encode() if isinstance(line, str) else line.rstrip(b"\n")
+    if not text:
+        return (0, [], [], text)
+    if text in (b".", b".."):
+        return (len(text), [], [], text)
+    rank = 3 if text.startswith(b".") else 4
+    whole = _version_runs(text)
+    suffix = _SUFFIX.search(text).start()
+    prefix = whole if suffix == len(text) else _version_runs(text[:suffix])
+    return (rank, prefix, whole, text)
+
+
+# Write lines of input sorted in output; output may be input
+#   key orders lines (with their "\n"), None is plain text order; header is written first
+#   at most chunk_lines lines are in memory, runs are written in temp_dir (default: output directory)
+def sort_file(input_file, output_file, key=None, header=None, chunk_lines=CHUNK_LINES, temp_dir=None):
+    output_file = pathlib.Path(output_file)
+    if temp_dir is None:
+        temp_dir = output_file.absolute().parent
+    runs = []
+    try:
+        with open(str(input_file), "r") as lines:
+            while True:
+                chunk = [line if line.endswith("\n") else line + "\n" for _, line in zip(range(chunk_lines), lines)]
+                if not chunk and runs:
+                    break
+                chunk.sort(key=key)
+                runs.append(_write_run(chunk, temp_dir))
+                if len(chunk) < chunk_lines:
+                    break
+        # Join runs in passes of MERGE_FANIN files, open files stay bounded
+        while len(runs) > MERGE_FANIN:
+            merged = []
+            for start in range(0, len(runs), MERGE_FANIN):
+                merged.append(_merge_runs(runs[start:start + MERGE_FANIN], key, temp_dir))
+            runs = merged
+        # Write in a temporary file first, output can be input
+        final = _merge_runs(runs, key, temp_dir, header)
+        os.replace(final, str(output_file))
+    finally:
+        for run in runs:
+            if os.path.exists(run):
+                os.remove(run)
+
+
+def _write_run(lines, temp_dir):
+    handle, path = tempfile.mkstemp(prefix="sort_run_", suffix=".tmp", dir=str(temp_dir))
+    with os.fdopen(handle, "w") as run:
+        run.writelines(lines)
+    return path
+
+
+# Merge sorted runs in one new run, removing them; equal lines keep run order
+def _merge_runs(runs, key, temp_dir, header=None):
+    handle, path = tempfile.mkstemp(prefix="sort_run_", suffix=".tmp", dir=str(temp_dir))
+    files = [open(run, "r") for run in runs]
+    try:
+        with os.fdopen(handle, "w") as merged:
+            if header is not None:
+                merged.write(header)
+            merged.writelines(heapq.merge(*files, key=key))
+    finally:
+        for run_file in files:
+            run_file.close()
+        for run in runs:
+            os.remove(run)
+    return path
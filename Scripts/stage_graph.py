@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+
+####################################################
+###           STAGE GRAPH FOR PIPELINE           ###
+###   EACH STAGE DECLARES WHAT IT READS, WRITES  ###
+###   AND WAITS FOR, READY STAGES RUN TOGETHER   ###
+####################################################
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import logging
+
+
+class Stage(object):
+    """
+    One step of AnnotaPipeline: a callable plus the files it reads and writes
+    and the names of the stages that must finish before it starts.
+    params and version (string or function returning it) are recorded in the
+    run manifest, changing them makes the stage run again.
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), requires=(), params=None, version=None):
+        self.name = name
+        self.run = run
+        self.inputs = [str(path) for path in inputs]
+        self.outputs = [str(path) for path in outputs]
+        self.requires = list(requires)
+        self.params = params
+        self.version = version
+
+    def tool_version(self):
+        if callable(self.version):
+            return self.version()
+        return self.version
+
+    def __repr__(self):
+        return f"Stage({self.name})"
+
+
+# Check if every dependency exists and there is no cycle in the graph
+def check_graph(stages):
+    names = [stage.name for stage in stages]
+    if len(names) != len(set(names)):
+        raise ValueError("Stage names must be unique")
+    known = set(names)
+    for stage in stages:
+        missing = [dep for dep in stage.requires if dep not in known]
+        if missing:
+            raise ValueError(f"Stage {stage.name} requires unknown stage(s): {', '.join(missing)}")
+    # Kahn's algorithm, whatever is left at the end is part of a cycle
+    requires = {stage.name: set(stage.requires) for stage in stages}
+    solved = set()
+    while True:
+        ready = [name for name, deps in requires.items() if name not in solved and deps <= solved]
+        if not ready:
+            break
+        solved.update(ready)
+    if len(solved) != len(requires):
+        cycle = sorted(known - solved)
+        raise ValueError(f"Stage graph has a cycle between: {', '.join(cycle)}")
+
+
+# Run one stage, unless manifest shows it is complete with the same inputs, params and version
+#   a stage returning False went on without its result (tolerated failure), it is not complete in manifest
+def run_stage(stage, manifest=None, logger=None):
+    if logger is None:
+        logger = logging.getLogger('AnnotaPipeline')
+    if manifest is None:
+        stage.run()
+        return
+    version = stage.tool_version()
+    if manifest.is_valid(stage.name, stage.inputs, stage.outputs, stage.params, version):
+        logger.info(f"Stage {stage.name} is complete in manifest and its files are unchanged. Skipping")
+        return
+    manifest.start(stage.name)
+    if stage.run() is False:
+        logger.warning(f"Stage {stage.name} has no valid result, it will run again in the next run")
+        return
+    manifest.complete(stage.name, stage.inputs, stage.outputs, stage.params, version)
+
+
+# Run all stages, launching every stage whose dependencies are done (up to workers at once)
+def run_stages(stages, workers=1, logger=None, manifest=None):
+    if logger is None:
+        logger = logging.getLogger('AnnotaPipeline')
+    check_graph(stages)
+    workers = max(1, int(workers))
+
+    # Keep declaration order, so with one worker stages run as they were written
+    pending = list(stages)
+    done = set()
+    running = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            # Only submit what can start now, nothing waits inside the executor queue
+            for stage in list(pending):
+                if len(running) >= workers:
+                    break
+                if all(dep in done for dep in stage.requires):
+                    logger.info(f"Stage {stage.name} has started")
+                    running[executor.submit(run_stage, stage, manifest, logger)] = stage
+                    pending.remove(stage)
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage = running.pop(future)
+                try:
+                    future.result()
+                except BaseException:
+                    logger.error(f"Stage {stage.name} failed, waiting for running stages before exiting")
+                    pending.clear()
+                    raise
+                logger.info(f"Stage {stage.name} is finished")
+                done.add(stage.name)
+    return done
@@ -3,6 +3,9 @@ import argparse
 import re
 import sys
 
+from Scripts.duplicates import load_members
+from Scripts.interpro_index import interpro_matches, interpro_proteins, open_index
+
 def cli():
         parser = argparse.ArgumentParser(
                 add_help=False,  # removes original [--help]
@@ -46,6 +49,19 @@ def cli():
                 required=True
         )
 
+        optionalNamed.add_argument(
+                '-ipr_index', dest='ipr_index',
+                metavar='[InterProScan_index.sqlite]', default=None,
+                help='InterProScan outputs indexed by interpro_index.py, without it gff3 files are read'
+        )
+
+        optionalNamed.add_argument(
+                '-dup', dest='duplicates',
+                metavar='[duplicates.tsv]', default=None,
+                help=('representative and member IDs of identical sequences (tab separated).'
+                        + ' InterProScan results of each representative are copied to its members')
+        )
+
         optionalNamed.add_argument(
                 '-tr', dest='tr',
                 metavar='[interproscan_Transcript_Quantification.tsv]',
@@ -70,72 +86,36 @@ def cli():
 
 
 
-def get_interpro_info(arq_entrada, superfamily_dict, ipr_dict, go_dict):
-        entrada = open(str(arq_entrada), "r").read().split("##FASTA")  # SPLITTING THE GFF3 FILE IN TWO CATEGORIES
-        interp = entrada[0].split("##sequence-region")  # WE'LL BE USING ONLY THE FIRST PART OF THE GFF3 OUTPUT FILE
-        del interp[0]
-
-        unwanted_db = ["Coils", "Gene3D", "MobiDBLite"]
-
-        def create_or_reset_lists():
-                ontologia = []
-                interpro = []
-                superfamily = []
-                return ontologia, interpro, superfamily
-
-        def add_to_dicts(id, go, ipr, superfamily, superfamily_dict, ipr_dict, go_dict):
-                # Remove duplicates from lists and add to dict
-                superfamily_dict[id] = ",".join(sorted(list(set(superfamily))))
-                ipr_dict[id] = ",".join(sorted(list(set(ipr))))
-                go_dict[id] = ",".join(sorted(go))
-
-        def add_none_to_empty():
-                if not ontologia:
-                        ontologia.append("None")
-                if not interpro:
-                        interpro.append("None")
-                if not superfamily:
-                        superfamily.append("None")
-
-        # TREATING EACH QUERY, RETRIEVING THE INFORMATION THAT WILL BE WRITTEN ON THE FIRST OUTPUT FILE
-        nome_subject=None
-        for seq_reg in interp:
-                ontologia, interpro, superfamily = create_or_reset_lists()
-                seq_reg = seq_reg.splitlines()
-                for linha in seq_reg:
-                        if linha == seq_reg[0]:
-                                linha = linha.split(" ")
-                                del linha[0]
-                        elif linha == seq_reg[1]:
-                                if linha == seq_reg[-1]:
-                                        add_none_to_empty()
-                                        add_to_dicts(nome_subject, ontologia, interpro, superfamily, superfamily_dict, ipr_dict, go_dict)
-                                        ontologia, interpro, superfamily = create_or_reset_lists()
-                                # IGNORING THE FIRST LINE ON EACH GROUP OF QUERIES, AS IT'S NON-INFORMATIVE
-                                pass
-                        else:
-                                linha = linha.split("\t")
-                                nome_subject = linha[0]
-                                db = linha[1]
-                                if not any(s in db for s in unwanted_db):
-                                        anotation = linha[-1].split(";")
-                                        for field in anotation:
-                                                if "Ontology" in field:
-                                                        go = field.replace('"', "").replace("Ontology_term=", "").split(",")
-                                                        for hit in go:
-                                                                if hit not in ontologia:
-                                                                        ontologia.append(hit)
-                                                if "Dbxref" in field:
-                                                        interpro.append(field.replace('"', "").replace("Dbxref=", ""))
-                                        if "SUPERFAMILY" in db:
-                                                superfamily_line = linha[-1].split(";")
-                                                for field in superfamily_line:
-                                                        if "Name" in field:
-                                                                superfamily.append(field.replace('"', "").replace("Name=", ""))
-                                if '\t'.join(linha) == seq_reg[-1]:
-                                        add_none_to_empty()
-                                        add_to_dicts(nome_subject, ontologia, interpro, superfamily, nome_subject, ontologia, interpro, superfamily, superfamily_dict, ipr_dict, go_dict)
-                                        ontologia, interpro, superfamily = create_or_reset_lists()
+def get_interpro_info(index, source, superfamily_dict, ipr_dict, go_dict):
+        # Proteins with region block, the ones without wanted matches get "None"
+        ontologia = {protein: [] for protein in interpro_proteins(index, source)}
+        interpro = {protein: [] for protein in ontologia}
+        superfamily = {protein: [] for protein in ontologia}
+
+        # Matches of Coils, Gene3D and MobiDBLite are not in index queries
+        for nome_subject, db, evalue, name, signature, dbxref, ontology in interpro_matches(index, source):
+                if ontology is not None:
+                        for hit in ontology.split(","):
+                                if hit not in ontologia.setdefault(nome_subject, []):
+                                        ontologia[nome_subject].append(hit)
+                if dbxref is not None:
+                        interpro.setdefault(nome_subject, []).append(dbxref)
+                if "SUPERFAMILY" in db and name is not None:
+                        superfamily.setdefault(nome_subject, []).append(name)
+
+        # Remove duplicates from lists and add to dict
+        for protein in ontologia:
+                superfamily_dict[protein] = ",".join(sorted(set(superfamily.get(protein, [])))) or "None"
+                ipr_dict[protein] = ",".join(sorted(set(interpro.get(protein, [])))) or "None"
+                go_dict[protein] = ",".join(sorted(ontologia[protein])) or "None"
+
+
+# InterProScan ran only with representatives of identical sequences, members get the same values
+def expand_members(members, *dicts):
+        for values in dicts:
+                for protein in list(values):
+                        for member in members.get(protein, []):
+                                values.setdefault(member, values[protein])
 
 
 def get_annotation(file, annotation_dict):
@@ -177,8 +157,11 @@ def main():
         unique_peptide = {}
         total_peptide = {}
         # Get interpro info
-        get_interpro_info(args.ipr_annot, superfamily_dict=superfamily_dict, ipr_dict=superfamily_dict, go_dict=superfamily_dict)
-        get_interpro_info(args.ipr_hyp, superfamily_dict=superfamily_dict, ipr_dict=superfamily_dict, go_dict=superfamily_dict)
+        index = open_index(args.ipr_index, {"annotated": args.ipr_annot, "hypothetical": args.ipr_hyp})
+        get_interpro_info(index, "annotated", superfamily_dict=superfamily_dict, ipr_dict=ipr_dict, go_dict=go_dict)
+        get_interpro_info(index, "hypothetical", superfamily_dict=superfamily_dict, ipr_dict=ipr_dict, go_dict=go_dict)
+        index.close()
+        expand_members(load_members(args.duplicates), superfamily_dict, ipr_dict, go_dict)
         get_annotation(args.annot, annotation_dict=annotation_dict)
         dictList = [annotation_dict, go_dict, ipr_dict, superfamily_dict]
         # Join optional analysis if needed
@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+
+####################################################
+###   BENCHMARK: anno_fasta.py AGAINST           ###
+###   getAnnoFasta.pl ON A SYNTHETIC AUGUSTUS    ###
+###   PREDICTION (TIME, PEAK MEMORY, OUTPUTS)    ###
+####################################################
+
+# Usage (from repository root):
+#   python benchmarks/anno_fasta_bench.py -dir /tmp/anno_bench -contigs 20 -length 5000000
+#   getAnnoFasta.pl is taken from PATH, or given with -getannofasta; without it only anno_fasta runs
+
+import argparse
+import pathlib
+import random
+import shutil
+import sys
+
+from bench_utils import compare, measure, report
+
+CODONS = [a + b + c for a in "ACGT" for b in "ACGT" for c in "ACGT" if a + b + c not in ("TAA", "TAG", "TGA")]
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        add_help=False,  # removes original [--help]
+        description='''Compare anno_fasta.py and getAnnoFasta.pl on a synthetic AUGUSTUS prediction''',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    optionalNamed = parser.add_argument_group('optional arguments')
+    optionalNamed.add_argument('-dir', dest='dir', default="anno_fasta_bench",
+                               help='directory for synthetic genome, gff and outputs (default: anno_fasta_bench)')
+    optionalNamed.add_argument('-contigs', dest='contigs', type=int, default=10,
+                               help='number of contigs (default: 10)')
+    optionalNamed.add_argument('-length', dest='length', type=int, default=1000000,
+                               help='length of each contig (default: 1000000)')
+    optionalNamed.add_argument('-getannofasta', dest='getannofasta', default=shutil.which("getAnnoFasta.pl"),
+                               help='getAnnoFasta.pl to compare with (default: found in PATH)')
+    optionalNamed.add_argument('-h', '-help', '--help', action='help', default=argparse.SUPPRESS,
+                               help='Show this help message and exit')
+    return parser
+
+
+# Genome of random contigs and AUGUSTUS gff with one two-exon gene every 3 kb, strands alternate
+def write_inputs(folder, contigs, length):
+    random.seed(1)
+    genes = 0
+    with open(str(folder / "genome.fasta"), "w") as genome, open(str(folder / "augustus.gff"), "w") as gff:
+        gff.write("# This output was generated with AUGUSTUS (version 3.4.0).\n")
+        for number in range(1, contigs + 1):
+            name = f"contig{number}"
+            sequence = [random.choice("ACGT") for _ in range(length)]
+            gff.write(f"# ----- prediction on sequence number {number} (length = {length}, name = {name}) -----\n")
+            gff.write("#\n")
+            gff.write(f"# Predicted genes for sequence number {number} on both strands\n")
+            for start in range(1001, length - 3000, 3000):
+                genes += 1
+                strand = "+" if genes % 2 else "-"
+                coding = "ATG" + "".join(random.choice(CODONS) for _ in range(198)) + "TAA"
+                if strand == "-":
+                    coding = coding.translate(COMPLEMENT)[::-1]
+                # Exons of 300 and 300 residues, intron of 200
+                exons = [(start, start + 299), (start + 500, start + 799)]
+                sequence[start - 1:start + 299] = coding[:300]
+                sequence[start + 499:start + 799] = coding[300:]
+                transcript = f'transcript_id "g{genes}.t1"; gene_id "g{genes}";'
+                gff.write(f"# start gene g{genes}\n")
+                gff.write(f"{name}\tAUGUSTUS\tgene\t{start}\t{start + 799}\t0.9\t{strand}\t.\tg{genes}\n")
+                gff.write(f"{name}\tAUGUSTUS\ttranscript\t{start}\t{start + 799}\t0.9\t{strand}\t.\tg{genes}.t1\n")
+                for exon_start, exon_end in exons:
+                    gff.write(f"{name}\tAUGUSTUS\tCDS\t{exon_start}\t{exon_end}\t0.9\t{strand}\t0\t{transcript}\n")
+                gff.write("# protein sequence = [M" + "A" * 39 + "\n# " + "K" * 80 + "\n# " + "L" * 79 + "]\n")
+                gff.write(f"# end gene g{genes}\n###\n")
+            genome.write(f">{name}\n")
+            sequence = "".join(sequence)
+            for position in range(0, length, 60):
+                genome.write(sequence[position:position + 60] + "\n")
+    return genes
+
+
+def main():
+    args = cli().parse_args()
+    folder = pathlib.Path(args.dir).resolve()
+    folder.mkdir(parents=True, exist_ok=True)
+    genes = write_inputs(folder, args.contigs, args.length)
+    print(f"{genes} genes on {args.contigs} contigs of {args.length} residues")
+
+    python_dir = folder / "anno_fasta"
+    python_dir.mkdir(exist_ok=True)
+    shutil.copy(str(folder / "augustus.gff"), str(python_dir / "augustus.gff"))
+    seconds, memory = measure([sys.executable, "-m", "Scripts.anno_fasta", "augustus.gff",
+                               f"--seqfile={folder / 'genome.fasta'}"], python_dir)
+    report("anno_fasta.py", seconds, memory)
+
+    if args.getannofasta is None:
+        print("getAnnoFasta.pl not found, give it with -getannofasta to compare")
+        return
+    perl_dir = folder / "getAnnoFasta"
+    perl_dir.mkdir(exist_ok=True)
+    shutil.copy(str(folder / "augustus.gff"), str(perl_dir / "augustus.gff"))
+    seconds, memory = measure([str(args.getannofasta), "augustus.gff", f"--seqfile={folder / 'genome.fasta'}"],
+                              perl_dir)
+    report("getAnnoFasta.pl", seconds, memory)
+    compare([f"augustus.{extension}" for extension in ("aa", "codingseq", "cdsexons")], python_dir, perl_dir)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+
+####################################################
+###   SHARED BY BENCHMARKS: TIME AND PEAK MEMORY ###
+###   OF A COMMAND, SCRIPTS OF ANOTHER REVISION  ###
+####################################################
+
+import filecmp
+import os
+import pathlib
+import subprocess
+import sys
+import time
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+
+
+# Run command in its own process from folder: (seconds, peak memory in MB)
+#   Scripts package is imported from pythonpath (this tree by default)
+def measure(command, folder, pythonpath=ROOT):
+    wrapper = ("import resource, subprocess, sys; "
+               "subprocess.run(sys.argv[1:], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL); "
+               "print(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)")
+    start = time.time()
+    result = subprocess.run([sys.executable, "-c", wrapper] + [str(part) for part in command], cwd=str(folder),
+                            check=True, stdout=subprocess.PIPE, universal_newlines=True,
+                            env=dict(os.environ, PYTHONPATH=str(pythonpath)))
+    return time.time() - start, int(result.stdout.split()[-1]) // 1024
+
+
+# Write Scripts package of git revision in folder, returns folder (to be given as pythonpath)
+def checkout(revision, folder):
+    folder = pathlib.Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    archive = subprocess.run(["git", "-C", str(ROOT), "archive", str(revision), "Scripts"],
+                             check=True, stdout=subprocess.PIPE)
+    subprocess.run(["tar", "-x", "-C", str(folder)], input=archive.stdout, check=True)
+    return folder
+
+
+def report(name, seconds, memory):
+    print(f"{name:<30} {seconds:8.1f} s {memory:8d} MB")
+
+
+# Compare files of the same name in two folders
+def compare(names, folder, other):
+    for name in names:
+        same = filecmp.cmp(str(pathlib.Path(folder) / name), str(pathlib.Path(other) / name), shallow=False)
+        print(f"{name}: {'identical' if same else 'DIFFERENT'}")
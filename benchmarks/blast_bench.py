@@ -0,0 +1,80 @@
+#!/usr/bin/python3
+
+####################################################
+###   BENCHMARK: python AND vector ENGINES OF    ###
+###   blastp_parser ON A SYNTHETIC NR OUTFMT6    ###
+###   (TIME, PEAK MEMORY, OUTPUTS)               ###
+####################################################
+
+# Usage (from repository root):
+#   python benchmarks/blast_bench.py -dir /tmp/blast_bench -queries 200000 -subjects 300000
+#   each query has 1 to 20 HSPs, fewer subjects means more repeated titles
+
+import argparse
+import pathlib
+import random
+import shutil
+import sys
+
+from bench_utils import compare, measure, report
+
+PRODUCTS = ("kinase", "protease", "transporter", "hypothetical protein", "uncharacterized protein",
+            "synthase", "reductase", "ligase")
+KEYWORDS = "hypothetical,uncharacterized,fragment,partial,unknown"
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        add_help=False,  # removes original [--help]
+        description='''Time and peak memory of both blastp_parser engines on a synthetic NR outfmt6''',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    optionalNamed = parser.add_argument_group('optional arguments')
+    optionalNamed.add_argument('-dir', dest='dir', default="blast_bench",
+                               help='directory for inputs and outputs (default: blast_bench)')
+    optionalNamed.add_argument('-queries', dest='queries', type=int, default=200000,
+                               help='number of queries (default: 200000)')
+    optionalNamed.add_argument('-subjects', dest='subjects', type=int, default=300000,
+                               help='number of distinct subjects (default: 300000)')
+    optionalNamed.add_argument('-h', '-help', '--help', action='help', default=argparse.SUPPRESS,
+                               help='Show this help message and exit')
+    return parser
+
+
+# outfmt6 with the columns of blastp_parser.blast(), returns number of HSPs
+def write_inputs(path, queries, subjects):
+    random.seed(3)
+    hsps = 0
+    with open(str(path), "w") as blast:
+        for query in range(queries):
+            for _ in range(random.randint(1, 20)):
+                hsps += 1
+                subject = random.randint(1, subjects)
+                title = f"XP_{subject}.1 {PRODUCTS[subject % len(PRODUCTS)]} {subject % 5000} [Organism {subject % 300}]"
+                blast.write(f"q{query}.t1\tXP_{subject}.1\tXP_{subject}.1\t{random.uniform(30, 900):.1f}\t"
+                            f"1e-{random.randint(3, 100)}\t{random.uniform(10, 100):.2f}\t{random.uniform(10, 100):.2f}\t"
+                            f"{random.randint(10, 100)}\t{title}\n")
+    return hsps
+
+
+def main():
+    args = cli().parse_args()
+    folder = pathlib.Path(args.dir).resolve()
+    folder.mkdir(parents=True, exist_ok=True)
+    hsps = write_inputs(folder / "nr.tsv", args.queries, args.subjects)
+    print(f"{args.queries} queries, {hsps} HSPs, {args.subjects} subjects")
+
+    outputs = [f"Bench_{name}.txt" for name in ("annotated_products", "hypothetical_products", "SpecifiedDB_annotations")]
+    for engine in ("python", "vector"):
+        shutil.rmtree(str(folder / engine), ignore_errors=True)
+        (folder / engine).mkdir()
+        code = ("from Scripts.blastp_parser import parser_blast; from Scripts.keywords import KeywordMatcher; "
+                f"parser_blast('Bench', {str(folder / 'nr.tsv')!r}, 40, 60, 30, 'nr', "
+                f"KeywordMatcher({KEYWORDS!r}.split(',')), '|', 5, {engine!r})")
+        seconds, memory = measure([sys.executable, "-c", code], folder / engine)
+        report(f"blastp_parser ({engine})", seconds, memory)
+    compare(outputs, folder / "python", folder / "vector")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,137 @@
+#!/usr/bin/python3
+
+####################################################
+###   BENCHMARK: fastatogff AND gfftofasta_parser###
+###   ON A SYNTHETIC GFF OF ANY SIZE (AUGUSTUS   ###
+###   OUTPUT OR GFF3), AGAINST ANOTHER REVISION  ###
+####################################################
+
+# Usage (from repository root):
+#   python benchmarks/gff_bench.py -dir /tmp/gff_bench -size 1000 -format augustus -rev <revision>
+#   -rev runs the scripts of that git revision too and compares the outputs
+
+import argparse
+import pathlib
+import random
+import shutil
+import sys
+
+from bench_utils import checkout, compare, measure, report
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        add_help=False,  # removes original [--help]
+        description='''Time and peak memory of fastatogff and gfftofasta_parser on a synthetic GFF''',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    optionalNamed = parser.add_argument_group('optional arguments')
+    optionalNamed.add_argument('-dir', dest='dir', default="gff_bench",
+                               help='directory for inputs and outputs (default: gff_bench)')
+    optionalNamed.add_argument('-size', dest='size', type=int, default=200,
+                               help='size of the GFF in MB (default: 200)')
+    optionalNamed.add_argument('-format', dest='format', choices=("augustus", "gff3"), default="augustus",
+                               help='AUGUSTUS output or gff3 (default: augustus)')
+    optionalNamed.add_argument('-rev', dest='rev', default=None,
+                               help='git revision to compare with (scripts and outputs)')
+    optionalNamed.add_argument('-h', '-help', '--help', action='help', default=argparse.SUPPRESS,
+                               help='Show this help message and exit')
+    return parser
+
+
+# AUGUSTUS gene with two CDS and its protein comments, one transcript
+def augustus_gene(number, contig, start):
+    transcript = f'transcript_id "g{number}.t1"; gene_id "g{number}";'
+    return (f"# start gene g{number}\n"
+            f"{contig}\tAUGUSTUS\tgene\t{start}\t{start + 1799}\t0.9\t+\t.\tg{number}\n"
+            f"{contig}\tAUGUSTUS\ttranscript\t{start}\t{start + 1799}\t0.9\t+\t.\tg{number}.t1\n"
+            f"{contig}\tAUGUSTUS\tstart_codon\t{start}\t{start + 2}\t.\t+\t0\t{transcript}\n"
+            f"{contig}\tAUGUSTUS\tCDS\t{start}\t{start + 899}\t0.9\t+\t0\t{transcript}\n"
+            f"{contig}\tAUGUSTUS\tintron\t{start + 900}\t{start + 1199}\t1\t+\t.\t{transcript}\n"
+            f"{contig}\tAUGUSTUS\tCDS\t{start + 1200}\t{start + 1799}\t0.9\t+\t0\t{transcript}\n"
+            f"{contig}\tAUGUSTUS\tstop_codon\t{start + 1797}\t{start + 1799}\t.\t+\t0\t{transcript}\n"
+            f"# coding sequence = [atg{'gca' * 25}]\n"
+            f"# protein sequence = [M{'A' * 59}\n# {'K' * 80}\n# {'L' * 80}\n# {'V' * 78}]\n"
+            f"# end gene g{number}\n"
+            "###\n")
+
+
+# gff3 gene with one mRNA, three exons and three CDS
+def gff3_gene(number, contig, start):
+    parent = f"rna{number}"
+    return (f"{contig}\tRefSeq\tgene\t{start}\t{start + 900}\t.\t+\t.\tID=gene{number};Name=G{number};gene_biotype=protein_coding\n"
+            f"{contig}\tRefSeq\tmRNA\t{start}\t{start + 900}\t.\t+\t.\tID={parent};Parent=gene{number};transcript_id=XM_{number}.1\n"
+            + "".join(f"{contig}\tRefSeq\texon\t{start + exon * 300}\t{start + exon * 300 + 200}\t.\t+\t.\t"
+                      f"ID=exon{number}-{exon};Parent={parent}\n" for exon in range(3))
+            + "".join(f"{contig}\tRefSeq\tCDS\t{start + exon * 300}\t{start + exon * 300 + 200}\t.\t+\t0\t"
+                      f"ID=cds{number};Parent={parent};protein_id=XP_{number}.1\n" for exon in range(3))
+            + "###\n")
+
+
+# Write gff, annotations (4 of each 5 transcripts) and proteins (all transcripts), returns number of genes
+def write_inputs(folder, size, gff_format):
+    random.seed(1)
+    header = "##gff-version 3\n" if gff_format == "gff3" else "# This output was generated with AUGUSTUS (version 3.4.0).\n"
+    written = len(header)
+    genes = 0
+    with open(str(folder / "input.gff"), "w") as gff, open(str(folder / "annotations.txt"), "w") as annotations, \
+            open(str(folder / "proteins.fasta"), "w") as proteins:
+        gff.write(header)
+        while written < size * 1000000:
+            genes += 1
+            contig = f"chr{genes // 20000 + 1}"
+            start = (genes % 20000) * 2000 + 1
+            if gff_format == "gff3":
+                block = gff3_gene(genes, contig, start)
+                transcript = f"rna{genes}"
+            else:
+                if genes % 20000 == 1:
+                    gff.write(f"# ----- prediction on sequence number {genes // 20000 + 1} (length = 40000000, "
+                              f"name = {contig}) -----\n#\n# Predicted genes for sequence number "
+                              f"{genes // 20000 + 1} on both strands\n")
+                block = augustus_gene(genes, contig, start)
+                transcript = f"g{genes}.t1"
+            gff.write(block)
+            written += len(block)
+            if genes % 5:
+                annotations.write(f"{transcript}\tprotein {genes} (InterPro:IPR{genes % 9:06d})\n")
+            proteins.write(f">{transcript}\nM{''.join(random.choice('ACDEFGHIKLMNPQRSTVWY') for _ in range(59))}\n")
+    return genes
+
+
+# Command lines of both scripts, run from an output folder
+def commands(folder):
+    return [
+        ("fastatogff", [sys.executable, "-m", "Scripts.fastatogff", "-all", folder / "annotations.txt",
+                        "-gff", folder / "input.gff", "-b", "Bench"],
+         ["Bench_Annotated_GFF.gff"]),
+        ("gfftofasta_parser", [sys.executable, "-m", "Scripts.gfftofasta_parser", "-gff", folder / "input.gff",
+                               "-annot", folder / "annotations.txt", "-b", "Bench", "-faf", folder / "proteins.fasta",
+                               "-org", "Homo sapiens"],
+         ["AnnotaPipeline_Bench_proteins.fasta", "Bench_ids_with_no_annotations.txt"]),
+    ]
+
+
+def main():
+    args = cli().parse_args()
+    folder = pathlib.Path(args.dir).resolve()
+    folder.mkdir(parents=True, exist_ok=True)
+    genes = write_inputs(folder, args.size, args.format)
+    print(f"{args.format} gff of {args.size} MB, {genes} genes")
+
+    runs = [("current", folder / "current", None)]
+    if args.rev is not None:
+        runs.append((args.rev, folder / "revision", checkout(args.rev, folder / "revision_tree")))
+    for name, script, outputs in commands(folder):
+        for label, output_dir, pythonpath in runs:
+            shutil.rmtree(str(output_dir / name), ignore_errors=True)
+            (output_dir / name).mkdir(parents=True)
+            seconds, memory = (measure(script, output_dir / name, pythonpath) if pythonpath
+                               else measure(script, output_dir / name))
+            report(f"{name} ({label})", seconds, memory)
+        if args.rev is not None:
+            compare(outputs, folder / "current" / name, folder / "revision" / name)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
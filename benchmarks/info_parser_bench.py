@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+
+####################################################
+###   BENCHMARK: info_parser ON SYNTHETIC        ###
+###   INTERPROSCAN OUTPUTS AND BLAST PRODUCTS,   ###
+###   AGAINST ANOTHER REVISION                   ###
+####################################################
+
+# Usage (from repository root):
+#   python benchmarks/info_parser_bench.py -dir /tmp/info_bench -proteins 100000 -rev <revision>
+#   half of the proteins are annotated, a quarter hypothetical and a quarter without hit
+
+import argparse
+import pathlib
+import random
+import shutil
+import sys
+
+from bench_utils import checkout, compare, measure, report
+
+DATABASES = ("Pfam", "SUPERFAMILY", "Coils", "Gene3D", "MobiDBLite", "PANTHER", "CDD", "ProSiteProfiles", "SMART")
+
+
+def cli():
+    parser = argparse.ArgumentParser(
+        add_help=False,  # removes original [--help]
+        description='''Time and peak memory of info_parser on synthetic InterProScan GFF3 outputs''',
+        formatter_class=argparse.RawTextHelpFormatter
+    )
+    optionalNamed = parser.add_argument_group('optional arguments')
+    optionalNamed.add_argument('-dir', dest='dir', default="info_bench",
+                               help='directory for inputs and outputs (default: info_bench)')
+    optionalNamed.add_argument('-proteins', dest='proteins', type=int, default=100000,
+                               help='number of proteins (default: 100000)')
+    optionalNamed.add_argument('-rev', dest='rev', default=None,
+                               help='git revision to compare with (scripts and outputs)')
+    optionalNamed.add_argument('-h', '-help', '--help', action='help', default=argparse.SUPPRESS,
+                               help='Show this help message and exit')
+    return parser
+
+
+# InterProScan GFF3 of proteins, about 70% of them with up to 5 matches
+def write_interpro(path, proteins):
+    with open(str(path), "w") as gff3:
+        gff3.write("##gff-version 3\n##interproscan-version 5.60-92.0\n")
+        fasta = []
+        for number, protein in enumerate(proteins):
+            if random.random() < 0.3:
+                continue
+            length = random.randint(50, 500)
+            gff3.write(f"##sequence-region {protein} 1 {length}\n")
+            gff3.write(f"{protein}\t.\tpolypeptide\t1\t{length}\t.\t+\t.\tmd5=md5{number};ID={protein}\n")
+            for match in range(random.randint(0, 5)):
+                database = random.choice(DATABASES)
+                name = f"SSF{random.randint(1, 9999)}" if database == "SUPERFAMILY" else f"PF{random.randint(1, 99)}"
+                attributes = [f"Name={name}"]
+                if random.random() < 0.7:
+                    attributes.append(f"signature_desc=Some domain {match}")
+                attributes += [f"Target={protein} 1 30", "status=T", f"ID=match${number}_{match}"]
+                if random.random() < 0.5:
+                    attributes.append('Dbxref="InterPro:IPR%06d"' % random.randint(1, 30000))
+                if random.random() < 0.4:
+                    attributes.append('Ontology_term="GO:%07d","GO:%07d"'
+                                      % (random.randint(1, 99999), random.randint(1, 99999)))
+                attributes.append("date=01-01-2023")
+                evalue = random.choice(["1.2E-10", "3.5E-5", "-", "0.001"])
+                gff3.write(f"{protein}\t{database}\tprotein_match\t1\t30\t{evalue}\t+\t.\t{';'.join(attributes)}\n")
+            fasta.append(f">{protein}\nMKV\n")
+        gff3.write("##FASTA\n" + "".join(fasta))
+
+
+# InterProScan outputs and BLAST product lists of proteins
+def write_inputs(folder, proteins):
+    random.seed(5)
+    annotated = [f"a{number}.t1" for number in range(proteins // 2)]
+    hypothetical = [f"h{number}.t1" for number in range(proteins - proteins // 2)]
+    write_interpro(folder / "annotated.gff3", annotated)
+    write_interpro(folder / "hypothetical.gff3", hypothetical)
+    with open(str(folder / "annotated.txt"), "w") as products:
+        for protein in annotated:
+            products.write(f"{protein}\tkinase {protein}\n")
+    middle = len(hypothetical) // 2
+    with open(str(folder / "hypothetical.txt"), "w") as products:
+        products.write("".join(f"{protein}\n" for protein in hypothetical[:middle]))
+    with open(str(folder / "no_hit.txt"), "w") as products:
+        products.write("".join(f"{protein}\n" for protein in hypothetical[middle:]))
+
+
+def main():
+    args = cli().parse_args()
+    folder = pathlib.Path(args.dir).resolve()
+    folder.mkdir(parents=True, exist_ok=True)
+    write_inputs(folder, args.proteins)
+    print(f"{args.proteins} proteins")
+
+    command = [sys.executable, "-m", "Scripts.info_parser", "-ipr1", folder / "annotated.gff3",
+               "-ipr2", folder / "hypothetical.gff3", "-a", folder / "annotated.txt",
+               "-hy", folder / "hypothetical.txt", "-nh", folder / "no_hit.txt"]
+    runs = [("current", folder / "current", None)]
+    if args.rev is not None:
+        runs.append((args.rev, folder / "revision", checkout(args.rev, folder / "revision_tree")))
+    for label, output_dir, pythonpath in runs:
+        shutil.rmtree(str(output_dir), ignore_errors=True)
+        output_dir.mkdir(parents=True)
+        seconds, memory = measure(command, output_dir, pythonpath) if pythonpath else measure(command, output_dir)
+        report(f"info_parser ({label})", seconds, memory)
+    if args.rev is not None:
+        compare(["All_annotation_products.txt"], folder / "current", folder / "revision")
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,41 @@
+import pathlib
+import shutil
+
+from Scripts.anno_fasta import anno_fasta
+
+# AUGUSTUS output with a gene on each strand (two CDS exons each, protein in more than one comment line)
+#   and the .aa/.codingseq files getAnnoFasta.pl writes for it
+DATA = pathlib.Path(__file__).parent / "data"
+
+
+def test_same_files_as_getannofasta(tmp_path):
+    gff = tmp_path / "augustus.gff"
+    shutil.copy(str(DATA / "augustus.gff"), str(gff))
+    assert anno_fasta(gff, DATA / "genome.fasta") == 2
+    for extension in ("aa", "codingseq"):
+        assert (tmp_path / f"augustus.{extension}").read_text() == (DATA / f"augustus.{extension}").read_text()
+
+
+def test_proteins_without_genome(tmp_path):
+    gff = tmp_path / "augustus.gff"
+    shutil.copy(str(DATA / "augustus.gff"), str(gff))
+    assert anno_fasta(gff) == 2
+    assert (tmp_path / "augustus.aa").read_text() == (DATA / "augustus.aa").read_text()
+    assert not (tmp_path / "augustus.codingseq").exists()
+
+
+def test_cds_exons_in_transcript_order(tmp_path):
+    gff = tmp_path / "augustus.gff"
+    shutil.copy(str(DATA / "augustus.gff"), str(gff))
+    anno_fasta(gff, DATA / "genome.fasta")
+    exons = (tmp_path / "augustus.cdsexons").read_text().split(">")[1:]
+    assert [exon.split("\n", 1)[0] for exon in exons] == ["g1.t1.cds1", "g1.t1.cds2", "g2.t1.cds1", "g2.t1.cds2"]
+    coding = {}
+    for record in (DATA / "augustus.codingseq").read_text().split(">")[1:]:
+        name, sequence = record.split("\n", 1)
+        coding[name] = sequence.replace("\n", "")
+    joined = {}
+    for exon in exons:
+        name, sequence = exon.split("\n", 1)
+        joined[name.rsplit(".", 1)[0]] = joined.get(name.rsplit(".", 1)[0], "") + sequence.replace("\n", "")
+    assert joined == coding
@@ -0,0 +1,62 @@
+from Scripts.augustus_chunks import Chunk, merge_chunks, plan_chunks
+
+
+# AUGUSTUS output of one window with genes given as (id, start, end, strand)
+def write_window(chunk, genes):
+    with open(str(chunk.gff), "w") as gff:
+        gff.write("# This output was generated with AUGUSTUS (version 3.4.0).\n")
+        gff.write("# ----- prediction on sequence number 1 (length = 250, name = chr1) -----\n")
+        gff.write("#\n")
+        gff.write("# Predicted genes for sequence number 1 on both strands\n")
+        for gene_id, start, end, strand in genes:
+            gff.write(f"# start gene {gene_id}\n")
+            gff.write(f"chr1\tAUGUSTUS\tgene\t{start}\t{end}\t0.5\t{strand}\t.\t{gene_id}\n")
+            gff.write(f"chr1\tAUGUSTUS\ttranscript\t{start}\t{end}\t0.5\t{strand}\t.\t{gene_id}.t1\n")
+            gff.write(f"# end gene {gene_id}\n")
+            gff.write("###\n")
+
+
+# Windows of 100 residues overlapping by 30 over a contig of 250: 1-100, 71-170, 141-240, 211-250
+def windows(tmp_path):
+    genome = tmp_path / "genome.fa"
+    genome.write_text(">chr1\n" + "ACGT" * 62 + "AC\n")
+    chunks, contigs = plan_chunks(genome, tmp_path / "chunks", 100, 30)
+    assert [(chunk.start, chunk.end) for chunk in chunks] == [(1, 100), (71, 170), (141, 240), (211, 250)]
+    return chunks, contigs
+
+
+def merged_genes(output):
+    return [tuple(line.split("\t")[i] for i in (3, 4, 8)) for line in open(str(output))
+            if "\tgene\t" in line]
+
+
+def test_gene_straddling_window_boundary_is_kept_once(tmp_path):
+    chunks, contigs = windows(tmp_path)
+    # Gene 90-120 crosses the end of the first window: it is cut there, the second window has it whole
+    write_window(chunks[0], [("g1", 10, 40, "+"), ("g2", 90, 100, "+")])
+    write_window(chunks[1], [("g1", 90, 120, "+")])
+    write_window(chunks[2], [])
+    write_window(chunks[3], [])
+    assert merge_chunks(chunks, contigs, tmp_path / "merged.gff") == 2
+    assert merged_genes(tmp_path / "merged.gff") == [("10", "40", "g1\n"), ("90", "120", "g2\n")]
+
+
+def test_gene_in_overlap_loses_to_kept_gene_of_adjacent_window(tmp_path):
+    chunks, contigs = windows(tmp_path)
+    # Second window keeps 101-135 (outside every overlap), first window gives the same locus as 60-115
+    write_window(chunks[0], [("g1", 60, 115, "+")])
+    write_window(chunks[1], [("g1", 101, 135, "+")])
+    write_window(chunks[2], [])
+    write_window(chunks[3], [])
+    assert merge_chunks(chunks, contigs, tmp_path / "merged.gff") == 1
+    assert merged_genes(tmp_path / "merged.gff") == [("101", "135", "g1\n")]
+
+
+def test_small_contigs_are_grouped(tmp_path):
+    genome = tmp_path / "genome.fa"
+    genome.write_text(">a\nACGT\n>b\nACGTACGT\n>c\nACGTACGTACGT\n")
+    chunks, contigs = plan_chunks(genome, tmp_path / "chunks", 12, 2)
+    assert [chunk.contigs for chunk in chunks] == [["a", "b"], ["c"]]
+    assert all(chunk.start is None for chunk in chunks)
+    assert contigs == [("a", 4), ("b", 8), ("c", 12)]
+    assert isinstance(chunks[0], Chunk)
@@ -0,0 +1,37 @@
+from Scripts.blastp_parser import parser_blast
+from Scripts.keywords import KeywordMatcher
+
+# outfmt6 of blastp_parser.blast(): q1 annotated (best bitscore wins), q2 only a keyword hit,
+#   q3 below thresholds, q4 two hits of the same subject
+BLAST = (
+    "q1\tXP_1.1\tXP_1.1\t50.0\t1e-10\t80.0\t70.0\t90\tXP_1.1 kinase 1 [Homo sapiens]\n"
+    "q1\tXP_2.1\tXP_2.1\t90.5\t1e-20\t85.0\t75.0\t95\tXP_2.1 ligase [Homo sapiens]\n"
+    "q2\tXP_3.1\tXP_3.1\t70.0\t1e-15\t90.0\t90.0\t99\tXP_3.1 hypothetical protein [Mus musculus]\n"
+    "q3\tXP_1.1\tXP_1.1\t60.0\t1e-12\t30.0\t20.0\t90\tXP_1.1 kinase 1 [Homo sapiens]\n"
+    "q4\tXP_1.1\tXP_1.1\t60.0\t1e-12\t80.0\t70.0\t90\tXP_1.1 kinase 1 [Homo sapiens]\n"
+    "q4\tXP_1.1\tXP_1.1\t60.0\t1e-12\t80.0\t70.0\t90\tXP_1.1 kinase 1 [Homo sapiens]\n"
+)
+
+OUTPUTS = ("annotated_products", "hypothetical_products", "SpecifiedDB_annotations")
+
+
+def run_engine(tmp_path, engine, blast, identity=40):
+    result = tmp_path / "nr.tsv"
+    result.write_text(blast)
+    parser_blast(str(tmp_path / engine), result, identity, 60, 30, "nr",
+                 KeywordMatcher(["hypothetical", "uncharacterized"]), "|", 5, engine)
+    return [(tmp_path / f"{engine}_{name}.txt").read_text() for name in OUTPUTS]
+
+
+def test_engines_agree(tmp_path):
+    python = run_engine(tmp_path, "python", BLAST)
+    assert python == run_engine(tmp_path, "vector", BLAST)
+    assert python[0] == "q1\tligase\nq4\tkinase 1\n"
+    assert python[1] == "q2\nq3\n"
+
+
+# No HSP passes the thresholds, all queries are hypothetical
+def test_engines_agree_without_hits(tmp_path):
+    python = run_engine(tmp_path, "python", BLAST, identity=100)
+    assert python == run_engine(tmp_path, "vector", BLAST, identity=100)
+    assert python == ["", "q1\nq2\nq3\nq4\n", ""]
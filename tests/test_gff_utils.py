@@ -0,0 +1,99 @@
+import tracemalloc
+
+from Scripts.gff_utils import annotate_gff, feature_id, transcript_index
+
+AUGUSTUS = (
+    "# This output was generated with AUGUSTUS (version 3.4.0).\n"
+    "# start gene g1\n"
+    "chr1\tAUGUSTUS\tgene\t10\t90\t0.9\t+\t.\tg1\n"
+    "chr1\tAUGUSTUS\ttranscript\t10\t90\t0.9\t+\t.\tg1.t1\n"
+    "chr1\tAUGUSTUS\tCDS\t10\t90\t0.9\t+\t0\ttranscript_id \"g1.t1\"; gene_id \"g1\";\n"
+    "# protein sequence = [MK]\n"
+    "# end gene g1\n"
+    "###\n"
+    "# start gene g2\n"
+    "chr2\tAUGUSTUS\tgene\t5\t50\t0.9\t-\t.\tg2\n"
+    "chr2\tAUGUSTUS\ttranscript\t5\t50\t0.9\t-\t.\tg2.t1\n"
+    "# end gene g2\n"
+    "###\n"
+)
+
+GFF3 = (
+    "##gff-version 3\n"
+    "chr1\tRefSeq\tgene\t1\t900\t.\t+\t.\tID=gene1\n"
+    "chr1\tRefSeq\tmRNA\t1\t900\t.\t+\t.\tID=rna1;Parent=gene1;product=old\n"
+    "chr1\tRefSeq\tCDS\t1\t900\t.\t+\t0\tID=cds1;Parent=rna1\n"
+    "chr1\tRefSeq\tgene\t1000\t1900\t.\t-\t.\tID=gene2\n"
+    "chr1\tRefSeq\tmRNA\t1000\t1900\t.\t-\t.\tID=rna2;Parent=gene2\n"
+    "chr1\tRefSeq\tregion\t1\t5000\t.\t+\t.\tID=chr1\n"
+    "##FASTA\n"
+    ">chr1\n"
+    "ACGT\n"
+)
+
+
+def test_feature_id():
+    assert feature_id("g1.t1") == "g1.t1"
+    assert feature_id(' transcript_id "g1.t1"; gene_id "g1";') == 'transcript_id "g1.t1"'
+    assert feature_id("ID=rna1;Parent=gene1") == "rna1"
+    assert feature_id("Parent=gene1") is None
+
+
+def test_transcript_index(tmp_path):
+    gff = tmp_path / "augustus.gff"
+    gff.write_text(AUGUSTUS)
+    index = transcript_index(gff)
+    assert index == {"g1.t1": ("chr1", 10, 90, "+", AUGUSTUS.index("chr1\tAUGUSTUS\ttranscript")),
+                     "g2.t1": ("chr2", 5, 50, "-", AUGUSTUS.index("chr2\tAUGUSTUS\ttranscript"))}
+    assert list(transcript_index(gff, {"g2.t1": "kinase\n"})) == ["g2.t1"]
+    gff3 = tmp_path / "annotation.gff3"
+    gff3.write_text(GFF3)
+    assert sorted(transcript_index(gff3)) == ["rna1", "rna2"]
+
+
+def test_annotate_augustus(tmp_path):
+    gff = tmp_path / "augustus.gff"
+    gff.write_text(AUGUSTUS)
+    index = annotate_gff(gff, {"g1.t1": "kinase\n"}, tmp_path / "annotated.gff", index={})
+    assert index == transcript_index(gff)
+    annotated = (tmp_path / "annotated.gff").read_text()
+    # Transcript id is replaced by its annotation, gene without annotated transcript is left out
+    assert "chr1\tAUGUSTUS\ttranscript\t10\t90\t0.9\t+\t.\tkinase\n" in annotated
+    assert "g2" not in annotated
+    assert annotated.startswith("# This output was generated with AUGUSTUS")
+
+
+def test_annotate_gff3(tmp_path):
+    gff = tmp_path / "annotation.gff3"
+    gff.write_text(GFF3)
+    annotate_gff(gff, {"rna2": "kinase; ATP=binding\n"}, tmp_path / "annotated.gff3")
+    annotated = (tmp_path / "annotated.gff3").read_text().splitlines()
+    assert annotated == [
+        "##gff-version 3",
+        "chr1\tRefSeq\tgene\t1000\t1900\t.\t-\t.\tID=gene2",
+        "chr1\tRefSeq\tmRNA\t1000\t1900\t.\t-\t.\tID=rna2;Parent=gene2;product=kinase%3B ATP%3Dbinding",
+        "chr1\tRefSeq\tregion\t1\t5000\t.\t+\t.\tID=chr1",
+        "##FASTA",
+        ">chr1",
+        "ACGT",
+    ]
+
+
+# Memory used by annotate_gff does not follow gff size, only one gene is kept at a time
+def test_annotate_memory_is_bounded(tmp_path):
+    gff = tmp_path / "big.gff"
+    genes = AUGUSTUS.split("# start gene ", 1)[1]
+    with open(str(gff), "w") as big:
+        big.write("# This output was generated with AUGUSTUS (version 3.4.0).\n")
+        for number in range(5000):
+            big.write("# start gene " + genes.replace("g1", f"a{number}").replace("g2", f"b{number}"))
+    size = gff.stat().st_size
+    assert size > 1000000
+
+    tracemalloc.start()
+    try:
+        annotate_gff(gff, {"a1.t1": "kinase\n"}, tmp_path / "annotated.gff")
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert peak < size / 20